@@ -14,6 +14,7 @@ from pathlib import Path
 from dotenv import load_dotenv
 import pymysql
 from datetime import timedelta
+from django.core.exceptions import ImproperlyConfigured
 pymysql.install_as_MySQLdb()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -62,7 +63,7 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'app.tokens.StatelessJWTAuthentication',
     ),
 }
 
@@ -101,6 +102,17 @@ DATABASES = {
     }
 }
 
+# Cache
+# Point CACHE_BACKEND/CACHE_LOCATION at Redis or Memcached in production so
+# surge counters and other shared state are visible to every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'safarikonnect'),
+    }
+}
+
 EMAIL_HOST = os.getenv('EMAIL_HOST')
 EMAIL_PORT = os.getenv('EMAIL_PORT')
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
@@ -128,6 +140,23 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing
+# New passwords use PASSWORD_HASHER (pbkdf2, scrypt or argon2); hashes made by
+# the others still verify and are upgraded on the user's next login.
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'pbkdf2')
+PASSWORD_HASHER_CHOICES = {
+    'pbkdf2': 'app.hashers.TunedPBKDF2PasswordHasher',
+    'scrypt': 'app.hashers.TunedScryptPasswordHasher',
+    'argon2': 'app.hashers.TunedArgon2PasswordHasher',
+}
+if PASSWORD_HASHER not in PASSWORD_HASHER_CHOICES:
+    raise ImproperlyConfigured(
+        f"Unknown PASSWORD_HASHER {PASSWORD_HASHER!r}; choose one of {', '.join(PASSWORD_HASHER_CHOICES)}"
+    )
+PASSWORD_HASHERS = [PASSWORD_HASHER_CHOICES[PASSWORD_HASHER]] + [
+    path for name, path in PASSWORD_HASHER_CHOICES.items() if name != PASSWORD_HASHER
+]
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
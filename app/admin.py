@@ -1,16 +1,23 @@
 from django.contrib import admin
 from .models import (
     User, VehicleColor, VehicleMake, VehicleType, VehicleModel,
-    Profile, Business, Parcel, Bid, ChatMessage, Company,
+    Profile, Business, Parcel, Bid, ChatMessage, Conversation, Company,
     CompanyUser, DeliveryStatus, DriverAvailability, DriverRating,
-    Feedback, Geofence, Notification, OTP, PaymentTransaction,
-    Ticket, TicketCategory, Wallet, Transaction, TransactionalWallet, Ride
+    Feedback, Geofence, Notification, OTP, PaymentTransaction, PayoutDestination, CardAuthorization,
+    Ticket, TicketCategory, Wallet, WalletStatement, Transaction, TransactionalWallet, Ride
 )
+from .tokens import TokenModule
 # Register your models here.
 class UserAdmin(admin.ModelAdmin):
     list_display = ('username', 'email', 'name', 'is_active', 'is_staff')
     search_fields = ('username', 'email', 'name')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and {'role', 'is_active'} & set(form.changed_data):
+            # Tokens already issued carry the old role and active flag
+            TokenModule.bump_version(obj.pk)
+
 admin.site.register(User, UserAdmin)
 admin.site.register(VehicleColor)
 admin.site.register(VehicleMake)
@@ -21,6 +28,7 @@ admin.site.register(Business)
 admin.site.register(Parcel)
 admin.site.register(Bid)
 admin.site.register(ChatMessage)
+admin.site.register(Conversation)
 admin.site.register(Company)
 admin.site.register(CompanyUser)
 admin.site.register(DeliveryStatus)
@@ -31,9 +39,12 @@ admin.site.register(Geofence)
 admin.site.register(Notification)
 admin.site.register(OTP)
 admin.site.register(PaymentTransaction)
+admin.site.register(PayoutDestination)
+admin.site.register(CardAuthorization)
 admin.site.register(Ticket)
 admin.site.register(TicketCategory)
 admin.site.register(Wallet)
+admin.site.register(WalletStatement)
 admin.site.register(Transaction)
 admin.site.register(TransactionalWallet)
 admin.site.register(Ride)
\ No newline at end of file
@@ -0,0 +1,54 @@
+import os
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from .catalog import vehicle_catalog
+from .models import Profile
+
+User = get_user_model()
+
+
+class LoginModule:
+    """
+    Password login: one query for the user and profile, one password check
+    (rehashed with the preferred hasher when outdated) and a ``last_login``
+    write at most once per LAST_LOGIN_RESOLUTION.
+    """
+
+    LAST_LOGIN_RESOLUTION = int(os.getenv('LAST_LOGIN_RESOLUTION_SECONDS', '900'))
+
+    @staticmethod
+    def find_user(email_or_phone):
+        field = 'email' if '@' in email_or_phone else 'phone_number'
+        try:
+            return User.objects.select_related('profile').get(**{field: email_or_phone})
+        except User.DoesNotExist:
+            return None
+
+    @classmethod
+    def authenticate(cls, email_or_phone, password):
+        user = cls.find_user(email_or_phone)
+        if user is None:
+            # Hash anyway so unknown accounts take as long as wrong passwords
+            User().set_password(password)
+            return None
+        return user if user.check_password(password) else None
+
+    @classmethod
+    def record_login(cls, user, now=None):
+        """Store ``last_login`` unless the stored value is recent enough."""
+        now = now or timezone.now()
+        if user.last_login and now - user.last_login < timedelta(seconds=cls.LAST_LOGIN_RESOLUTION):
+            return False
+        User.objects.filter(pk=user.pk).update(last_login=now)
+        user.last_login = now
+        return True
+
+    @staticmethod
+    def prepare_response_user(user):
+        """Fill the profile's vehicle relations from the catalog before serializing."""
+        try:
+            vehicle_catalog.attach(user.profile)
+        except Profile.DoesNotExist:
+            pass
+        return user
@@ -0,0 +1,208 @@
+import os
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+import requests
+from .models import CardAuthorization, PaymentTransaction
+from .notifications import NotificationModule
+from .payment import PaymentProcessingModule
+from .statements import StatementModule
+from .wallets import WalletModule
+
+
+class CardChargeError(Exception):
+    pass
+
+
+class CardAuthorizationModule:
+    """
+    Reusable card authorizations captured from successful Paystack payments,
+    so rides can be charged server to server without the redirect flow.
+
+    Each user's newest usable card is kept in the cache as a small dict
+    (the hot copy); users without one are cached as ``{}`` so looking them
+    up costs no query either. A successful charge credits the wallet like a
+    top-up, which the ride settlement then debits.
+    """
+
+    DEFAULT_KEY = 'cards:default:{}'
+    CACHE_TTL = int(os.getenv('CARD_CACHE_TTL', '3600'))
+    CHARGE_ON_COMPLETE = os.getenv('RIDE_CARD_CHARGE_ON_COMPLETE', 'true').lower() == 'true'
+    RIDE_CHARGE = 'RIDE_CHARGE'
+    HOT_FIELDS = ('id', 'authorization_code', 'email', 'last4', 'brand', 'exp_month', 'exp_year')
+    PENDING_STATES = ('pending', 'processing', 'ongoing', 'send_otp')
+
+    @classmethod
+    def _hot_copy(cls, card):
+        return {field: getattr(card, field) for field in cls.HOT_FIELDS}
+
+    @staticmethod
+    def _not_expired(now=None):
+        now = now or timezone.now()
+        return Q(exp_year__gt=now.year) | Q(exp_year=now.year, exp_month__gte=now.month)
+
+    @staticmethod
+    def _expired(card, now=None):
+        now = now or timezone.now()
+        return (card['exp_year'], card['exp_month']) < (now.year, now.month)
+
+    @classmethod
+    def capture(cls, user_id, payment_data):
+        """Store the authorization of a successful card payment if Paystack marks it reusable."""
+        authorization = (payment_data or {}).get('authorization') or {}
+        code = authorization.get('authorization_code')
+        if not code or not authorization.get('reusable') or authorization.get('channel') != 'card':
+            return None
+        try:
+            exp_month, exp_year = int(authorization.get('exp_month')), int(authorization.get('exp_year'))
+        except (TypeError, ValueError):
+            return None
+
+        card, _ = CardAuthorization.objects.update_or_create(
+            user_id=user_id,
+            signature=authorization.get('signature') or code,
+            defaults={
+                'authorization_code': code,
+                'email': ((payment_data.get('customer') or {}).get('email') or '')[:100],
+                'last4': str(authorization.get('last4') or '')[:4],
+                'exp_month': exp_month,
+                'exp_year': exp_year,
+                'brand': authorization.get('brand'),
+                'bank': authorization.get('bank'),
+                'is_active': True,
+            },
+        )
+        hot = cls._hot_copy(card)
+        transaction.on_commit(lambda: cache.set(cls.DEFAULT_KEY.format(user_id), hot, cls.CACHE_TTL))
+        return card
+
+    @classmethod
+    def cards_for(cls, user):
+        return CardAuthorization.objects.filter(user=user, is_active=True).order_by('-updated_at')
+
+    @classmethod
+    def default_for(cls, user_id):
+        """The hot copy of the user's newest usable card, or None."""
+        key = cls.DEFAULT_KEY.format(user_id)
+        hot = cache.get(key)
+        if hot is None:
+            card = (
+                CardAuthorization.objects.filter(cls._not_expired(), user_id=user_id, is_active=True)
+                .order_by('-updated_at')
+                .first()
+            )
+            hot = cls._hot_copy(card) if card else {}
+            cache.set(key, hot, cls.CACHE_TTL)
+        if not hot or cls._expired(hot):
+            return None
+        return hot
+
+    @classmethod
+    def deactivate(cls, user_id, card_id):
+        CardAuthorization.objects.filter(pk=card_id, user_id=user_id).update(is_active=False, updated_at=timezone.now())
+        key = cls.DEFAULT_KEY.format(user_id)
+        transaction.on_commit(lambda: cache.delete(key))
+
+    @classmethod
+    def charge_ride(cls, ride):
+        """
+        Charge the ride fare to the customer's saved card in one request.
+        Returns the PaymentTransaction, or None when there is no usable card.
+        Paystack may answer ``pending``, or the request may fail in transit;
+        the charge then stays PENDING until the charge.success webhook or a
+        later verification settles it.
+        """
+        card = cls.default_for(ride.customer_id)
+        if card is None or ride.fare <= 0:
+            return None
+
+        attempts = PaymentTransaction.objects.filter(ride=ride, transaction_type=cls.RIDE_CHARGE)
+        pending = attempts.filter(status='PENDING').first()
+        if pending:
+            cls.resolve_pending(pending)
+        if attempts.filter(status='SUCCESS').exists():
+            raise CardChargeError("This ride has already been paid")
+        if attempts.filter(status='PENDING').exists():
+            raise CardChargeError("A charge for this ride is still being processed")
+        reference = f'ride-{ride.id}-{attempts.count() + 1}'
+        try:
+            with transaction.atomic():
+                payment = PaymentTransaction.objects.create(
+                    user_id=ride.customer_id,
+                    amount=ride.fare,
+                    transaction_type=cls.RIDE_CHARGE,
+                    status='PENDING',
+                    transaction_reference=reference,
+                    ride=ride,
+                )
+        except IntegrityError:
+            raise CardChargeError("A charge for this ride is already in progress")
+
+        try:
+            response = PaymentProcessingModule.chargeCustomer(
+                ride.fare, card['email'], card['authorization_code'],
+                metadata={'ride': ride.id}, reference=reference,
+            )
+        except requests.RequestException:
+            # Paystack may have charged the card anyway; leave the charge pending
+            return payment
+        outcome = (response.get('data') or {}).get('status')
+
+        if outcome == 'success':
+            cls.complete_charge(payment)
+        elif outcome in cls.PENDING_STATES:
+            pass
+        else:
+            cls._fail_charge(payment)
+        return payment
+
+    @classmethod
+    def resolve_pending(cls, payment):
+        """
+        Ask Paystack what happened to a pending charge and settle it.
+        Returns the resulting status; a charge Paystack has no record of is
+        failed so the ride can be charged again.
+        """
+        try:
+            response = PaymentProcessingModule.verifyPayment(payment.transaction_reference)
+            outcome = (response.get('data') or {}).get('status')
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code not in (400, 404):
+                return payment.status
+            outcome = 'failed'  # Unknown reference: the charge never reached Paystack
+        except requests.RequestException:
+            return payment.status
+
+        if outcome == 'success':
+            cls.complete_charge(payment)
+        elif outcome not in cls.PENDING_STATES:
+            cls._fail_charge(payment)
+        return payment.status
+
+    @staticmethod
+    def _fail_charge(payment):
+        if PaymentTransaction.objects.filter(pk=payment.pk, status='PENDING').update(
+            status='FAILED', updated_at=timezone.now()
+        ):
+            payment.status = 'FAILED'
+            NotificationModule.payment_result(payment, False)
+
+    @staticmethod
+    def complete_charge(payment):
+        """
+        Mark a pending top-up or card charge successful and credit the
+        wallet, once: only the caller whose update moves the row out of
+        PENDING credits it, so verification and webhook retries are safe.
+        """
+        with transaction.atomic():
+            marked = PaymentTransaction.objects.filter(pk=payment.pk, status='PENDING').update(
+                status='SUCCESS', updated_at=timezone.now()
+            )
+            if marked:
+                WalletModule.credit(payment.user_id, payment.amount)
+                StatementModule.record([(payment.user_id, payment.amount)])
+                payment.status = 'SUCCESS'
+                # A failing notification must not undo the credit
+                transaction.on_commit(lambda: NotificationModule.payment_result(payment, True))
+        return bool(marked)
@@ -0,0 +1,99 @@
+import threading
+from django.core.cache import cache
+from django.db import transaction
+
+
+class VehicleCatalog:
+    """
+    In-process copy of the vehicle colours, types, makes and models.
+
+    Changes bump a version counter in the shared cache; each process reloads
+    its copy (four small queries) the next time it sees a newer version. In
+    between, lookups cost no queries at all. Entries are unsaved model
+    instances carrying only id, name, status and (for models) make_id, good
+    enough to attach to a profile so serializers need not fetch them.
+    """
+
+    VERSION_KEY = 'catalog:vehicle:version'
+
+    # Profile field -> catalog model name
+    FIELDS = {
+        'vehicle_color': 'VehicleColor',
+        'vehicle_type': 'VehicleType',
+        'vehicle_make': 'VehicleMake',
+        'vehicle_model': 'VehicleModel',
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._version = None
+
+    @classmethod
+    def notify_changed(cls):
+        def publish():
+            cache.add(cls.VERSION_KEY, 0, None)
+            try:
+                cache.incr(cls.VERSION_KEY)
+            except ValueError:
+                cache.set(cls.VERSION_KEY, 1, None)
+        transaction.on_commit(publish)
+
+    def refresh(self):
+        current = cache.get(self.VERSION_KEY, 0)
+        if current == self._version:
+            return
+        with self._lock:
+            if current == self._version:
+                return
+            from . import models
+            entries = {}
+            for field, model_name in self.FIELDS.items():
+                model = getattr(models, model_name)
+                columns = ['id', 'name', 'status'] + (['make_id'] if model_name == 'VehicleModel' else [])
+                entries[field] = {row['id']: model(**row) for row in model.objects.values(*columns)}
+            self._entries, self._version = entries, current
+
+    def get(self, field, entry_id):
+        self.refresh()
+        return self._entries.get(field, {}).get(entry_id)
+
+    def attach(self, profile):
+        """Set the profile's vehicle relations from the catalog so reading them costs no queries."""
+        for field in self.FIELDS:
+            entry = self.get(field, getattr(profile, f'{field}_id'))
+            if entry is not None:
+                setattr(profile, field, entry)
+        return profile
+
+    def resolve(self, data):
+        """
+        Read ``<field>`` or ``<field>_id`` for each catalog field of ``data``
+        and return ``(instances, errors)``: the catalog entry per field
+        supplied, and a message per field that is unknown or inactive. A
+        model must belong to the make when both are given.
+        """
+        self.refresh()
+        instances, errors = {}, {}
+        for field in self.FIELDS:
+            raw = data.get(f'{field}_id', data.get(field))
+            if raw is None or raw == '':
+                continue
+            try:
+                entry = self._entries[field].get(int(raw))
+            except (TypeError, ValueError):
+                entry = None
+            if entry is None:
+                errors[field] = f"Invalid {field.replace('_', ' ')}"
+            elif not entry.status:
+                errors[field] = f"This {field.replace('_', ' ')} is no longer available"
+            else:
+                instances[field] = entry
+
+        make, model = instances.get('vehicle_make'), instances.get('vehicle_model')
+        if make and model and model.make_id != make.id:
+            errors['vehicle_model'] = "Vehicle model does not belong to the selected make"
+        return instances, errors
+
+
+vehicle_catalog = VehicleCatalog()
@@ -0,0 +1,133 @@
+import os
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, Sum, Value, When
+from django.utils import timezone
+from .models import Bid, ChatMessage, ChatMessageStatus, Conversation, Ride
+from .realtime import RealtimeModule
+
+
+class ChatError(Exception):
+    pass
+
+
+class ChatModule:
+    """
+    One conversation per pair of users. Each side's unread count is stored on
+    the conversation and adjusted by the same statements that insert or mark
+    messages, so reading counts never scans messages.
+    """
+
+    HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', '50'))
+    MAX_HISTORY_PAGE_SIZE = 200
+
+    @staticmethod
+    def _pair(first_id, second_id):
+        return (first_id, second_id) if first_id < second_id else (second_id, first_id)
+
+    @staticmethod
+    def can_start(sender, receiver):
+        """Users may open a conversation once they share a ride or a marketplace job."""
+        shared_ride = Ride.objects.filter(
+            Q(customer=sender, driver=receiver) | Q(customer=receiver, driver=sender)
+        )
+        shared_job = Bid.objects.filter(
+            Q(driver=sender, business__owner=receiver) | Q(driver=receiver, business__owner=sender)
+        )
+        return shared_ride.exists() or shared_job.exists()
+
+    @classmethod
+    def conversation_between(cls, first_id, second_id):
+        low, high = cls._pair(first_id, second_id)
+        return Conversation.objects.filter(user_low_id=low, user_high_id=high).first()
+
+    @classmethod
+    def _get_or_create_conversation(cls, sender, receiver):
+        low, high = cls._pair(sender.id, receiver.id)
+        conversation = Conversation.objects.filter(user_low_id=low, user_high_id=high).first()
+        if conversation:
+            return conversation
+        if not cls.can_start(sender, receiver):
+            raise ChatError("You can only message users you share a ride or delivery with")
+        try:
+            with transaction.atomic():
+                return Conversation.objects.create(user_low_id=low, user_high_id=high)
+        except IntegrityError:
+            # Created concurrently by the other participant
+            return Conversation.objects.get(user_low_id=low, user_high_id=high)
+
+    @classmethod
+    def send_message(cls, sender, receiver, text):
+        if sender.id == receiver.id:
+            raise ChatError("You cannot message yourself")
+        conversation = cls._get_or_create_conversation(sender, receiver)
+        unread_field = 'unread_low' if receiver.id == conversation.user_low_id else 'unread_high'
+
+        with transaction.atomic():
+            message = ChatMessage.objects.create(
+                conversation=conversation, sender=sender, receiver=receiver, message=text
+            )
+            Conversation.objects.filter(pk=conversation.pk).update(**{
+                unread_field: F(unread_field) + 1,
+                'last_message_preview': text,
+                'last_message_at': message.created_at,
+            })
+            payload = cls.serialize_message(message)
+            transaction.on_commit(lambda: RealtimeModule.publish(receiver.id, 'chat.message', payload))
+        return message
+
+    @classmethod
+    def history(cls, conversation, before=None, limit=None):
+        """Newest-first page of messages with ids below ``before``."""
+        limit = min(limit or cls.HISTORY_PAGE_SIZE, cls.MAX_HISTORY_PAGE_SIZE)
+        messages = ChatMessage.objects.filter(conversation=conversation)
+        if before:
+            messages = messages.filter(id__lt=before)
+        page = list(messages.order_by('-id')[:limit + 1])
+        next_before = page[limit - 1].id if len(page) > limit else None
+        return page[:limit], next_before
+
+    @classmethod
+    def mark_read(cls, conversation, reader, up_to=None):
+        """Mark the reader's unread messages (optionally up to an id) as read in one update."""
+        unread_field = 'unread_low' if reader.id == conversation.user_low_id else 'unread_high'
+        with transaction.atomic():
+            messages = ChatMessage.objects.filter(
+                conversation=conversation, receiver=reader, status=ChatMessageStatus.SENT
+            )
+            if up_to:
+                messages = messages.filter(id__lte=up_to)
+            marked = messages.update(status=ChatMessageStatus.READ, updated_at=timezone.now())
+            if marked:
+                # Unsigned column: clamp in CASE rather than subtracting below zero
+                Conversation.objects.filter(pk=conversation.pk).update(**{
+                    unread_field: Case(
+                        When(**{f'{unread_field}__gt': marked}, then=F(unread_field) - marked), default=Value(0)
+                    ),
+                })
+                sender_id = conversation.other_user_id(reader.id)
+                payload = {'conversation': conversation.id, 'reader': reader.id, 'up_to': up_to, 'count': marked}
+                transaction.on_commit(lambda: RealtimeModule.publish(sender_id, 'chat.read', payload))
+        return marked
+
+    @staticmethod
+    def conversations_for(user):
+        return Conversation.objects.filter(Q(user_low=user) | Q(user_high=user))
+
+    @classmethod
+    def unread_total(cls, user):
+        totals = cls.conversations_for(user).aggregate(
+            unread=Sum(Case(When(user_low=user, then=F('unread_low')), default=F('unread_high')))
+        )
+        return totals['unread'] or 0
+
+    @staticmethod
+    def serialize_message(message):
+        return {
+            'id': message.id,
+            'conversation': message.conversation_id,
+            'sender': message.sender_id,
+            'receiver': message.receiver_id,
+            'message': message.message,
+            'status': str(message.status),
+            'created_at': message.created_at.isoformat() if message.created_at else None,
+        }
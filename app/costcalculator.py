@@ -2,15 +2,19 @@ import os
 from decimal import Decimal
 from math import radians, sin, cos, sqrt, atan2
 import requests
+from .routing import RoutingModule, RoutingError
+from .surge import SurgePricingModule
+from .geofencing import geofence_index
 
 
 class CostComputationModule:
     """
     Helper for estimating ride costs.
 
-    It first tries to leverage an external “cost calculator” API (if the URL
-    is configured), then falls back to a deterministic local calculation using
-    the Haversine distance between pickup and dropoff coordinates.
+    It first tries the offline road graph (if ``ROUTING_GRAPH_PATH`` is
+    configured), then an external “cost calculator” API (if the URL is
+    configured), and finally falls back to a deterministic local calculation
+    using the Haversine distance between pickup and dropoff coordinates.
     """
 
     BASE_FARE = Decimal(os.getenv('RIDE_BASE_FARE', '150'))
@@ -19,6 +23,8 @@ class CostComputationModule:
     EXTERNAL_API_URL = os.getenv('COST_CALCULATOR_API_URL')
     EXTERNAL_API_KEY = os.getenv('COST_CALCULATOR_API_KEY')
     EXTERNAL_TIMEOUT = int(os.getenv('COST_CALCULATOR_TIMEOUT', '5'))
+    AVERAGE_SPEED_KPH = float(os.getenv('RIDE_AVERAGE_SPEED_KPH', '30'))
+    ENFORCE_SERVICE_AREA = os.getenv('RIDE_ENFORCE_SERVICE_AREA', 'True').lower() in ('1', 'true', 'yes')
 
     @classmethod
     def estimate(
@@ -32,19 +38,59 @@ class CostComputationModule:
         metadata=None,
     ):
         """
-        Return an estimation payload: {'amount': Decimal, 'distance_km': float, 'source': str}
+        Return an estimation payload:
+        {'amount': Decimal, 'distance_km': float, 'duration_minutes': int, 'surge_multiplier': float,
+         'zone_multiplier': float, 'zones': {'pickup': [...], 'dropoff': [...]}, 'source': str}
+
+        The surge multiplier is looked up by pickup location unless one is
+        passed in ``metadata``. Raises ValueError for trips outside the
+        service area.
         """
-        metadata = metadata or {}
+        metadata = dict(metadata or {})
+        if metadata.get('surge_multiplier') is None and SurgePricingModule.is_enabled():
+            metadata['surge_multiplier'] = SurgePricingModule.multiplier_for(pickup_latitude, pickup_longitude)
+
+        zones = geofence_index.resolve_trip(pickup_latitude, pickup_longitude, dropoff_latitude, dropoff_longitude)
+        if cls.ENFORCE_SERVICE_AREA and not zones['in_service_area']:
+            raise ValueError("Trip is outside the service area")
+        metadata.setdefault('zone_multiplier', zones['fare_multiplier'])
+        zone_payload = {
+            "zone_multiplier": metadata['zone_multiplier'],
+            "zones": {"pickup": zones['pickup_zone_ids'], "dropoff": zones['dropoff_zone_ids']},
+        }
 
-        if cls.EXTERNAL_API_URL:
+        if distance_km is None and RoutingModule.is_enabled():
             try:
-                return cls._estimate_via_api(
-                    pickup_latitude,
-                    pickup_longitude,
-                    dropoff_latitude,
-                    dropoff_longitude,
-                    metadata=metadata,
+                route = RoutingModule.route(
+                    pickup_latitude, pickup_longitude, dropoff_latitude, dropoff_longitude
                 )
+            except RoutingError:
+                # Coordinates off the mapped network; try the other estimators
+                route = None
+            if route:
+                return {
+                    "amount": cls._compute_local_cost(
+                        route["distance_km"], metadata.get('surge_multiplier'), metadata.get('zone_multiplier')
+                    ),
+                    "distance_km": route["distance_km"],
+                    "duration_minutes": route["duration_minutes"],
+                    "surge_multiplier": metadata.get('surge_multiplier'),
+                    **zone_payload,
+                    "source": "routing",
+                }
+
+        if cls.EXTERNAL_API_URL:
+            try:
+                return {
+                    **cls._estimate_via_api(
+                        pickup_latitude,
+                        pickup_longitude,
+                        dropoff_latitude,
+                        dropoff_longitude,
+                        metadata=metadata,
+                    ),
+                    **zone_payload,
+                }
             except (requests.RequestException, ValueError):
                 # Fall back to the built-in calculator if the external service fails
                 pass
@@ -55,8 +101,13 @@ class CostComputationModule:
             )
 
         return {
-            "amount": cls._compute_local_cost(distance_km, metadata.get('surge_multiplier')),
+            "amount": cls._compute_local_cost(
+                distance_km, metadata.get('surge_multiplier'), metadata.get('zone_multiplier')
+            ),
             "distance_km": distance_km,
+            "duration_minutes": cls._estimate_duration_minutes(distance_km),
+            "surge_multiplier": metadata.get('surge_multiplier'),
+            **zone_payload,
             "source": "local",
         }
 
@@ -94,20 +145,29 @@ class CostComputationModule:
         if amount is None or distance_km is None:
             raise ValueError("Cost calculator response did not include amount/distance")
 
+        duration = data.get("duration_minutes") or data.get("duration")
         return {
             "amount": Decimal(str(amount)),
             "distance_km": float(distance_km),
+            "duration_minutes": int(duration) if duration is not None else cls._estimate_duration_minutes(distance_km),
             "source": "external",
             "raw_response": data,
         }
 
     @classmethod
-    def _compute_local_cost(cls, distance_km, surge_multiplier=None):
+    def _compute_local_cost(cls, distance_km, surge_multiplier=None, zone_multiplier=None):
         distance_decimal = Decimal(str(distance_km))
         surge = Decimal(str(surge_multiplier)) if surge_multiplier else Decimal('1')
-        amount = (cls.BASE_FARE + (distance_decimal * cls.COST_PER_KM)) * surge
+        zone = Decimal(str(zone_multiplier)) if zone_multiplier else Decimal('1')
+        amount = (cls.BASE_FARE + (distance_decimal * cls.COST_PER_KM)) * surge * zone
         return max(amount, cls.MINIMUM_FARE)
 
+    @classmethod
+    def _estimate_duration_minutes(cls, distance_km):
+        if not distance_km:
+            return 0
+        return max(1, int(round(float(distance_km) / cls.AVERAGE_SPEED_KPH * 60)))
+
     @staticmethod
     def _calculate_distance_km(
         pickup_latitude,
@@ -0,0 +1,149 @@
+import csv
+import json
+import os
+from datetime import datetime, time, timedelta
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import PaymentTransaction, Ride, TransactionalWallet, UserRole
+
+
+class _Echo:
+    """File-like object whose write returns the line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+class ExportModule:
+    """
+    Streams history rows as CSV or NDJSON without loading them.
+
+    Rows are read in primary-key keyset chunks of CHUNK_SIZE: each chunk is
+    its own ``id > last ORDER BY id LIMIT n`` query, so memory stays flat on
+    MySQL too, where the driver would otherwise buffer a whole result set.
+    A date range is first turned into id bounds through the created_at
+    indexes and then also applied to each chunk.
+    """
+
+    CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+    FORMATS = {
+        'csv': 'text/csv',
+        'ndjson': 'application/x-ndjson',
+    }
+
+    SOURCES = {
+        'payments': {
+            'model': PaymentTransaction,
+            'fields': ['id', 'user_id', 'amount', 'transaction_type', 'status', 'transaction_reference',
+                       'ride_id', 'created_at', 'updated_at'],
+        },
+        'escrow': {
+            'model': TransactionalWallet,
+            'fields': ['id', 'from_user_id', 'to_user_id', 'amount', 'transaction_type', 'status',
+                       'scheduled_release_date', 'created_at', 'updated_at'],
+        },
+        'rides': {
+            'model': Ride,
+            'fields': ['id', 'customer_id', 'driver_id', 'status', 'pickup_location', 'dropoff_location',
+                       'fare', 'commission', 'distance', 'requested_at', 'completed_at', 'settled_at', 'created_at'],
+        },
+    }
+
+    @staticmethod
+    def parse_bound(value, end=False):
+        """
+        Read an ISO date or datetime. A bare date used as the end of a range
+        covers the whole day. Raises ValueError when the value is unreadable.
+        """
+        if not value:
+            return None
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(f"Invalid date: {value}")
+            moment = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    @staticmethod
+    def owner_filter(source, user):
+        if source == 'payments':
+            return Q(user=user)
+        if source == 'escrow':
+            return Q(from_user=user) | Q(to_user=user)
+        # Same split as my_rides: drivers export the rides they drove
+        return Q(driver=user) if user.role == UserRole.DRIVER else Q(customer=user)
+
+    @classmethod
+    def queryset(cls, source, user=None, start=None, end=None):
+        """Rows of ``source`` owned by ``user`` (all rows when None) created in [start, end)."""
+        queryset = cls.SOURCES[source]['model'].objects.all()
+        if user is not None:
+            queryset = queryset.filter(cls.owner_filter(source, user))
+        if start:
+            queryset = queryset.filter(created_at__gte=start)
+        if end:
+            queryset = queryset.filter(created_at__lt=end)
+
+        # Narrow the id range using the created_at indexes
+        if start:
+            low = queryset.order_by('created_at', 'id').values_list('id', flat=True).first()
+            if low is None:
+                return queryset.none()
+            queryset = queryset.filter(id__gte=low)
+        if end:
+            high = queryset.order_by('-created_at', '-id').values_list('id', flat=True).first()
+            if high is None:
+                return queryset.none()
+            queryset = queryset.filter(id__lte=high)
+        return queryset
+
+    @classmethod
+    def rows(cls, queryset, fields, chunk_size=None):
+        chunk_size = chunk_size or cls.CHUNK_SIZE
+        last_id = 0
+        while True:
+            chunk = list(queryset.filter(id__gt=last_id).order_by('id').values_list(*fields)[:chunk_size])
+            if not chunk:
+                return
+            yield from chunk
+            last_id = chunk[-1][0]
+            if len(chunk) < chunk_size:
+                return
+
+    @staticmethod
+    def _value(value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+
+    @classmethod
+    def lines(cls, fields, rows, output='csv'):
+        if output == 'csv':
+            writer = csv.writer(_Echo())
+            yield writer.writerow(fields)
+            for row in rows:
+                yield writer.writerow([cls._value(value) for value in row])
+        else:
+            for row in rows:
+                yield json.dumps({field: cls._value(value) for field, value in zip(fields, row)}) + '\n'
+
+    @classmethod
+    def stream(cls, source, output='csv', user=None, start=None, end=None, chunk_size=None):
+        """Generator of encoded lines for an export (the id column must stay first)."""
+        fields = cls.SOURCES[source]['fields']
+        queryset = cls.queryset(source, user, start, end)
+        return cls.lines(fields, cls.rows(queryset, fields, chunk_size), output)
+
+    @classmethod
+    def response(cls, source, output='csv', user=None, start=None, end=None):
+        response = StreamingHttpResponse(
+            cls.stream(source, output, user, start, end), content_type=cls.FORMATS[output]
+        )
+        stamp = timezone.now().strftime('%Y%m%d%H%M%S')
+        response['Content-Disposition'] = f'attachment; filename="{source}-{stamp}.{output}"'
+        return response
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        routes = {
+            '/transferrecipient': self.server.create_recipient,
+            '/transferrecipient/bulk': self.server.create_recipients_bulk,
+            '/transfer': self.server.transfer,
+            '/transfer/bulk': self.server.bulk_transfer,
+        }
+        handler = routes.get(self.path.rstrip('/'))
+        if handler is None:
+            return self._reply(404, {'status': False, 'message': 'Not found'})
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            return self._reply(401, {'status': False, 'message': 'Invalid key'})
+        self._reply(*handler(body))
+
+    def _reply(self, code, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakePaystackServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Paystack recipient and transfer endpoints, for
+    tests and throughput benchmarks. Every request waits ``latency`` seconds
+    plus ``item_latency`` per item; transfers fail at ``failure_rate``.
+    Repeated references return the original result, as Paystack does not pay
+    a reference twice.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, item_latency=0.0, failure_rate=0.0, seed=None):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.item_latency = item_latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.transfers = {}
+        self.requests = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def _wait(self, items=1):
+        with self.lock:
+            self.requests += 1
+        time.sleep(self.latency + self.item_latency * items)
+
+    @staticmethod
+    def _recipient(item):
+        digest = hashlib.sha1(f"{item.get('bank_code')}:{item.get('account_number')}".encode()).hexdigest()
+        return {
+            'recipient_code': f'RCP_{digest[:16]}',
+            'type': item.get('type'),
+            'name': item.get('name'),
+            'currency': item.get('currency'),
+            'details': {'account_number': item.get('account_number'), 'bank_code': item.get('bank_code')},
+        }
+
+    def _transfer(self, item, currency):
+        reference = item.get('reference')
+        with self.lock:
+            if reference in self.transfers:
+                return self.transfers[reference]
+            failed = self.random.random() < self.failure_rate
+            result = {
+                'reference': reference,
+                'recipient': item.get('recipient'),
+                'amount': item.get('amount'),
+                'currency': currency,
+                'transfer_code': f'TRF_{len(self.transfers) + 1:010d}',
+                'status': 'failed' if failed else 'received',
+            }
+            self.transfers[reference] = result
+        return result
+
+    def create_recipient(self, body):
+        self._wait()
+        return 201, {'status': True, 'message': 'Transfer recipient created successfully', 'data': self._recipient(body)}
+
+    def create_recipients_bulk(self, body):
+        batch = body.get('batch') or []
+        self._wait(len(batch))
+        return 200, {'status': True, 'message': 'Recipients added successfully',
+                     'data': {'success': [self._recipient(item) for item in batch], 'errors': []}}
+
+    def transfer(self, body):
+        self._wait()
+        result = self._transfer(body, body.get('currency'))
+        if result['status'] == 'failed':
+            return 400, {'status': False, 'message': 'Transfer failed'}
+        return 200, {'status': True, 'message': 'Transfer has been queued', 'data': {**result, 'status': 'pending'}}
+
+    def bulk_transfer(self, body):
+        transfers = body.get('transfers') or []
+        self._wait(len(transfers))
+        data = [self._transfer(item, body.get('currency')) for item in transfers]
+        return 200, {'status': True, 'message': f'{len(data)} transfers queued.', 'data': data}
@@ -0,0 +1,335 @@
+import logging
+import threading
+from math import radians, sin, cos, sqrt, atan2
+from django.core.cache import cache
+from django.db import transaction
+
+
+logger = logging.getLogger(__name__)
+
+SERVICE_AREA = 'SERVICE_AREA'
+PRICING_ZONE = 'PRICING_ZONE'
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    return 6371 * 2 * atan2(sqrt(a), sqrt(1 - a))
+
+
+def normalize_rings(vertices):
+    """
+    Accept a single ring ``[[lat, lng], ...]`` or a multi-polygon
+    ``[[[lat, lng], ...], ...]`` and return a list of rings of float pairs.
+    Raises ValueError for anything else.
+    """
+    if not isinstance(vertices, (list, tuple)) or not vertices:
+        raise ValueError("Vertices must be a non-empty list")
+    rings = [vertices] if _is_point(vertices[0]) else vertices
+
+    normalized = []
+    for ring in rings:
+        if not isinstance(ring, (list, tuple)) or not all(_is_point(point) for point in ring):
+            raise ValueError("Each ring must be a list of [latitude, longitude] pairs")
+        points = [[float(point[0]), float(point[1])] for point in ring]
+        if len(points) > 1 and points[0] == points[-1]:
+            points.pop()
+        if len(points) < 3:
+            raise ValueError("Each ring needs at least three distinct vertices")
+        for latitude, longitude in points:
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                raise ValueError("Vertex coordinates are out of range")
+        normalized.append(points)
+    return normalized
+
+
+def _is_point(value):
+    return (
+        isinstance(value, (list, tuple)) and len(value) == 2
+        and all(isinstance(component, (int, float)) and not isinstance(component, bool) for component in value)
+    )
+
+
+class CompiledFence:
+    """A geofence reduced to the data needed for containment tests."""
+
+    __slots__ = ('id', 'name', 'bbox', 'rings', 'center', 'radius', 'zone_type', 'fare_multiplier')
+
+    def __init__(self, fence_id, name, bbox, rings=None, center=None, radius=None,
+                 zone_type='GENERAL', fare_multiplier=1.0):
+        self.id = fence_id
+        self.name = name
+        self.bbox = bbox  # (min_lat, min_lng, max_lat, max_lng)
+        self.rings = rings or ()  # tuples of (latitudes, longitudes)
+        self.center = center
+        self.radius = radius
+        self.zone_type = zone_type
+        self.fare_multiplier = fare_multiplier
+
+    @classmethod
+    def from_geofence(cls, geofence):
+        if geofence.min_latitude is None:
+            geofence.compute_bounding_box()
+        if geofence.min_latitude is None:
+            return None
+        bbox = (geofence.min_latitude, geofence.min_longitude, geofence.max_latitude, geofence.max_longitude)
+        zone = {'zone_type': geofence.zone_type, 'fare_multiplier': geofence.fare_multiplier or 1.0}
+        if geofence.vertices:
+            rings = tuple(
+                (tuple(point[0] for point in ring), tuple(point[1] for point in ring))
+                for ring in normalize_rings(geofence.vertices)
+            )
+            return cls(geofence.id, geofence.name, bbox, rings=rings, **zone)
+        center_lat, center_lng = map(float, geofence.coordinates.split(','))
+        return cls(geofence.id, geofence.name, bbox, center=(center_lat, center_lng), radius=geofence.radius, **zone)
+
+    def in_bbox(self, latitude, longitude):
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        return min_lat <= latitude <= max_lat and min_lng <= longitude <= max_lng
+
+    def contains(self, latitude, longitude):
+        return self.contains_many([(latitude, longitude)])[0]
+
+    def contains_many(self, points):
+        """
+        Containment for a batch of ``(lat, lng)`` points.
+
+        Polygons use even-odd ray casting with the loop over edges on the
+        outside, so each edge's slope is computed once for the whole batch.
+        A point inside any ring of a multi-polygon is inside the fence.
+        """
+        if self.center is not None:
+            center_lat, center_lng = self.center
+            return [haversine_km(lat, lng, center_lat, center_lng) <= self.radius for lat, lng in points]
+
+        result = [False] * len(points)
+        for latitudes, longitudes in self.rings:
+            inside = [False] * len(points)
+            count = len(latitudes)
+            j = count - 1
+            for i in range(count):
+                yi, xi, yj, xj = latitudes[i], longitudes[i], latitudes[j], longitudes[j]
+                if yi != yj:
+                    slope = (xj - xi) / (yj - yi)
+                    low, high = (yi, yj) if yi < yj else (yj, yi)
+                    for index, (lat, lng) in enumerate(points):
+                        if low <= lat < high and lng < xi + (lat - yi) * slope:
+                            inside[index] = not inside[index]
+                j = i
+            result = [a or b for a, b in zip(result, inside)]
+        return result
+
+
+class STRTree:
+    """
+    Static R-tree bulk-loaded with Sort-Tile-Recursive packing.
+
+    Items are ``(bbox, value)`` with ``bbox = (min_lat, min_lng, max_lat, max_lng)``.
+    The tree is immutable; rebuild it when the item set changes.
+    """
+
+    def __init__(self, items, node_capacity=16):
+        self.node_capacity = node_capacity
+        self.size = len(items)
+        level = [(bbox, value, True) for bbox, value in items]
+        while len(level) > node_capacity:
+            level = self._pack(level)
+        self.root = (self._union([entry[0] for entry in level]), level, False) if level else None
+
+    def _pack(self, entries):
+        capacity = self.node_capacity
+        node_count = -(-len(entries) // capacity)
+        slice_count = max(1, int(node_count ** 0.5 + 0.999999))
+        slice_size = -(-len(entries) // slice_count)
+
+        entries = sorted(entries, key=lambda entry: entry[0][1] + entry[0][3])
+        parents = []
+        for start in range(0, len(entries), slice_size):
+            column = sorted(entries[start:start + slice_size], key=lambda entry: entry[0][0] + entry[0][2])
+            for node_start in range(0, len(column), capacity):
+                children = column[node_start:node_start + capacity]
+                parents.append((self._union([child[0] for child in children]), children, False))
+        return parents
+
+    @staticmethod
+    def _union(boxes):
+        return (
+            min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes),
+        )
+
+    def query_point(self, latitude, longitude):
+        """Values whose bounding box contains the point."""
+        if self.root is None:
+            return []
+        found = []
+        stack = [self.root]
+        while stack:
+            bbox, payload, is_leaf = stack.pop()
+            if not (bbox[0] <= latitude <= bbox[2] and bbox[1] <= longitude <= bbox[3]):
+                continue
+            if is_leaf:
+                found.append(payload)
+            else:
+                stack.extend(payload)
+        return found
+
+
+class GeofenceIndex:
+    """
+    In-process index over every geofence.
+
+    Saves and deletes bump a version counter in the shared cache and record
+    the changed fence id under that version. Before answering, the index
+    compares versions and reloads only the changed fences, then re-packs the
+    tree from memory. If the change log has expired it reloads everything.
+    """
+
+    VERSION_KEY = 'geofence:index:version'
+    CHANGE_KEY = 'geofence:index:change:{}'
+    CHANGE_TTL = 3600
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fences = {}
+        self._tree = STRTree([])
+        self._has_service_areas = False
+        self._version = None
+
+    # -------------------------------------------------
+    # Change tracking
+    # -------------------------------------------------
+    @classmethod
+    def notify_changed(cls, fence_id):
+        """Record a fence change once the surrounding transaction commits."""
+        def publish():
+            cache.add(cls.VERSION_KEY, 0, None)
+            try:
+                version = cache.incr(cls.VERSION_KEY)
+            except ValueError:
+                cache.set(cls.VERSION_KEY, 1, None)
+                version = 1
+            cache.set(cls.CHANGE_KEY.format(version), fence_id, cls.CHANGE_TTL)
+        transaction.on_commit(publish)
+
+    def refresh(self):
+        current = cache.get(self.VERSION_KEY, 0)
+        if current == self._version:
+            return
+        with self._lock:
+            if current == self._version:
+                return
+            if self._version is None or current < self._version:
+                self._load_all()
+            else:
+                keys = [self.CHANGE_KEY.format(version) for version in range(self._version + 1, current + 1)]
+                changes = cache.get_many(keys)
+                if len(changes) != len(keys):
+                    self._load_all()
+                else:
+                    self._apply_changes(set(changes.values()))
+            self._version = current
+
+    @staticmethod
+    def _compile(geofence):
+        """Compiled fence, or None when the stored shape cannot be read (legacy rows are not validated)."""
+        try:
+            return CompiledFence.from_geofence(geofence)
+        except (TypeError, ValueError, IndexError) as exc:
+            logger.error("Skipping geofence %s (%s): %s", geofence.id, geofence.name, exc)
+            return None
+
+    def _load_all(self):
+        from .models import Geofence
+        fences = {}
+        for geofence in Geofence.objects.all().iterator():
+            compiled = self._compile(geofence)
+            if compiled:
+                fences[compiled.id] = compiled
+        self._rebuild(fences)
+
+    def _apply_changes(self, fence_ids):
+        from .models import Geofence
+        fences = dict(self._fences)
+        for fence_id in fence_ids:
+            fences.pop(fence_id, None)
+        for geofence in Geofence.objects.filter(id__in=fence_ids):
+            compiled = self._compile(geofence)
+            if compiled:
+                fences[compiled.id] = compiled
+        self._rebuild(fences)
+
+    def _rebuild(self, fences):
+        tree = STRTree([(fence.bbox, fence) for fence in fences.values()])
+        has_service_areas = any(fence.zone_type == SERVICE_AREA for fence in fences.values())
+        # Swap the references together so concurrent readers see a consistent state
+        self._fences, self._tree, self._has_service_areas = fences, tree, has_service_areas
+
+    # -------------------------------------------------
+    # Queries
+    # -------------------------------------------------
+    def fences(self):
+        self.refresh()
+        return self._fences
+
+    def containing(self, latitude, longitude):
+        """Fences containing the point."""
+        self.refresh()
+        return [
+            fence for fence in self._tree.query_point(latitude, longitude)
+            if fence.contains(latitude, longitude)
+        ]
+
+    def containing_many(self, points):
+        """For each ``(lat, lng)`` point, the list of fences containing it."""
+        self.refresh()
+        tree = self._tree
+        candidates = {}
+        for index, (latitude, longitude) in enumerate(points):
+            for fence in tree.query_point(latitude, longitude):
+                candidates.setdefault(fence.id, (fence, []))[1].append(index)
+
+        results = [[] for _ in points]
+        for fence, indexes in candidates.values():
+            hits = fence.contains_many([points[index] for index in indexes])
+            for index, hit in zip(indexes, hits):
+                if hit:
+                    results[index].append(fence)
+        for hits in results:
+            hits.sort(key=lambda fence: fence.id)
+        return results
+
+
+    def resolve_trip(self, pickup_latitude, pickup_longitude, dropoff_latitude, dropoff_longitude):
+        """
+        Zones touched by a trip, answered from memory:
+
+            {'pickup_zone_ids': [...], 'dropoff_zone_ids': [...],
+             'in_service_area': bool, 'fare_multiplier': float}
+
+        Both ends must fall inside a service area once any service area
+        exists. The fare multiplier is the highest of the pricing zones at
+        either end.
+        """
+        pickup, dropoff = self.containing_many([
+            (pickup_latitude, pickup_longitude), (dropoff_latitude, dropoff_longitude),
+        ])
+
+        in_service_area = True
+        if self._has_service_areas:
+            in_service_area = all(
+                any(fence.zone_type == SERVICE_AREA for fence in fences) for fences in (pickup, dropoff)
+            )
+
+        multipliers = [fence.fare_multiplier for fence in pickup + dropoff if fence.zone_type == PRICING_ZONE]
+        return {
+            'pickup_zone_ids': [fence.id for fence in pickup],
+            'dropoff_zone_ids': [fence.id for fence in dropoff],
+            'in_service_area': in_service_area,
+            'fare_multiplier': max(multipliers) if multipliers else 1.0,
+        }
+
+
+geofence_index = GeofenceIndex()
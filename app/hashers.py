@@ -0,0 +1,20 @@
+import os
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher
+
+
+# Each hasher keeps Django's algorithm name, so existing hashes still verify
+# and are rewritten on the next login once the cost parameters change.
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    iterations = int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations))
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    work_factor = int(os.getenv('PASSWORD_SCRYPT_WORK_FACTOR', ScryptPasswordHasher.work_factor))
+    block_size = int(os.getenv('PASSWORD_SCRYPT_BLOCK_SIZE', ScryptPasswordHasher.block_size))
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Needs the argon2-cffi package."""
+    time_cost = int(os.getenv('PASSWORD_ARGON2_TIME_COST', Argon2PasswordHasher.time_cost))
+    memory_cost = int(os.getenv('PASSWORD_ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost))
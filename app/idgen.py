@@ -0,0 +1,196 @@
+import fcntl
+import os
+import tempfile
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+
+
+CROCKFORD_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+# Two base32 characters per 10-bit chunk, so a 60-bit id is six lookups
+_PAIRS = [CROCKFORD_ALPHABET[high] + CROCKFORD_ALPHABET[low] for high in range(32) for low in range(32)]
+_DECODE = {character: index for index, character in enumerate(CROCKFORD_ALPHABET)}
+_DECODE.update({'O': 0, 'I': 1, 'L': 1})
+
+
+class IdGenerationError(Exception):
+    pass
+
+
+def encode_base32(value):
+    """Encode a 60-bit integer as 12 Crockford base32 characters."""
+    return ''.join(_PAIRS[(value >> shift) & 0x3FF] for shift in (50, 40, 30, 20, 10, 0))
+
+
+def decode_base32(code):
+    value = 0
+    for character in code.upper():
+        if character not in _DECODE:
+            raise ValueError(f"Invalid base32 character: {character}")
+        value = (value << 5) | _DECODE[character]
+    return value
+
+
+class SnowflakeGenerator:
+    """
+    60-bit time-ordered ids: 40 bits of milliseconds since ``epoch_ms``,
+    8 bits of node id and 12 bits of per-millisecond sequence.
+
+    Uniqueness needs no coordination beyond each live generator owning a
+    distinct node id. If the sequence runs out within a millisecond, or the
+    wall clock steps backwards, the generator keeps counting on a logical
+    clock instead of sleeping, so ids never repeat and never wait.
+    """
+
+    TIMESTAMP_BITS = 40
+    NODE_BITS = 8
+    SEQUENCE_BITS = 12
+    MAX_NODE = (1 << NODE_BITS) - 1
+    MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+    def __init__(self, node_id, epoch_ms, clock=time.time_ns):
+        if not 0 <= node_id <= self.MAX_NODE:
+            raise IdGenerationError(f"Node id must be between 0 and {self.MAX_NODE}")
+        self.node_id = node_id
+        self.epoch_ms = epoch_ms
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def next_int(self):
+        now_ms = self.clock() // 1_000_000 - self.epoch_ms
+        with self._lock:
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            elif self._sequence < self.MAX_SEQUENCE:
+                self._sequence += 1
+            else:
+                # Sequence exhausted (or clock went backwards): borrow the next millisecond
+                self._last_ms += 1
+                self._sequence = 0
+            timestamp, sequence = self._last_ms, self._sequence
+
+        if timestamp >> self.TIMESTAMP_BITS:
+            raise IdGenerationError("Timestamp no longer fits; move the id epoch forward")
+        return (timestamp << (self.NODE_BITS + self.SEQUENCE_BITS)) | (self.node_id << self.SEQUENCE_BITS) | sequence
+
+    def next_code(self):
+        return encode_base32(self.next_int())
+
+    @classmethod
+    def split(cls, value):
+        """Return ``(timestamp_ms_since_epoch, node_id, sequence)`` for an id."""
+        return (
+            value >> (cls.NODE_BITS + cls.SEQUENCE_BITS),
+            (value >> cls.SEQUENCE_BITS) & cls.MAX_NODE,
+            value & cls.MAX_SEQUENCE,
+        )
+
+
+class IdGenerationModule:
+    """
+    Process-wide code generator.
+
+    Every process leases its own node slot on first use, starting at
+    ``ID_NODE_ID`` (or the pid) and moving to the next free slot when that
+    one is held, so workers that inherit the same environment still get
+    distinct nodes. With a shared cache (Redis or Memcached) the lease is a
+    cache key renewed while generating; with the local-memory cache, which
+    other processes cannot see, it is an exclusive lock on a per-slot file
+    in ``ID_NODE_LOCK_DIR``, released by the OS when the process exits, so
+    that setup coordinates the processes of one host only. Forked children
+    drop the parent's generator and lease their own.
+    """
+
+    EPOCH_MS = int(os.getenv('ID_EPOCH_MS', '1704067200000'))  # 2024-01-01T00:00:00Z
+    NODE_ID = os.getenv('ID_NODE_ID')
+    LEASE_KEY = 'idgen:node:{}'
+    LEASE_TTL = int(os.getenv('ID_NODE_LEASE_TTL', '600'))
+    LOCK_DIR = os.getenv('ID_NODE_LOCK_DIR', tempfile.gettempdir())
+
+    _lock = threading.Lock()
+    _generator = None
+    _lease_token = None
+    _lease_renew_at = 0.0
+    _lock_file = None
+
+    @classmethod
+    def generator(cls):
+        generator = cls._generator
+        if generator is not None and (cls._lease_token is None or time.monotonic() < cls._lease_renew_at):
+            return generator
+        with cls._lock:
+            if cls._generator is None:
+                cls._generator = SnowflakeGenerator(cls._node_id(), cls.EPOCH_MS)
+            elif cls._lease_token is not None and time.monotonic() >= cls._lease_renew_at:
+                cls._renew_lease()
+            return cls._generator
+
+    @staticmethod
+    def shared_cache():
+        return not settings.CACHES['default']['BACKEND'].endswith('LocMemCache')
+
+    @classmethod
+    def _node_id(cls):
+        slots = SnowflakeGenerator.MAX_NODE + 1
+        start = int(cls.NODE_ID) if cls.NODE_ID is not None else os.getpid()
+        claim = cls._claim_cache_slot if cls.shared_cache() else cls._claim_lock_slot
+        for offset in range(slots):
+            node_id = (start + offset) % slots
+            if claim(node_id):
+                return node_id
+        raise IdGenerationError("No free id node slot; every node is leased by another process")
+
+    @classmethod
+    def _claim_cache_slot(cls, node_id):
+        token = uuid.uuid4().hex
+        if not cache.add(cls.LEASE_KEY.format(node_id), token, cls.LEASE_TTL):
+            return False
+        cls._lease_token = token
+        cls._lease_renew_at = time.monotonic() + cls.LEASE_TTL / 2
+        return True
+
+    @classmethod
+    def _claim_lock_slot(cls, node_id):
+        lock_file = open(os.path.join(cls.LOCK_DIR, f'idgen-node-{node_id}.lock'), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        cls._lock_file = lock_file
+        return True
+
+    @classmethod
+    def _renew_lease(cls):
+        key = cls.LEASE_KEY.format(cls._generator.node_id)
+        if cache.get(key) == cls._lease_token:
+            cache.set(key, cls._lease_token, cls.LEASE_TTL)
+            cls._lease_renew_at = time.monotonic() + cls.LEASE_TTL / 2
+        else:
+            # The lease lapsed and may belong to someone else now; take a new slot
+            cls._generator = SnowflakeGenerator(cls._node_id(), cls.EPOCH_MS)
+
+    @classmethod
+    def _reset_after_fork(cls):
+        if cls._lock_file is not None:
+            # The parent still holds the lock through its own descriptor
+            cls._lock_file.close()
+        cls._lock = threading.Lock()
+        cls._generator = None
+        cls._lease_token = None
+        cls._lease_renew_at = 0.0
+        cls._lock_file = None
+
+    @classmethod
+    def next_code(cls):
+        return cls.generator().next_code()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=IdGenerationModule._reset_after_fork)
@@ -0,0 +1,232 @@
+import os
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from django.apps import apps
+from django.db import connections
+from django.db.models import Max, Min
+from .exports import ExportModule
+from .models import PaymentTransaction, Transaction, TransactionalWallet, Wallet, WithdrawalStatus
+
+
+def _init_worker():
+    if not apps.ready:
+        import django
+        django.setup()
+    # Forked workers must not reuse the parent's database connections
+    connections.close_all()
+
+
+def _scan(task):
+    return LedgerModule.scan_range(*task)
+
+
+def _diff(task):
+    return LedgerModule.diff_range(*task)
+
+
+class LedgerModule:
+    """
+    Recomputes every wallet's balances from the money movements and lists
+    the wallets whose stored balances differ.
+
+    Movements come from three tables: payments (deposits, card ride charges
+    and withdrawals), escrow holds and releases (TransactionalWallet) and
+    the wallet-to-wallet ledger written by ride settlement (Transaction).
+    Each table is read in primary-key slices, each slice in keyset chunks,
+    and amounts are summed into two ``array('q')`` accumulators indexed by
+    wallet id, so memory grows with the number of wallets and not with the
+    number of movements. The summed arrays are then compared with stored
+    balances over wallet-id ranges. Both phases run on a process pool.
+
+    Scans stop at the highest ids seen when the run starts, but balances
+    keep moving while it runs; run against a replica or a quiet period and
+    re-check reported wallets before applying the plan.
+    """
+
+    CHUNK_SIZE = int(os.getenv('LEDGER_CHUNK_SIZE', '5000'))
+    WORKERS = int(os.getenv('LEDGER_WORKERS', str(os.cpu_count() or 1)))
+    SLICES_PER_WORKER = 4
+
+    # Payment rows that have moved money into (+1) or out of (-1) the active balance
+    PAYMENT_EFFECTS = {
+        ('DEPOSIT', 'SUCCESS'): 1,
+        ('RIDE_CHARGE', 'SUCCESS'): 1,
+        # Both withdrawal paths take the money when the row is created (PENDING for
+        # direct transfers, QUEUED for batches) and refund it when the row turns FAILED
+        ('WITHDRAWAL', WithdrawalStatus.PENDING): -1,
+        ('WITHDRAWAL', WithdrawalStatus.QUEUED): -1,
+        ('WITHDRAWAL', WithdrawalStatus.PROCESSING): -1,
+        ('WITHDRAWAL', WithdrawalStatus.COMPLETED): -1,
+    }
+
+    SOURCES = {
+        'payments': (PaymentTransaction, ['id', 'user__wallet__id', 'user_id', 'amount', 'transaction_type', 'status']),
+        'escrow': (TransactionalWallet, ['id', 'from_user__wallet__id', 'from_user_id', 'to_user__wallet__id',
+                                         'to_user_id', 'amount', 'status']),
+        'ledger': (Transaction, ['id', 'from_wallet_id', 'to_wallet_id', 'amount', 'status']),
+    }
+
+    # -------------------------------------------------
+    # Phase one: sum movements per wallet
+    # -------------------------------------------------
+    @classmethod
+    def scan_range(cls, source, low, high, size, chunk_size=None):
+        """
+        Sum the movements of ``source`` with ids in (low, high]. Returns
+        ``(source, rows, active, transactional, orphans, skipped)``: the two
+        accumulators as bytes, amounts for users without a wallet keyed by
+        user id, and the number of rows naming wallets created after the
+        run began.
+        """
+        model, fields = cls.SOURCES[source]
+        active = array('q', bytes(8 * size))
+        transactional = array('q', bytes(8 * size))
+        orphans, rows, skipped = {}, 0, 0
+
+        def add(wallet_id, user_id, active_amount, transactional_amount=0):
+            nonlocal skipped
+            if wallet_id is None:
+                orphan = orphans.setdefault(user_id, [0, 0])
+                orphan[0] += active_amount
+                orphan[1] += transactional_amount
+            elif wallet_id >= size:
+                skipped += 1
+            else:
+                active[wallet_id] += active_amount
+                transactional[wallet_id] += transactional_amount
+
+        queryset = model.objects.filter(id__gt=low, id__lte=high)
+        for row in ExportModule.rows(queryset, fields, chunk_size or cls.CHUNK_SIZE):
+            rows += 1
+            if source == 'payments':
+                _, wallet_id, user_id, amount, kind, status = row
+                effect = cls.PAYMENT_EFFECTS.get((kind, status))
+                if effect:
+                    add(wallet_id, user_id, effect * amount)
+            elif source == 'escrow':
+                _, from_wallet, from_user, to_wallet, to_user, amount, status = row
+                if status == 'PENDING':
+                    add(from_wallet, from_user, -amount, amount)
+                elif status == 'COMPLETED':
+                    add(from_wallet, from_user, -amount)
+                    add(to_wallet, to_user, amount)
+            else:
+                _, from_wallet, to_wallet, amount, status = row
+                if status == 'COMPLETED':
+                    if from_wallet is not None:
+                        add(from_wallet, None, -amount)
+                    add(to_wallet, None, amount)
+        return source, rows, active.tobytes(), transactional.tobytes(), orphans, skipped
+
+    # -------------------------------------------------
+    # Phase two: compare with stored balances
+    # -------------------------------------------------
+    @classmethod
+    def diff_range(cls, low, high, active_bytes, transactional_bytes, chunk_size=None):
+        """
+        Compare wallets with ids in [low, high) against the expected balances
+        for that range. Returns ``(wallets_checked, repairs)``.
+        """
+        expected_active, expected_transactional = array('q'), array('q')
+        expected_active.frombytes(active_bytes)
+        expected_transactional.frombytes(transactional_bytes)
+
+        checked, repairs = 0, []
+        wallets = Wallet.objects.filter(id__gte=low, id__lt=high)
+        fields = ['id', 'user_id', 'active_balance', 'transactional_balance']
+        for wallet_id, user_id, active, transactional in ExportModule.rows(wallets, fields, chunk_size or cls.CHUNK_SIZE):
+            checked += 1
+            want_active = expected_active[wallet_id - low]
+            want_transactional = expected_transactional[wallet_id - low]
+            if active != want_active or transactional != want_transactional:
+                repairs.append({
+                    'action': 'adjust', 'wallet': wallet_id, 'user': user_id,
+                    'active_balance': active, 'expected_active_balance': want_active,
+                    'active_adjustment': want_active - active,
+                    'transactional_balance': transactional, 'expected_transactional_balance': want_transactional,
+                    'transactional_adjustment': want_transactional - transactional,
+                })
+        return checked, repairs
+
+    # -------------------------------------------------
+    # Orchestration
+    # -------------------------------------------------
+    @staticmethod
+    def _ranges(low, high, parts):
+        """Split the ids in (low, high] into up to ``parts`` contiguous (start, end] ranges."""
+        if high <= low:
+            return []
+        step = max(1, -(-(high - low) // parts))
+        return [(start, min(start + step, high)) for start in range(low, high, step)]
+
+    @classmethod
+    def verify(cls, workers=None, chunk_size=None):
+        """
+        Run both phases and return a report with per-source row counts,
+        timings and the repair plan (one entry per wallet to adjust or
+        user whose wallet is missing).
+        """
+        workers = max(1, workers or cls.WORKERS)
+        chunk_size = chunk_size or cls.CHUNK_SIZE
+        parts = workers * cls.SLICES_PER_WORKER
+
+        bounds = {}
+        for source, (model, _) in cls.SOURCES.items():
+            limits = model.objects.aggregate(low=Min('id'), high=Max('id'))
+            bounds[source] = ((limits['low'] or 1) - 1, limits['high'] or 0)
+        # Read after the movement bounds so every wallet they name is covered
+        size = (Wallet.objects.aggregate(high=Max('id'))['high'] or 0) + 1
+
+        tasks = [
+            (source, start, end, size, chunk_size)
+            for source, (low, high) in bounds.items()
+            for start, end in cls._ranges(low, high, parts)
+        ]
+        report = {'rows': dict.fromkeys(cls.SOURCES, 0), 'skipped': 0, 'wallets': 0, 'repairs': []}
+        active, transactional = array('q', bytes(8 * size)), array('q', bytes(8 * size))
+        orphans = {}
+
+        started = time.perf_counter()
+        connections.close_all()
+        executor = ProcessPoolExecutor(workers, initializer=_init_worker) if workers > 1 else None
+        try:
+            results = executor.map(_scan, tasks) if executor else map(_scan, tasks)
+            for source, rows, active_bytes, transactional_bytes, found, skipped in results:
+                report['rows'][source] += rows
+                report['skipped'] += skipped
+                for accumulator, data in ((active, active_bytes), (transactional, transactional_bytes)):
+                    part = array('q')
+                    part.frombytes(data)
+                    for wallet_id, amount in enumerate(part):
+                        if amount:
+                            accumulator[wallet_id] += amount
+                for user_id, (active_amount, transactional_amount) in found.items():
+                    orphan = orphans.setdefault(user_id, [0, 0])
+                    orphan[0] += active_amount
+                    orphan[1] += transactional_amount
+            report['scan_seconds'] = time.perf_counter() - started
+
+            diff_started = time.perf_counter()
+            diff_tasks = [
+                (start + 1, end + 1, active[start + 1:end + 1].tobytes(), transactional[start + 1:end + 1].tobytes(),
+                 chunk_size)
+                for start, end in cls._ranges(0, size - 1, parts)
+            ]
+            results = executor.map(_diff, diff_tasks) if executor else map(_diff, diff_tasks)
+            for checked, repairs in results:
+                report['wallets'] += checked
+                report['repairs'].extend(repairs)
+            report['diff_seconds'] = time.perf_counter() - diff_started
+        finally:
+            if executor:
+                executor.shutdown()
+
+        report['repairs'].extend(
+            {'action': 'create', 'wallet': None, 'user': user_id,
+             'expected_active_balance': active_amount, 'expected_transactional_balance': transactional_amount}
+            for user_id, (active_amount, transactional_amount) in sorted(orphans.items())
+            if active_amount or transactional_amount
+        )
+        report['seconds'] = time.perf_counter() - started
+        return report
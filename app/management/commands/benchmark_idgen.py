@@ -0,0 +1,48 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from app.idgen import IdGenerationModule, SnowflakeGenerator
+
+
+def _generate(count):
+    return [IdGenerationModule.next_code() for _ in range(count)]
+
+
+class Command(BaseCommand):
+    help = 'Measure business code generation throughput and check that codes never collide'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200000, help='Codes per worker')
+        parser.add_argument('--threads', type=int, default=4, help='Threads sharing one generator')
+        parser.add_argument('--processes', type=int, default=4, help='Processes leasing their own node ids')
+
+    def handle(self, *args, **options):
+        count = options['count']
+
+        generator = SnowflakeGenerator(0, IdGenerationModule.EPOCH_MS)
+        started = time.perf_counter()
+        for _ in range(count):
+            generator.next_code()
+        self._report('single thread', count, time.perf_counter() - started)
+
+        threads = options['threads']
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            batches = list(pool.map(lambda _: [generator.next_code() for _ in range(count)], range(threads)))
+        self._report(f'{threads} threads', count * threads, time.perf_counter() - started, batches)
+
+        processes = options['processes']
+        started = time.perf_counter()
+        with ProcessPoolExecutor(processes) as pool:
+            batches = list(pool.map(_generate, [count] * processes))
+        self._report(f'{processes} processes', count * processes, time.perf_counter() - started, batches)
+
+    def _report(self, label, total, elapsed, batches=None):
+        line = f'{label}: {total} codes in {elapsed:.2f}s ({total / elapsed:,.0f}/s)'
+        if batches is not None:
+            unique = len(set(code for batch in batches for code in batch))
+            if unique != total:
+                self.stdout.write(self.style.ERROR(f'{line}, {total - unique} collisions'))
+                return
+            line += ', no collisions'
+        self.stdout.write(self.style.SUCCESS(line))
@@ -0,0 +1,68 @@
+import time
+import uuid
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils.module_loading import import_string
+from rest_framework.test import APIRequestFactory
+from app.views import AuthViewSet
+
+PASSWORD = 'benchmark-Passw0rd!'
+
+
+class Command(BaseCommand):
+    help = 'Measure password checks and full logins per second on one core for each hasher policy'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hashers', default=','.join(settings.PASSWORD_HASHER_CHOICES),
+                            help='Comma separated hasher names from PASSWORD_HASHER_CHOICES')
+        parser.add_argument('--seconds', type=float, default=2.0, help='Time spent per hasher')
+        parser.add_argument('--logins', type=int, default=20, help='Full logins through the view')
+
+    def handle(self, *args, **options):
+        hashers = [('django default pbkdf2', PBKDF2PasswordHasher())]
+        for name in options['hashers'].split(','):
+            hashers.append((name, import_string(settings.PASSWORD_HASHER_CHOICES[name])()))
+
+        for label, hasher in hashers:
+            try:
+                encoded = hasher.encode(PASSWORD, hasher.salt())
+            except ValueError as exc:
+                self.stdout.write(self.style.WARNING(f'{label}: skipped ({exc})'))
+                continue
+            checks, started = 0, time.perf_counter()
+            while time.perf_counter() - started < options['seconds']:
+                hasher.verify(PASSWORD, encoded)
+                checks += 1
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(f'{label}: {checks / elapsed:,.1f} checks/s per core'))
+
+        self._benchmark_view(options['logins'])
+
+    def _benchmark_view(self, logins):
+        """Log in through AuthViewSet with a throwaway user, rolled back afterwards."""
+        view = AuthViewSet.as_view({'post': 'login'})
+        factory = APIRequestFactory()
+        email = f'benchmark-{uuid.uuid4().hex[:12]}@example.com'
+        with transaction.atomic():
+            user = get_user_model()(email=email, phone_number=email)
+            user.set_password(PASSWORD)
+            user.save()
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(logins):
+                    request = factory.post('/api/auth/login/', {'email_or_phone_number': email, 'password': PASSWORD},
+                                           format='json')
+                    response = view(request)
+                    if response.status_code != 200:
+                        raise RuntimeError(f'Login failed: {response.data}')
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'login view ({settings.PASSWORD_HASHER}): {logins / elapsed:,.1f} logins/s per core, '
+            f'{len(queries) / logins:.1f} queries per login'
+        ))
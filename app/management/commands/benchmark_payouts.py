@@ -0,0 +1,76 @@
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from app.fakepaystack import FakePaystackServer
+from app.models import PaymentTransaction, PayoutDestination, RecipientType, User, Wallet, WithdrawalStatus
+from app.payment import PaymentProcessingModule
+from app.payouts import PayoutModule
+
+
+class Command(BaseCommand):
+    help = 'Compare one-transfer-per-withdrawal with batched bulk transfers against a local fake Paystack'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=500, help='Withdrawals to send')
+        parser.add_argument('--amount', type=int, default=100)
+        parser.add_argument('--batch-size', type=int, default=PayoutModule.BATCH_SIZE)
+        parser.add_argument('--latency-ms', type=float, default=150.0)
+        parser.add_argument('--item-latency-ms', type=float, default=1.0)
+        parser.add_argument('--failure-rate', type=float, default=0.02)
+
+    def handle(self, *args, **options):
+        count, amount = options['count'], options['amount']
+        server = FakePaystackServer(
+            latency=options['latency_ms'] / 1000, item_latency=options['item_latency_ms'] / 1000,
+            failure_rate=options['failure_rate'], seed=1,
+        ).start()
+        original = PaymentProcessingModule.BASE_URL, PaymentProcessingModule.SECRET_KEY
+        PaymentProcessingModule.BASE_URL = server.base_url
+        PaymentProcessingModule.SECRET_KEY = 'sk_test_benchmark'
+
+        suffix = uuid.uuid4().hex[:10]
+        user = User.objects.create(name=f'benchmark-{suffix}', email=f'benchmark-{suffix}@example.com')
+        try:
+            starting_balance = count * amount
+            Wallet.objects.create(user=user, active_balance=starting_balance)
+            destination = PayoutModule.destination_for(user, '0700000000', 'MPESA', type=RecipientType.MOBILE_MONEY)
+
+            started = time.perf_counter()
+            for _ in range(count):
+                try:
+                    PaymentProcessingModule.withdraw_from_wallet(amount, destination.recipient_code)
+                except Exception:
+                    pass
+            self._report('one transfer per withdrawal', count, time.perf_counter() - started, count)
+
+            requests_before = server.requests
+            started = time.perf_counter()
+            for _ in range(count):
+                PayoutModule.enqueue(user, amount, destination)
+            enqueued = time.perf_counter() - started
+            results = list(PayoutModule.flush(batch_size=options['batch_size']))
+            elapsed = time.perf_counter() - started
+            self._report('queued + bulk transfers', count, elapsed, server.requests - requests_before)
+            self.stdout.write(f'  enqueueing took {enqueued:.2f}s, {len(results)} batches')
+
+            # The fake accepts transfers as 'received': they await a webhook rather than completing
+            accepted = sum(result[0] + result[1] for result in results)
+            failed = sum(result[2] for result in results)
+            balance = Wallet.objects.get(user=user).active_balance
+            left = PaymentTransaction.objects.filter(user=user, status=WithdrawalStatus.QUEUED).count()
+            consistent = balance == starting_balance - accepted * amount and accepted + failed == count and not left
+            style = self.style.SUCCESS if consistent else self.style.ERROR
+            self.stdout.write(style(
+                f'  {accepted} accepted, {failed} failed and refunded, balance {balance} '
+                f'({"consistent" if consistent else "INCONSISTENT"})'
+            ))
+        finally:
+            PayoutDestination.objects.filter(user=user).delete()
+            user.delete()
+            PaymentProcessingModule.BASE_URL, PaymentProcessingModule.SECRET_KEY = original
+            server.stop()
+
+    def _report(self, label, count, elapsed, requests):
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: {count} withdrawals in {elapsed:.2f}s ({count / elapsed:,.1f}/s, {requests} requests)'
+        ))
@@ -0,0 +1,89 @@
+import os
+import random
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from app.routing import RoadGraph, RoutingError
+
+
+class Command(BaseCommand):
+    help = 'Measure routing queries per second on a graph file or a synthetic city-sized grid'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--graph', help='Graph file to benchmark (defaults to a synthetic grid)')
+        parser.add_argument('--grid-size', type=int, default=300, help='Synthetic grid side length in nodes')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--max-trip-km', type=float, default=15.0, help='Longest straight-line trip to sample')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        path = options['graph']
+        temporary = None
+        if not path:
+            temporary = tempfile.NamedTemporaryFile(suffix='.graph', delete=False)
+            temporary.close()
+            path = temporary.name
+            self._write_grid(path, options['grid_size'], rng)
+
+        try:
+            started = time.perf_counter()
+            graph = RoadGraph.open(path)
+            load_ms = (time.perf_counter() - started) * 1000
+            self.stdout.write(f'Loaded {graph.node_count} nodes / {graph.edge_count} edges in {load_ms:.2f}ms')
+
+            pairs = self._sample_pairs(graph, options['queries'], options['max_trip_km'], rng)
+            routed = 0
+            started = time.perf_counter()
+            for source, target in pairs:
+                try:
+                    graph.shortest_path(source, target)
+                    routed += 1
+                except RoutingError:
+                    pass
+            elapsed = time.perf_counter() - started
+            graph.close()
+        finally:
+            if temporary:
+                os.unlink(path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{routed}/{len(pairs)} routes in {elapsed:.2f}s: {len(pairs) / elapsed:.1f} queries/s, '
+            f'{elapsed / len(pairs) * 1000:.2f}ms mean'
+        ))
+
+    def _sample_pairs(self, graph, count, max_trip_km, rng):
+        pairs = []
+        max_degrees = max_trip_km / 111.0
+        while len(pairs) < count:
+            source = rng.randrange(graph.node_count)
+            latitude = graph.latitudes[source] + rng.uniform(-max_degrees, max_degrees) / 1.5
+            longitude = graph.longitudes[source] + rng.uniform(-max_degrees, max_degrees) / 1.5
+            try:
+                target, _ = graph.nearest_node(latitude, longitude)
+            except RoutingError:
+                continue
+            pairs.append((source, target))
+        return pairs
+
+    def _write_grid(self, path, size, rng):
+        """Square street grid around Nairobi with ~100m blocks and a few faster arterials."""
+        origin_lat, origin_lng, step = -1.35, 36.75, 0.0009
+        latitudes, longitudes, edges = [], [], []
+        for row in range(size):
+            for column in range(size):
+                latitudes.append(origin_lat + row * step + rng.uniform(-0.0001, 0.0001))
+                longitudes.append(origin_lng + column * step + rng.uniform(-0.0001, 0.0001))
+
+        for row in range(size):
+            for column in range(size):
+                node = row * size + column
+                for neighbour, arterial in ((node + 1, row % 10 == 0), (node + size, column % 10 == 0)):
+                    if (neighbour == node + 1 and column + 1 == size) or neighbour >= size * size:
+                        continue
+                    speed_mps = (60 if arterial else 30) / 3.6
+                    length = 100.0
+                    edges.append((node, neighbour, length, length / speed_mps))
+                    edges.append((neighbour, node, length, length / speed_mps))
+
+        RoadGraph.write(path, latitudes, longitudes, edges)
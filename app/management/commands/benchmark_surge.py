@@ -0,0 +1,90 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from app.models import Ride
+from app.surge import MemorySurgeStore, SurgePricingModule
+
+
+class Command(BaseCommand):
+    help = 'Replay historical ride requests through the surge engine and report throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Replay at most this many rides')
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help='Replay this many generated requests instead of the Ride table')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        events = self._synthetic_events(options['synthetic'], options['seed']) if options['synthetic'] \
+            else self._historical_events(options['limit'])
+        if not events:
+            self.stdout.write(self.style.WARNING('No rides with pickup coordinates to replay'))
+            return
+
+        # Replay on a simulated clock so hours of history run in seconds
+        clock = {'now': events[0][0]}
+        engine = SurgePricingModule.build_engine(MemorySurgeStore(lambda: clock['now']), clock=lambda: clock['now'])
+        refresh_every = SurgePricingModule.REFRESH_SECONDS
+        next_refresh = events[0][0] + refresh_every
+        lookups = refreshes = 0
+        peak = (1.0, None, None)
+
+        started = time.perf_counter()
+        for at, kind, actor, latitude, longitude in events:
+            clock['now'] = at
+            while at >= next_refresh:
+                engine.recompute_active(next_refresh)
+                refreshes += 1
+                next_refresh += refresh_every
+            if kind == 'demand':
+                engine.record_demand(latitude, longitude, at=at)
+                multiplier = engine.multiplier_for(latitude, longitude, at=at)
+                lookups += 1
+                if multiplier > peak[0]:
+                    peak = (multiplier, engine.cell_for(latitude, longitude), at)
+            else:
+                engine.record_supply(actor, latitude, longitude, at=at)
+        elapsed = time.perf_counter() - started
+
+        span_hours = (events[-1][0] - events[0][0]) / 3600
+        self.stdout.write(self.style.SUCCESS(
+            f'Replayed {len(events)} events ({span_hours:.1f}h of history) in {elapsed:.2f}s: '
+            f'{len(events) / elapsed:.0f} events/s, {lookups} lookups, {refreshes} refresh ticks'
+        ))
+        self.stdout.write(f'Peak multiplier {peak[0]} in cell {peak[1]}')
+
+    def _historical_events(self, limit):
+        """Ride requests as demand; the accepting driver at the pickup point as supply."""
+        rides = Ride.objects.filter(
+            pickup_latitude__isnull=False, pickup_longitude__isnull=False
+        ).order_by('requested_at').values_list(
+            'requested_at', 'accepted_at', 'driver_id', 'pickup_latitude', 'pickup_longitude'
+        )
+        if limit:
+            rides = rides[:limit]
+
+        events = []
+        for requested_at, accepted_at, driver_id, latitude, longitude in rides.iterator(chunk_size=5000):
+            events.append((requested_at.timestamp(), 'demand', None, latitude, longitude))
+            if driver_id and accepted_at:
+                events.append((accepted_at.timestamp(), 'supply', driver_id, latitude, longitude))
+        events.sort(key=lambda event: event[0])
+        return events
+
+    def _synthetic_events(self, count, seed):
+        """A day of requests around a few Nairobi hotspots with a morning and evening peak."""
+        rng = random.Random(seed)
+        hotspots = [(-1.2864, 36.8172), (-1.2630, 36.8030), (-1.3190, 36.9270), (-1.2190, 36.8890)]
+        start = time.time() - 86400
+        events = []
+        for _ in range(count):
+            hour = rng.choice([7, 8, 8, 9, 12, 17, 17, 18, 18, 19, 22]) + rng.random()
+            latitude, longitude = rng.choice(hotspots)
+            latitude += rng.gauss(0, 0.01)
+            longitude += rng.gauss(0, 0.01)
+            at = start + hour * 3600
+            events.append((at, 'demand', None, latitude, longitude))
+            if rng.random() < 0.6:
+                events.append((at + rng.uniform(0, 120), 'supply', rng.randrange(2000), latitude, longitude))
+        events.sort(key=lambda event: event[0])
+        return events
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from app.routing import OSMGraphBuilder
+
+
+class Command(BaseCommand):
+    help = 'Build the offline routing graph from an OpenStreetMap XML extract (.osm, .osm.gz, .osm.bz2)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('osm_path', help='Path to the OSM extract')
+        parser.add_argument('output_path', help='Where to write the graph file (point ROUTING_GRAPH_PATH at it)')
+        parser.add_argument('--cell-size', type=float, default=None, help='Snapping grid cell size in degrees')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            node_count, edge_count = OSMGraphBuilder.build(
+                options['osm_path'], options['output_path'], cell_size=options['cell_size']
+            )
+        except (OSError, KeyError) as exc:
+            raise CommandError(f'Could not build routing graph: {exc}')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {node_count} nodes and {edge_count} edges to {options["output_path"]} in {elapsed:.1f}s'
+        ))
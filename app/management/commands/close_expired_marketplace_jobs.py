@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from app.marketplace import MarketplaceModule
+
+
+class Command(BaseCommand):
+    help = 'Expire marketplace businesses past their maximum waiting time and reject their open bids'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=MarketplaceModule.CLOSE_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total_businesses = total_bids = chunks = 0
+        for businesses, bids in MarketplaceModule.close_expired(chunk_size=options['chunk_size']):
+            total_businesses += businesses
+            total_bids += bids
+            chunks += 1
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Expired {total_businesses} businesses and rejected {total_bids} bids '
+            f'in {chunks} chunks ({elapsed:.2f}s)'
+        ))
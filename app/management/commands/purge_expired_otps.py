@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from app.otp import OTPModule
+
+
+class Command(BaseCommand):
+    help = 'Delete expired one-time codes stored by the database OTP backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=OTPModule.PURGE_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = chunks = 0
+        for deleted in OTPModule.purge_expired(chunk_size=options['chunk_size']):
+            total += deleted
+            chunks += 1
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Deleted {total} expired codes in {chunks} chunks ({elapsed:.2f}s)'))
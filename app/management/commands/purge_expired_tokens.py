@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from app.tokens import TokenBlacklist, token_blacklist
+
+
+class Command(BaseCommand):
+    help = 'Delete expired outstanding refresh tokens and their blacklist entries in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=TokenBlacklist.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = chunks = 0
+        for deleted in token_blacklist.purge_expired(chunk_size=options['chunk_size']):
+            total += deleted
+            chunks += 1
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Deleted {total} expired tokens in {chunks} chunks ({elapsed:.2f}s)'))
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from app.statements import StatementModule
+
+
+class Command(BaseCommand):
+    help = 'Recompute monthly wallet statements from payment and ride history, one transaction per chunk of wallets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=StatementModule.CHUNK_SIZE)
+        parser.add_argument('--wallet', type=int, action='append', dest='wallets', help='Only rebuild this wallet (repeatable)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        wallets = statements = chunks = 0
+        for chunk_wallets, chunk_statements in StatementModule.rebuild(
+            chunk_size=options['chunk_size'], wallet_ids=options['wallets']
+        ):
+            wallets += chunk_wallets
+            statements += chunk_statements
+            chunks += 1
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {statements} statements for {wallets} wallets in {chunks} chunks ({elapsed:.2f}s)'
+        ))
@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand
+from app.models import RecipientType
+from app.payouts import PayoutModule
+
+
+class Command(BaseCommand):
+    help = "Register drivers' phone numbers as Paystack transfer recipients ahead of their first withdrawal"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', default=RecipientType.MOBILE_MONEY, choices=RecipientType.values)
+        parser.add_argument('--bank-code', default='MPESA', help='Paystack bank or provider code')
+        parser.add_argument('--currency', default=None)
+        parser.add_argument('--batch-size', type=int, default=PayoutModule.RECIPIENT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        created = failed = batches = 0
+        for batch_created, batch_failed in PayoutModule.register_drivers(
+            type=options['type'], bank_code=options['bank_code'],
+            currency=options['currency'], batch_size=options['batch_size'],
+        ):
+            created += batch_created
+            failed += batch_failed
+            batches += 1
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Registered {created} recipients in {batches} requests, {failed} rejected ({elapsed:.2f}s)'
+        ))
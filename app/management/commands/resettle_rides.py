@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from app.settlement import SettlementModule
+
+
+class Command(BaseCommand):
+    help = 'Settle completed rides whose fare has not moved between wallets yet, one transaction per chunk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=SettlementModule.CHUNK_SIZE)
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many rides')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        settled = skipped = chunks = 0
+        for chunk_settled, chunk_skipped in SettlementModule.resettle(
+            chunk_size=options['chunk_size'], limit=options['limit']
+        ):
+            settled += chunk_settled
+            skipped += chunk_skipped
+            chunks += 1
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Settled {settled} rides in {chunks} chunks, {skipped} left for customers without funds ({elapsed:.2f}s)'
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from app.fakepaystack import FakePaystackServer
+
+
+class Command(BaseCommand):
+    help = 'Serve fake Paystack recipient and transfer endpoints locally (point PAYSTACK_BASE_URL at it)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=150.0, help='Delay per request')
+        parser.add_argument('--item-latency-ms', type=float, default=1.0, help='Extra delay per transfer in a request')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of transfers that fail')
+
+    def handle(self, *args, **options):
+        server = FakePaystackServer(
+            (options['host'], options['port']),
+            latency=options['latency_ms'] / 1000, item_latency=options['item_latency_ms'] / 1000,
+            failure_rate=options['failure_rate'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Fake Paystack listening on {server.base_url}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
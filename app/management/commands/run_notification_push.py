@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from app.notifications import NotificationModule
+
+
+class Command(BaseCommand):
+    help = 'Push pending notifications to NOTIFICATION_PUSH_URL, coalescing bursts per user and type'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds between flushes; bursts inside one interval are coalesced')
+        parser.add_argument('--batch-size', type=int, default=NotificationModule.PUSH_BATCH_SIZE)
+        parser.add_argument('--once', action='store_true', help='Flush once and exit')
+
+    def handle(self, *args, **options):
+        if not NotificationModule.PUSH_URL:
+            raise CommandError('NOTIFICATION_PUSH_URL is not configured')
+
+        while True:
+            started = time.perf_counter()
+            try:
+                rows, pushes = NotificationModule.flush_push(limit=options['batch_size'])
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f'Push failed, will retry: {e}'))
+                rows = pushes = 0
+            if rows:
+                self.stdout.write(self.style.SUCCESS(f'Handled {rows} notifications with {pushes} pushes'))
+            if options['once']:
+                break
+            # Drain a backlog without waiting; otherwise let the next burst accumulate
+            if rows < options['batch_size']:
+                time.sleep(max(0.0, options['interval'] - (time.perf_counter() - started)))
@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from app.payouts import PayoutModule
+
+
+class Command(BaseCommand):
+    help = 'Submit queued withdrawals as Paystack bulk transfers when enough are queued or on an interval'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PayoutModule.BATCH_SIZE)
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds between checks of the queue size')
+        parser.add_argument('--once', action='store_true', help='Flush once and exit')
+
+    def handle(self, *args, **options):
+        last_flush_at = None
+        while True:
+            if options['once'] or last_flush_at is None or PayoutModule.flush_due(last_flush_at):
+                last_flush_at = timezone.now()
+                self._flush(options['batch_size'])
+            if options['once']:
+                break
+            time.sleep(options['poll'])
+
+    def _flush(self, batch_size):
+        completed = pending = failed = requeued = batches = 0
+        for batch_completed, batch_pending, batch_failed, batch_requeued in PayoutModule.flush(batch_size=batch_size):
+            completed += batch_completed
+            pending += batch_pending
+            failed += batch_failed
+            requeued += batch_requeued
+            batches += 1
+        if batches:
+            style = self.style.WARNING if requeued else self.style.SUCCESS
+            self.stdout.write(style(
+                f'{batches} bulk transfers: {completed} completed, {pending} awaiting Paystack, '
+                f'{failed} failed and refunded, {requeued} left queued'
+            ))
@@ -0,0 +1,42 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from app.models import Ride
+from app.surge import SurgePricingModule
+
+
+class Command(BaseCommand):
+    help = 'Keep surge multipliers fresh by recomputing every active cell on a fixed interval'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=SurgePricingModule.REFRESH_SECONDS)
+        parser.add_argument('--once', action='store_true', help='Run a single refresh and exit')
+
+    def handle(self, *args, **options):
+        engine = SurgePricingModule.engine()
+
+        while True:
+            started = time.perf_counter()
+            self._seed_demand(engine)
+            cells = engine.recompute_active()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'Refreshed {cells} cells in {elapsed * 1000:.1f}ms')
+            if options['once']:
+                break
+            time.sleep(max(0.0, options['interval'] - elapsed))
+
+    def _seed_demand(self, engine):
+        """
+        Make this worker aware of the cells with ride requests inside the
+        window. Requests are recorded by the web workers, so this runs on
+        every tick to pick up cells that became active since the last one.
+        """
+        since = timezone.now() - timedelta(seconds=SurgePricingModule.WINDOW_SECONDS)
+        rides = Ride.objects.filter(
+            requested_at__gte=since,
+            pickup_latitude__isnull=False,
+            pickup_longitude__isnull=False,
+        ).values_list('pickup_latitude', 'pickup_longitude', 'requested_at')
+        for latitude, longitude, requested_at in rides.iterator():
+            engine.mark_active(latitude, longitude, at=requested_at.timestamp())
@@ -0,0 +1,43 @@
+import json
+import sys
+from django.core.management.base import BaseCommand
+from app.ledger import LedgerModule
+
+
+class Command(BaseCommand):
+    help = 'Recompute wallet balances from payments, escrow and ledger rows and write a repair plan for wallets that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=LedgerModule.WORKERS)
+        parser.add_argument('--chunk-size', type=int, default=LedgerModule.CHUNK_SIZE)
+        parser.add_argument('--output', default='-', help='File for the NDJSON repair plan, or - for stdout')
+
+    def handle(self, *args, **options):
+        report = LedgerModule.verify(workers=options['workers'], chunk_size=options['chunk_size'])
+
+        to_stdout = options['output'] == '-'
+        handle = sys.stdout if to_stdout else open(options['output'], 'w', encoding='utf-8')
+        try:
+            for repair in report['repairs']:
+                handle.write(json.dumps(repair) + '\n')
+        finally:
+            if not to_stdout:
+                handle.close()
+
+        # Keep stdout clean when the plan itself goes there
+        out = self.stderr if to_stdout else self.stdout
+        rows = sum(report['rows'].values())
+        for source, count in report['rows'].items():
+            out.write(f'{source}: {count} rows')
+        out.write(
+            f"Scanned {rows} rows in {report['scan_seconds']:.2f}s ({rows / max(report['scan_seconds'], 1e-9):.0f} rows/s) "
+            f"with {options['workers']} workers, checked {report['wallets']} wallets in {report['diff_seconds']:.2f}s"
+        )
+        if report['skipped']:
+            out.write(self.style.WARNING(f"{report['skipped']} rows named wallets created during the run"))
+        adjust = sum(1 for repair in report['repairs'] if repair['action'] == 'adjust')
+        create = len(report['repairs']) - adjust
+        style = self.style.WARNING if report['repairs'] else self.style.SUCCESS
+        out.write(style(
+            f"{adjust} wallets to adjust, {create} missing wallets ({report['seconds']:.2f}s total)"
+        ))
@@ -0,0 +1,230 @@
+import os
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Case, Count, Exists, F, Max, Min, OuterRef, Prefetch, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .notifications import NotificationModule
+from .models import (
+    Bid, BidStatus, Business, BusinessStatus, Parcel, Priority, MAXIMUM_WAITING_TIME_MINUTES
+)
+
+
+class MarketplaceModule:
+    """
+    Filters and facet counts for the business marketplace.
+
+    Every filter is a plain predicate on the business row (bid filters are
+    ``EXISTS`` subqueries), so result pages never need ``DISTINCT`` and the
+    composite ``(status, ...)`` indexes on Business can be used.
+    """
+
+    # Upper bounds of the delivery fee facet buckets; the last bucket is open ended
+    FEE_BUCKETS = [int(edge) for edge in os.getenv('MARKETPLACE_FEE_BUCKETS', '200,500,1000,2000').split(',')]
+    CLOSE_CHUNK_SIZE = int(os.getenv('MARKETPLACE_CLOSE_CHUNK_SIZE', '1000'))
+
+    # Bids that can still be awarded or rejected
+    OPEN_BID_STATUSES = [BidStatus.ACCEPTED, BidStatus.PENDING]
+
+    @staticmethod
+    def waiting_time_minutes(value):
+        """Accept a MaximumWaitingTime choice or a number of minutes."""
+        if value in MAXIMUM_WAITING_TIME_MINUTES:
+            return MAXIMUM_WAITING_TIME_MINUTES[value]
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _int_or_none(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def driver_bid_exists(driver, status):
+        return Exists(Bid.objects.filter(business=OuterRef('pk'), driver=driver, status=status))
+
+    @staticmethod
+    def _bid_aggregate(aggregate):
+        bids = Bid.objects.filter(business=OuterRef('pk')).order_by().values('business')
+        return Subquery(bids.annotate(value=aggregate).values('value'))
+
+    @classmethod
+    def listing_queryset(cls, queryset):
+        """
+        Prefetch plan for the nested BusinessSerializer: one query for the
+        page, one for its bids with their drivers, one for its parcels.
+        """
+        return queryset.prefetch_related(
+            Prefetch('bids', queryset=Bid.objects.select_related('driver').order_by('id')),
+            Prefetch('parcels', queryset=Parcel.objects.order_by('id')),
+        ).annotate(
+            awarded_bid_exists=Exists(Bid.objects.filter(business=OuterRef('pk'), status='AWARDED')),
+        )
+
+    @classmethod
+    def summary_queryset(cls, queryset):
+        """Bid and parcel figures as correlated aggregates, for BusinessSummarySerializer."""
+        parcels = Parcel.objects.filter(business=OuterRef('pk')).order_by().values('business')
+        return queryset.annotate(
+            awarded_bid_exists=Exists(Bid.objects.filter(business=OuterRef('pk'), status='AWARDED')),
+            bid_count=Coalesce(cls._bid_aggregate(Count('id')), Value(0)),
+            min_bid=cls._bid_aggregate(Min('bid_amount')),
+            max_bid=cls._bid_aggregate(Max('bid_amount')),
+            parcel_count=Coalesce(Subquery(parcels.annotate(value=Count('id')).values('value')), Value(0)),
+        )
+
+    @classmethod
+    def scope(cls, queryset, user, bid_status=None):
+        """Restrict the queryset to what the user may browse."""
+        if user.role == 'DRIVER':
+            if bid_status == 'ACCEPTED':
+                return queryset.filter(cls.driver_bid_exists(user, 'ACCEPTED'), status='AVAILABLE')
+            if bid_status == 'AWARDED':
+                return queryset.filter(
+                    cls.driver_bid_exists(user, 'AWARDED'),
+                    status__in=['AVAILABLE', 'AWARDED', 'COMPLETED'],
+                )
+            return queryset.filter(status='AVAILABLE')
+        if user.role == 'USER':
+            return queryset.filter(owner=user)
+        return queryset
+
+    @classmethod
+    def priority_filter(cls, params):
+        priority = params.getlist('priority')
+        return Q(priority__in=priority) if priority else Q()
+
+    @classmethod
+    def fee_filter(cls, params):
+        condition = Q()
+        fee_min = cls._int_or_none(params.get('delivery_fee_min'))
+        fee_max = cls._int_or_none(params.get('delivery_fee_max'))
+        if fee_min is not None:
+            condition &= Q(delivery_fee__gte=fee_min)
+        if fee_max is not None:
+            condition &= Q(delivery_fee__lte=fee_max)
+        return condition
+
+    @classmethod
+    def waiting_time_filter(cls, params):
+        minutes = cls.waiting_time_minutes(params.get('maximum_waiting_time'))
+        return Q(waiting_time_minutes__lte=minutes) if minutes is not None else Q()
+
+    @classmethod
+    def apply_filters(cls, queryset, params):
+        return queryset.filter(
+            cls.priority_filter(params), cls.fee_filter(params), cls.waiting_time_filter(params)
+        )
+
+    @classmethod
+    def fee_bucket_conditions(cls):
+        buckets = []
+        lower = 0
+        for upper in cls.FEE_BUCKETS:
+            buckets.append((f"{lower}-{upper - 1}", Q(delivery_fee__gte=lower, delivery_fee__lt=upper)))
+            lower = upper
+        buckets.append((f"{lower}+", Q(delivery_fee__gte=lower)))
+        return buckets
+
+    @classmethod
+    def facets(cls, queryset, params):
+        """
+        Counts per priority and per fee bucket in a single aggregate query.
+
+        Each facet ignores its own filter but applies the others, so the
+        counts show what selecting another option would return.
+        """
+        priority_condition = cls.priority_filter(params)
+        fee_condition = cls.fee_filter(params)
+        base = queryset.filter(cls.waiting_time_filter(params))
+
+        aggregates = {}
+        for value in Priority.values:
+            aggregates[f"priority_{value}"] = Count('id', filter=Q(priority=value) & fee_condition)
+        buckets = cls.fee_bucket_conditions()
+        for index, (label, condition) in enumerate(buckets):
+            aggregates[f"fee_{index}"] = Count('id', filter=condition & priority_condition)
+        counts = base.aggregate(**aggregates)
+
+        return {
+            'priority': {value: counts[f"priority_{value}"] for value in Priority.values},
+            'delivery_fee': [
+                {'bucket': label, 'count': counts[f"fee_{index}"]}
+                for index, (label, condition) in enumerate(buckets)
+            ],
+        }
+
+    # -------------------------------------------------
+    # State transitions
+    # -------------------------------------------------
+    @classmethod
+    def award_bid(cls, bid, owner):
+        """
+        Award ``bid`` and reject the other bids on its business.
+
+        The business row is claimed with one conditional update
+        (AVAILABLE -> AWARDED, only while the bid is still open), so of two
+        concurrent awards exactly one wins; the loser changes nothing and
+        gets False. The bids are then settled with one CASE update.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            claimed = Business.objects.filter(
+                Exists(Bid.objects.filter(pk=bid.pk, business=OuterRef('pk'), status__in=cls.OPEN_BID_STATUSES)),
+                pk=bid.business_id, owner=owner, status=BusinessStatus.AVAILABLE,
+            ).update(status=BusinessStatus.AWARDED, updated_at=now)
+            if not claimed:
+                return False
+            open_bids = Bid.objects.filter(business_id=bid.business_id, status__in=cls.OPEN_BID_STATUSES)
+            rejected = list(open_bids.exclude(pk=bid.pk).values_list('id', 'driver_id'))
+            open_bids.update(
+                status=Case(When(pk=bid.pk, then=Value(BidStatus.AWARDED)), default=Value(BidStatus.REJECTED)),
+                awarded_at=Case(When(pk=bid.pk, then=Value(now)), default=F('awarded_at')),
+                updated_at=now,
+            )
+            NotificationModule.bids_awarded(bid.business, bid, rejected)
+        return True
+
+    @classmethod
+    def expired_filter(cls, now=None):
+        """Open businesses whose waiting time has run out since publication."""
+        now = now or timezone.now()
+        condition = Q()
+        for minutes in sorted(set(MAXIMUM_WAITING_TIME_MINUTES.values())):
+            condition |= Q(waiting_time_minutes=minutes, published_at__lt=now - timedelta(minutes=minutes))
+        return Q(status=BusinessStatus.AVAILABLE, published_at__isnull=False) & condition
+
+    @classmethod
+    def close_expired(cls, now=None, chunk_size=None):
+        """
+        Expire timed-out businesses and reject their open bids, one chunk per
+        transaction. Each chunk locks its business rows (skipping rows another
+        transaction holds, e.g. an award in progress) and then issues one
+        update per table. Yields ``(businesses, bids)`` counts per chunk.
+        """
+        now = now or timezone.now()
+        chunk_size = chunk_size or cls.CLOSE_CHUNK_SIZE
+        expired = cls.expired_filter(now)
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                ids = list(
+                    Business.objects.select_for_update(skip_locked=True)
+                    .filter(expired, id__gt=last_id)
+                    .order_by('id')
+                    .values_list('id', flat=True)[:chunk_size]
+                )
+                if not ids:
+                    return
+                bids = Bid.objects.filter(business_id__in=ids, status__in=cls.OPEN_BID_STATUSES).update(
+                    status=BidStatus.REJECTED, updated_at=now
+                )
+                businesses = Business.objects.filter(id__in=ids).update(
+                    status=BusinessStatus.EXPIRED, updated_at=now
+                )
+            last_id = ids[-1]
+            yield businesses, bids
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:00
+
+from math import radians, cos
+from django.db import migrations, models
+
+
+def backfill_bounding_boxes(apps, schema_editor):
+    Geofence = apps.get_model('app', 'Geofence')
+    for geofence in Geofence.objects.exclude(coordinates='').filter(radius__isnull=False).iterator():
+        try:
+            center_lat, center_lng = map(float, geofence.coordinates.split(','))
+        except ValueError:
+            continue
+        lat_delta = geofence.radius / 111.0
+        lng_delta = geofence.radius / (111.0 * max(cos(radians(center_lat)), 0.01))
+        Geofence.objects.filter(pk=geofence.pk).update(
+            min_latitude=center_lat - lat_delta,
+            max_latitude=center_lat + lat_delta,
+            min_longitude=center_lng - lng_delta,
+            max_longitude=center_lng + lng_delta,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_ride_rating_ride_review_ride_reviewtags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geofence',
+            name='max_latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='geofence',
+            name='max_longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='geofence',
+            name='min_latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='geofence',
+            name='min_longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='geofence',
+            name='vertices',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='geofence',
+            name='coordinates',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='geofence',
+            name='radius',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_bounding_boxes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_geofence_polygons'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geofence',
+            name='fare_multiplier',
+            field=models.FloatField(default=1.0),
+        ),
+        migrations.AddField(
+            model_name='geofence',
+            name='zone_type',
+            field=models.CharField(choices=[('GENERAL', 'General'), ('SERVICE_AREA', 'Service Area'), ('PRICING_ZONE', 'Pricing Zone')], default='GENERAL', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='dropoff_zone_ids',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='pickup_zone_ids',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:02
+
+from django.db import migrations, models
+
+
+WAITING_TIME_MINUTES = {
+    'FIFTEEN_MINUTES': 15,
+    'THIRTY_MINUTES': 30,
+    'ONE_HOUR': 60,
+    'TWO_HOURS': 120,
+}
+
+
+def backfill_waiting_time_minutes(apps, schema_editor):
+    Business = apps.get_model('app', 'Business')
+    for choice, minutes in WAITING_TIME_MINUTES.items():
+        Business.objects.filter(maximum_waiting_time=choice).update(waiting_time_minutes=minutes)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_geofence_zones_ride_zone_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='business',
+            name='waiting_time_minutes',
+            field=models.PositiveSmallIntegerField(default=30),
+        ),
+        migrations.RunPython(backfill_waiting_time_minutes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['driver', 'status', 'business'], name='bid_driver_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='business',
+            index=models.Index(fields=['status', 'priority', 'id'], name='business_status_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='business',
+            index=models.Index(fields=['status', 'waiting_time_minutes'], name='business_status_waiting_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='business',
+            index=models.Index(fields=['status', 'delivery_fee'], name='business_status_fee_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:04
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_business_marketplace_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bid',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='bid',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_bid_timestamps'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bid',
+            name='status',
+            field=models.CharField(choices=[('ACCEPTED', 'Accepted'), ('PENDING', 'Pending'), ('AWARDED', 'Awarded'), ('REJECTED', 'Rejected'), ('CANCELLED', 'Cancelled')], default='ACCEPTED', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='business',
+            name='status',
+            field=models.CharField(choices=[('AVAILABLE', 'Available'), ('PENDING', 'Pending'), ('AWARDED', 'Awarded'), ('COMPLETED', 'Completed'), ('CANCELLED', 'Cancelled'), ('EXPIRED', 'Expired')], default='AVAILABLE', max_length=20),
+        ),
+    ]
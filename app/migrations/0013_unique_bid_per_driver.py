@@ -0,0 +1,37 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:06
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_bids(apps, schema_editor):
+    """Keep one bid per (business, driver): the awarded one if any, else the oldest."""
+    Bid = apps.get_model('app', 'Bid')
+    duplicates = (
+        Bid.objects.values('business_id', 'driver_id')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+    )
+    for group in duplicates.iterator():
+        bids = list(
+            Bid.objects.filter(business_id=group['business_id'], driver_id=group['driver_id'])
+            .order_by('id')
+            .values_list('id', 'status')
+        )
+        keep = next((bid_id for bid_id, status in bids if status == 'AWARDED'), bids[0][0])
+        Bid.objects.filter(id__in=[bid_id for bid_id, _ in bids if bid_id != keep]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_marketplace_award_statuses'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_bids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='bid',
+            constraint=models.UniqueConstraint(fields=('business', 'driver'), name='unique_bid_per_driver'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+from django.db.models import F
+
+
+def backfill_recorded_at(apps, schema_editor):
+    DeliveryStatus = apps.get_model('app', 'DeliveryStatus')
+    DeliveryStatus.objects.update(recorded_at=F('timestamp'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_unique_bid_per_driver'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliverystatus',
+            name='event_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliverystatus',
+            name='recorded_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(backfill_recorded_at, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='deliverystatus',
+            name='recorded_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='deliverystatus',
+            name='parcel',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='app.parcel'),
+        ),
+        migrations.AddIndex(
+            model_name='deliverystatus',
+            index=models.Index(fields=['parcel', 'recorded_at', 'id'], name='delivery_parcel_recorded_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='deliverystatus',
+            constraint=models.UniqueConstraint(fields=('parcel', 'event_id'), name='unique_parcel_event'),
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Max
+
+
+def backfill_conversations(apps, schema_editor):
+    """Group existing messages into conversations and seed the unread counters."""
+    ChatMessage = apps.get_model('app', 'ChatMessage')
+    Conversation = apps.get_model('app', 'Conversation')
+
+    conversations = {}
+    pairs = ChatMessage.objects.values('sender_id', 'receiver_id').annotate(last=Max('created_at'))
+    for pair in pairs.iterator():
+        key = tuple(sorted((pair['sender_id'], pair['receiver_id'])))
+        conversation = conversations.get(key)
+        if conversation is None:
+            conversation = conversations[key] = Conversation.objects.create(
+                user_low_id=key[0], user_high_id=key[1], last_message_at=pair['last']
+            )
+        elif pair['last'] > conversation.last_message_at:
+            conversation.last_message_at = pair['last']
+
+        ChatMessage.objects.filter(sender_id=pair['sender_id'], receiver_id=pair['receiver_id']).update(
+            conversation=conversation
+        )
+        unread = ChatMessage.objects.filter(
+            sender_id=pair['sender_id'], receiver_id=pair['receiver_id']
+        ).exclude(status__iexact='READ').count()
+        if pair['receiver_id'] == key[0]:
+            conversation.unread_low += unread
+        else:
+            conversation.unread_high += unread
+
+    for conversation in conversations.values():
+        last = ChatMessage.objects.filter(conversation=conversation).order_by('-id').first()
+        conversation.last_message_preview = last.message if last else ''
+        conversation.save()
+
+    # Free-text statuses become the SENT/READ choices
+    ChatMessage.objects.filter(status__iexact='READ').update(status='READ')
+    ChatMessage.objects.exclude(status='READ').update(status='SENT')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_parcel_tracking_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_low', models.PositiveIntegerField(default=0)),
+                ('unread_high', models.PositiveIntegerField(default=0)),
+                ('last_message_preview', models.CharField(blank=True, default='', max_length=255)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='status',
+            field=models.CharField(choices=[('SENT', 'Sent'), ('READ', 'Read')], default='SENT', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_high',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_low',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='conversation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='app.conversation'),
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['conversation', 'receiver', 'status', 'id'], name='chat_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user_low', 'last_message_at'], name='conversation_low_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user_high', 'last_message_at'], name='conversation_high_recent_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('user_low', 'user_high'), name='unique_conversation_pair'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:12
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def normalize_existing(apps, schema_editor):
+    """Map free-text statuses to UNREAD/READ and keep old rows away from the push worker."""
+    Notification = apps.get_model('app', 'Notification')
+    Notification.objects.filter(status__iexact='READ').update(status='READ')
+    Notification.objects.exclude(status='READ').update(status='UNREAD')
+    Notification.objects.update(pushed_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_chat_conversations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='data',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='pushed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='status',
+            field=models.CharField(choices=[('UNREAD', 'Unread'), ('READ', 'Read')], default='UNREAD', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='type',
+            field=models.CharField(choices=[('RIDE', 'Ride'), ('BID', 'Bid'), ('PAYMENT', 'Payment'), ('TICKET', 'Ticket')], max_length=255),
+        ),
+        migrations.RunPython(normalize_existing, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'status'], name='notification_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['pushed_at', 'id'], name='notification_push_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:17
+
+from django.db import migrations, models
+
+
+def drop_plaintext_codes(apps, schema_editor):
+    # Stored codes were plaintext and live for minutes; outstanding ones must be requested again
+    apps.get_model('app', 'OTP').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_notification_inbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_plaintext_codes, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='otp',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='otp',
+            name='purpose',
+            field=models.CharField(default='', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='otp',
+            name='contact_info',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='otp',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='otp',
+            name='otp_code',
+            field=models.CharField(max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(fields=['contact_info', 'purpose'], name='otp_contact_purpose_idx'),
+        ),
+    ]
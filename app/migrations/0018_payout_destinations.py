@@ -0,0 +1,33 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_otp_hashed_codes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayoutDestination',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('nuban', 'Bank Account'), ('mobile_money', 'Mobile Money')], default='nuban', max_length=20)),
+                ('account_number', models.CharField(max_length=50)),
+                ('bank_code', models.CharField(max_length=20)),
+                ('currency', models.CharField(max_length=3)),
+                ('name', models.CharField(blank=True, max_length=255, null=True)),
+                ('recipient_code', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payout_destinations', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='payoutdestination',
+            constraint=models.UniqueConstraint(fields=('user', 'type', 'account_number', 'bank_code'), name='unique_payout_destination'),
+        ),
+    ]
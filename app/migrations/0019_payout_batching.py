@@ -0,0 +1,28 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_payout_destinations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymenttransaction',
+            name='payout_destination',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='app.payoutdestination'),
+        ),
+        migrations.AddField(
+            model_name='paymenttransaction',
+            name='transfer_code',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='paymenttransaction',
+            index=models.Index(fields=['transaction_type', 'status', 'id'], name='payment_type_status_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0019_payout_batching'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymenttransaction',
+            name='ride',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payments', to='app.ride'),
+        ),
+        migrations.CreateModel(
+            name='CardAuthorization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('authorization_code', models.CharField(max_length=100)),
+                ('signature', models.CharField(max_length=100)),
+                ('email', models.EmailField(max_length=100)),
+                ('last4', models.CharField(max_length=4)),
+                ('exp_month', models.PositiveSmallIntegerField()),
+                ('exp_year', models.PositiveSmallIntegerField()),
+                ('brand', models.CharField(blank=True, max_length=50, null=True)),
+                ('bank', models.CharField(blank=True, max_length=100, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='card_authorizations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'is_active', '-updated_at'], name='card_user_active_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='cardauthorization',
+            constraint=models.UniqueConstraint(fields=('user', 'signature'), name='unique_card_per_user'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0020_card_authorizations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ride',
+            name='commission',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='settled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='ride',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='app.ride'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['status', 'settled_at', 'id'], name='ride_settlement_idx'),
+        ),
+    ]
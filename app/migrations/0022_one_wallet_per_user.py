@@ -0,0 +1,45 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def merge_duplicate_wallets(apps, schema_editor):
+    """Fold every extra wallet of a user into their oldest one."""
+    Wallet = apps.get_model('app', 'Wallet')
+    Transaction = apps.get_model('app', 'Transaction')
+    duplicated = (
+        Wallet.objects.values('user_id').annotate(count=models.Count('id')).filter(count__gt=1)
+        .values_list('user_id', flat=True)
+    )
+    for user_id in list(duplicated):
+        keeper, *extras = Wallet.objects.filter(user_id=user_id).order_by('id')
+        extra_ids = [wallet.id for wallet in extras]
+        totals = Wallet.objects.filter(id__in=extra_ids).aggregate(
+            active=models.Sum('active_balance'), transactional=models.Sum('transactional_balance')
+        )
+        Wallet.objects.filter(id=keeper.id).update(
+            active_balance=models.F('active_balance') + (totals['active'] or 0),
+            transactional_balance=models.F('transactional_balance') + (totals['transactional'] or 0),
+        )
+        # Keep the ledger: point entries at the surviving wallet before the extras are deleted
+        Transaction.objects.filter(from_wallet_id__in=extra_ids).update(from_wallet_id=keeper.id)
+        Transaction.objects.filter(to_wallet_id__in=extra_ids).update(to_wallet_id=keeper.id)
+        Wallet.objects.filter(id__in=extra_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0021_ride_settlement'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_wallets, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='wallet',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='wallet', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0022_one_wallet_per_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paymenttransaction',
+            index=models.Index(fields=['user', 'created_at'], name='payment_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymenttransaction',
+            index=models.Index(fields=['created_at'], name='payment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['customer', 'created_at'], name='ride_customer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['driver', 'created_at'], name='ride_driver_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['created_at'], name='ride_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionalwallet',
+            index=models.Index(fields=['from_user', 'created_at'], name='escrow_from_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionalwallet',
+            index=models.Index(fields=['to_user', 'created_at'], name='escrow_to_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionalwallet',
+            index=models.Index(fields=['created_at'], name='escrow_created_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.20 on 2026-10-19 17:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0023_history_export_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletStatement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('opening_balance', models.IntegerField(default=0)),
+                ('credits', models.IntegerField(default=0)),
+                ('debits', models.IntegerField(default=0)),
+                ('closing_balance', models.IntegerField(default=0)),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statements', to='app.wallet')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='walletstatement',
+            constraint=models.UniqueConstraint(fields=('wallet', 'month'), name='unique_wallet_statement_month'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.20 on 2026-10-19 18:20
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def backfill_last_message_at(apps, schema_editor):
+    """Conversations without messages sort by when they were opened."""
+    Conversation = apps.get_model('app', 'Conversation')
+    Conversation.objects.filter(last_message_at__isnull=True).update(last_message_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0025_user_token_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_last_message_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
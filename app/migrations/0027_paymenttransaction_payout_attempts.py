@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-19 18:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0026_conversation_last_message_at_not_null'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymenttransaction',
+            name='payout_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -1,9 +1,9 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils import timezone
-import hashlib
-from datetime import datetime
+from math import radians, cos
 from django.contrib.auth.hashers import make_password, check_password
+from .idgen import IdGenerationModule
 
 # Enum replacements as choices
 class MaximumWaitingTime(models.TextChoices):
@@ -12,6 +12,14 @@ class MaximumWaitingTime(models.TextChoices):
     ONE_HOUR = 'ONE_HOUR', 'One Hour'
     TWO_HOURS = 'TWO_HOURS', 'Two Hours'
 
+# Ordinal value of each waiting time, used for range filters
+MAXIMUM_WAITING_TIME_MINUTES = {
+    MaximumWaitingTime.FIFTEEN_MINUTES: 15,
+    MaximumWaitingTime.THIRTY_MINUTES: 30,
+    MaximumWaitingTime.ONE_HOUR: 60,
+    MaximumWaitingTime.TWO_HOURS: 120,
+}
+
 class Priority(models.TextChoices):
     LOW = 'LOW', 'Low'
     MEDIUM = 'MEDIUM', 'Medium'
@@ -20,8 +28,10 @@ class Priority(models.TextChoices):
 class BusinessStatus(models.TextChoices):
     AVAILABLE = 'AVAILABLE', 'Available'
     PENDING = 'PENDING', 'Pending'
+    AWARDED = 'AWARDED', 'Awarded'
     COMPLETED = 'COMPLETED', 'Completed'
     CANCELLED = 'CANCELLED', 'Cancelled'
+    EXPIRED = 'EXPIRED', 'Expired'
 
 class DeliveryStatus(models.TextChoices):
     PENDING = 'PENDING', 'Pending'
@@ -33,6 +43,7 @@ class DeliveryStatus(models.TextChoices):
 class BidStatus(models.TextChoices):
     ACCEPTED = 'ACCEPTED', 'Accepted'
     PENDING = 'PENDING', 'Pending'
+    AWARDED = 'AWARDED', 'Awarded'
     REJECTED = 'REJECTED', 'Rejected'
     CANCELLED = 'CANCELLED', 'Cancelled'
 
@@ -54,6 +65,36 @@ class UserRole(models.TextChoices):
     USER = 'USER', 'User'
     DRIVER = 'DRIVER', 'Driver'
     BUSINESS = 'BUSINESS', 'Business'
+
+class ChatMessageStatus(models.TextChoices):
+    SENT = 'SENT', 'Sent'
+    READ = 'READ', 'Read'
+
+class NotificationStatus(models.TextChoices):
+    UNREAD = 'UNREAD', 'Unread'
+    READ = 'READ', 'Read'
+
+class NotificationType(models.TextChoices):
+    RIDE = 'RIDE', 'Ride'
+    BID = 'BID', 'Bid'
+    PAYMENT = 'PAYMENT', 'Payment'
+    TICKET = 'TICKET', 'Ticket'
+
+class GeofenceZoneType(models.TextChoices):
+    GENERAL = 'GENERAL', 'General'
+    SERVICE_AREA = 'SERVICE_AREA', 'Service Area'
+    PRICING_ZONE = 'PRICING_ZONE', 'Pricing Zone'
+
+class WithdrawalStatus(models.TextChoices):
+    PENDING = 'PENDING', 'Pending'
+    QUEUED = 'QUEUED', 'Queued'
+    PROCESSING = 'PROCESSING', 'Processing'
+    COMPLETED = 'COMPLETED', 'Completed'
+    FAILED = 'FAILED', 'Failed'
+
+class RecipientType(models.TextChoices):
+    NUBAN = 'nuban', 'Bank Account'
+    MOBILE_MONEY = 'mobile_money', 'Mobile Money'
     
 # Models
 
@@ -70,6 +111,7 @@ class User(AbstractUser):
     is_completed = models.BooleanField(default=False)
     last_active = models.DateTimeField(default=timezone.now)
     role = models.CharField(max_length=20, choices=UserRole.choices, default=UserRole.USER)
+    token_version = models.PositiveIntegerField(default=0)  # Bumped when claims in issued tokens go stale
     # Fields already provided by AbstractUser:
     # password
     # last_login
@@ -94,6 +136,25 @@ class User(AbstractUser):
         """Return the updated_at date as a formatted string."""
         return self.last_active.strftime("%Y-%m-%d %H:%M:%S") if self.last_active else ""
 
+    def refresh_from_db(self, using=None, fields=None):
+        # Users built from token claims load all their other fields on first use
+        if getattr(self, '_from_claims', False) and fields is not None:
+            fields = list(self.get_deferred_fields()) or fields
+            self._from_claims = False
+        super().refresh_from_db(using, fields)
+
+    def save(self, *args, **kwargs):
+        # Token claims may be older than the row; only write them back when they were changed
+        claims = getattr(self, '_claims', None)
+        if claims and kwargs.get('update_fields') is None and not args and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred
+                and not (field.attname in claims and getattr(self, field.attname) == claims[field.attname])
+            ]
+        super().save(*args, **kwargs)
+
     def verify_password(self, password: str) -> bool:
         """Verify password using Django's built-in password hasher."""
         return check_password(password, self.password)
@@ -215,6 +276,7 @@ class Business(models.Model):
     priority = models.CharField(max_length=10, choices=Priority.choices, default=Priority.LOW)
     maximum_waiting_time = models.CharField(max_length=20, choices=MaximumWaitingTime.choices, 
                                            default=MaximumWaitingTime.THIRTY_MINUTES)
+    waiting_time_minutes = models.PositiveSmallIntegerField(default=30)  # Mirrors maximum_waiting_time
     pickup_point = models.CharField(max_length=255)
     delivery_fee = models.IntegerField()
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -224,6 +286,13 @@ class Business(models.Model):
     published_at = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=BusinessStatus.choices, default=BusinessStatus.AVAILABLE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'priority', 'id'], name='business_status_priority_idx'),
+            models.Index(fields=['status', 'waiting_time_minutes'], name='business_status_waiting_idx'),
+            models.Index(fields=['status', 'delivery_fee'], name='business_status_fee_idx'),
+        ]
+
     @property
     def formatted_created_at(self):
         """Return the created_at date as a formatted string."""
@@ -232,26 +301,20 @@ class Business(models.Model):
     @property
     def has_awarded_bid(self):
         """Check if any bid has been awarded."""
-        return self.bid_set.filter(awarded_at__isnull=False).exists()
+        if hasattr(self, 'awarded_bid_exists'):
+            # Annotated by MarketplaceModule.listing_queryset
+            return self.awarded_bid_exists
+        return self.bids.filter(status='AWARDED').exists()
 
     @staticmethod
-    def generate_business_code(owner_id):
-        # Get the current timestamp
-        timestamp = int(datetime.now().timestamp())
-        
-        # Create a unique string by combining the timestamp and owner_id
-        unique_string = f"{timestamp}{owner_id}"
-        
-        # Generate a hash of the unique string
-        hash_object = hashlib.sha256(unique_string.encode())
-        hash_hex = hash_object.hexdigest()
-        
-        # Take the first 12 characters of the hash and convert to alphanumeric
-        alphanumeric_code = ''.join(c for c in hash_hex if c.isalnum())[:12]
-        
-        return alphanumeric_code
+    def generate_business_code(owner_id=None):
+        """12-character time/node/sequence code; unique without a database lookup."""
+        return IdGenerationModule.next_code()
 
     def save(self, *args, **kwargs):
+        if not self.new_business_code:
+            self.new_business_code = self.generate_business_code(self.owner_id)
+        self.waiting_time_minutes = MAXIMUM_WAITING_TIME_MINUTES.get(self.maximum_waiting_time, self.waiting_time_minutes)
         if self.published and not self.published_at:
             self.published_at = timezone.now()
         elif not self.published:
@@ -300,18 +363,62 @@ class Bid(models.Model):
     cancel_reason = models.CharField(max_length=255, null=True, blank=True)
     cancelled_at = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=BidStatus.choices, default=BidStatus.ACCEPTED)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['business', 'driver'], name='unique_bid_per_driver'),
+        ]
+        indexes = [
+            models.Index(fields=['driver', 'status', 'business'], name='bid_driver_status_idx'),
+        ]
 
     def __str__(self):
         return f"<Bid(id={self.id}, business_id={self.business.id})>"
 
+class Conversation(models.Model):
+    """A pair of users; user_low is always the lower user id. Unread counters are per side."""
+    user_low = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    user_high = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    unread_low = models.PositiveIntegerField(default=0)
+    unread_high = models.PositiveIntegerField(default=0)
+    last_message_preview = models.CharField(max_length=255, blank=True, default='')
+    last_message_at = models.DateTimeField(default=timezone.now)  # Creation time until the first message
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='unique_conversation_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['user_low', 'last_message_at'], name='conversation_low_recent_idx'),
+            models.Index(fields=['user_high', 'last_message_at'], name='conversation_high_recent_idx'),
+        ]
+
+    def other_user_id(self, user_id):
+        return self.user_high_id if user_id == self.user_low_id else self.user_low_id
+
+    def unread_for(self, user_id):
+        return self.unread_low if user_id == self.user_low_id else self.unread_high
+
+    def __str__(self):
+        return f"<Conversation(id={self.id}, user_low_id={self.user_low_id}, user_high_id={self.user_high_id})>"
+
 class ChatMessage(models.Model):
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, null=True, blank=True, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
     message = models.CharField(max_length=255)
-    status = models.CharField(max_length=255)
+    status = models.CharField(max_length=255, choices=ChatMessageStatus.choices, default=ChatMessageStatus.SENT)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', 'receiver', 'status', 'id'], name='chat_unread_idx'),
+        ]
+
     def __str__(self):
         return f"<ChatMessage(id={self.id}, sender_id={self.sender.id}, receiver_id={self.receiver.id})>"
 
@@ -338,10 +445,22 @@ class CompanyUser(models.Model):
         return f"<CompanyUser(id={self.id}, company_id={self.company.id}, user_id={self.user.id})>"
 
 class DeliveryStatus(models.Model):
-    parcel = models.ForeignKey(Parcel, on_delete=models.CASCADE)
+    """Append-only parcel tracking event; written through ParcelTrackingModule."""
+    parcel = models.ForeignKey(Parcel, on_delete=models.CASCADE, related_name='status_events')
     status = models.CharField(max_length=255)
     timestamp = models.DateTimeField(auto_now_add=True)
     location = models.CharField(max_length=255, null=True, blank=True)
+    recorded_at = models.DateTimeField(default=timezone.now)  # When the courier app captured the event
+    recorded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    event_id = models.CharField(max_length=64, null=True, blank=True)  # Client key so retried uploads are ignored
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['parcel', 'event_id'], name='unique_parcel_event'),
+        ]
+        indexes = [
+            models.Index(fields=['parcel', 'recorded_at', 'id'], name='delivery_parcel_recorded_idx'),
+        ]
 
     def __str__(self):
         return f"<DeliveryStatus(id={self.id}, parcel_id={self.parcel.id})>"
@@ -379,35 +498,81 @@ class Feedback(models.Model):
 
 class Geofence(models.Model):
     name = models.CharField(max_length=255)
-    coordinates = models.CharField(max_length=255)
-    radius = models.FloatField()
+    zone_type = models.CharField(max_length=20, choices=GeofenceZoneType.choices, default=GeofenceZoneType.GENERAL)
+    fare_multiplier = models.FloatField(default=1.0)  # Applied to fares of trips touching a pricing zone
+    coordinates = models.CharField(max_length=255, blank=True, default='')  # "lat,lng" centre of a circular fence
+    radius = models.FloatField(null=True, blank=True)  # Circular fence radius in kilometers
+    vertices = models.JSONField(null=True, blank=True)  # Polygon rings: [[[lat, lng], ...], ...]
+    min_latitude = models.FloatField(null=True, blank=True)
+    max_latitude = models.FloatField(null=True, blank=True)
+    min_longitude = models.FloatField(null=True, blank=True)
+    max_longitude = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    @property
+    def is_polygon(self):
+        return bool(self.vertices)
+
+    def compute_bounding_box(self):
+        """Set the min/max latitude/longitude fields from the polygon rings or the circle."""
+        if self.vertices:
+            points = [point for ring in self.vertices for point in ring]
+            latitudes = [float(point[0]) for point in points]
+            longitudes = [float(point[1]) for point in points]
+            self.min_latitude, self.max_latitude = min(latitudes), max(latitudes)
+            self.min_longitude, self.max_longitude = min(longitudes), max(longitudes)
+        elif self.coordinates and self.radius:
+            center_lat, center_lng = map(float, self.coordinates.split(','))
+            lat_delta = self.radius / 111.0
+            lng_delta = self.radius / (111.0 * max(cos(radians(center_lat)), 0.01))
+            self.min_latitude, self.max_latitude = center_lat - lat_delta, center_lat + lat_delta
+            self.min_longitude, self.max_longitude = center_lng - lng_delta, center_lng + lng_delta
+
+    def save(self, *args, **kwargs):
+        self.compute_bounding_box()
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"<Geofence(id={self.id}, name={self.name})>"
 
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     message = models.CharField(max_length=255)
-    type = models.CharField(max_length=255)
-    status = models.CharField(max_length=255)
+    type = models.CharField(max_length=255, choices=NotificationType.choices)
+    status = models.CharField(max_length=255, choices=NotificationStatus.choices, default=NotificationStatus.UNREAD)
+    data = models.JSONField(null=True, blank=True)  # Ids of the ride, bid, payment or ticket concerned
+    pushed_at = models.DateTimeField(null=True, blank=True)  # Set once the push worker has handled it
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status'], name='notification_user_status_idx'),
+            models.Index(fields=['pushed_at', 'id'], name='notification_push_idx'),
+        ]
+
     def __str__(self):
         return f"<Notification(id={self.id}, user_id={self.user.id})>"
 
 class OTP(models.Model):
-    contact_info = models.CharField(max_length=255, db_index=True)  # Email or phone number
-    otp_code = models.CharField(max_length=10, db_index=True)  # The OTP code
+    contact_info = models.CharField(max_length=255)  # Email or phone number
+    purpose = models.CharField(max_length=20, default='')  # What the code unlocks, see otp.OTPPurpose
+    otp_code = models.CharField(max_length=64)  # HMAC of the code, see otp.hash_code
+    attempts = models.PositiveSmallIntegerField(default=0)  # Failed verifications so far
     created_at = models.DateTimeField(default=timezone.now)  # Timestamp of when the OTP was created
-    expires_at = models.DateTimeField()  # Timestamp of when the OTP expires
+    expires_at = models.DateTimeField(db_index=True)  # Timestamp of when the OTP expires
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['contact_info', 'purpose'], name='otp_contact_purpose_idx'),
+        ]
 
     def to_dict(self):
         return {
             "id": self.id,
             "contact_info": self.contact_info,
+            "purpose": self.purpose,
             "otp_code": self.otp_code,
             "created_at": self.created_at,
             "expires_at": self.expires_at,
@@ -419,12 +584,72 @@ class PaymentTransaction(models.Model):
     transaction_type = models.CharField(max_length=255)
     transaction_reference = models.CharField(max_length=255, unique=True, null=True, blank=True)
     status = models.CharField(max_length=255)
+    # Withdrawals: where the money goes and Paystack's code for the transfer
+    payout_destination = models.ForeignKey('PayoutDestination', on_delete=models.SET_NULL, null=True, blank=True)
+    transfer_code = models.CharField(max_length=64, null=True, blank=True)
+    payout_attempts = models.PositiveSmallIntegerField(default=0)  # Bulk transfer requests lost in transit
+    # Ride charges: the ride paid for
+    ride = models.ForeignKey('Ride', on_delete=models.SET_NULL, null=True, blank=True, related_name='payments')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['transaction_type', 'status', 'id'], name='payment_type_status_idx'),
+            models.Index(fields=['user', 'created_at'], name='payment_user_created_idx'),
+            models.Index(fields=['created_at'], name='payment_created_idx'),
+        ]
+
     def __str__(self):
         return f"<PaymentTransaction(id={self.id}, user_id={self.user.id})>"
 
+class CardAuthorization(models.Model):
+    """A reusable Paystack card authorization captured from a successful payment."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='card_authorizations')
+    authorization_code = models.CharField(max_length=100)
+    signature = models.CharField(max_length=100)  # Identifies the card across authorizations
+    email = models.EmailField(max_length=100)  # Charges must use the email the card was authorized with
+    last4 = models.CharField(max_length=4)
+    exp_month = models.PositiveSmallIntegerField()
+    exp_year = models.PositiveSmallIntegerField()
+    brand = models.CharField(max_length=50, null=True, blank=True)
+    bank = models.CharField(max_length=100, null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'signature'], name='unique_card_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'is_active', '-updated_at'], name='card_user_active_idx'),
+        ]
+
+    def __str__(self):
+        return f"<CardAuthorization(id={self.id}, user_id={self.user_id}, last4={self.last4})>"
+
+class PayoutDestination(models.Model):
+    """A bank or mobile money account registered with Paystack as a transfer recipient."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payout_destinations')
+    type = models.CharField(max_length=20, choices=RecipientType.choices, default=RecipientType.NUBAN)
+    account_number = models.CharField(max_length=50)
+    bank_code = models.CharField(max_length=20)
+    currency = models.CharField(max_length=3)
+    name = models.CharField(max_length=255, null=True, blank=True)
+    recipient_code = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'type', 'account_number', 'bank_code'], name='unique_payout_destination'
+            ),
+        ]
+
+    def __str__(self):
+        return f"<PayoutDestination(id={self.id}, user_id={self.user_id}, recipient_code={self.recipient_code})>"
+
 class Ticket(models.Model):
     raised_by = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=255)
@@ -448,7 +673,7 @@ class TicketCategory(models.Model):
         return f"<TicketCategory(id={self.id}, name={self.name})>"
 
 class Wallet(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='wallet')
     active_balance = models.IntegerField(default=0)
     transactional_balance = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -457,6 +682,25 @@ class Wallet(models.Model):
     def __str__(self):
         return f"<Wallet(id={self.id}, user_id={self.user.id})>"
 
+class WalletStatement(models.Model):
+    """Monthly rollup of a wallet's settled payment transactions."""
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='statements')
+    month = models.DateField()  # First day of the month
+    opening_balance = models.IntegerField(default=0)
+    credits = models.IntegerField(default=0)
+    debits = models.IntegerField(default=0)
+    closing_balance = models.IntegerField(default=0)
+    transaction_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'month'], name='unique_wallet_statement_month'),
+        ]
+
+    def __str__(self):
+        return f"<WalletStatement(wallet_id={self.wallet_id}, month={self.month})>"
+
 class Transaction(models.Model):
     from_wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='transactions_sent')
     to_wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='transactions_received')
@@ -466,6 +710,7 @@ class Transaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     scheduled_release_date = models.DateTimeField(null=True, blank=True)
+    ride = models.ForeignKey('Ride', on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries')
 
     def __str__(self):
         return f"<Transaction(id={self.id})>"
@@ -480,6 +725,13 @@ class TransactionalWallet(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     scheduled_release_date = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['from_user', 'created_at'], name='escrow_from_created_idx'),
+            models.Index(fields=['to_user', 'created_at'], name='escrow_to_created_idx'),
+            models.Index(fields=['created_at'], name='escrow_created_idx'),
+        ]
+
     def __str__(self):
         return f"<TransactionalWallet(id={self.id})>"
 
@@ -511,6 +763,18 @@ class Ride(models.Model):
     rating = models.IntegerField(null=True, blank=True)
     review = models.TextField(null=True, blank=True)
     reviewTags = models.JSONField(null=True, blank=True)
+    pickup_zone_ids = models.JSONField(null=True, blank=True)  # Geofences containing the pickup point
+    dropoff_zone_ids = models.JSONField(null=True, blank=True)  # Geofences containing the dropoff point
+    commission = models.IntegerField(null=True, blank=True)  # Platform share of the fare, set on settlement
+    settled_at = models.DateTimeField(null=True, blank=True)  # When the fare moved between wallets
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'settled_at', 'id'], name='ride_settlement_idx'),
+            models.Index(fields=['customer', 'created_at'], name='ride_customer_created_idx'),
+            models.Index(fields=['driver', 'created_at'], name='ride_driver_created_idx'),
+            models.Index(fields=['created_at'], name='ride_created_idx'),
+        ]
 
     @property
     def formatted_requested_at(self):
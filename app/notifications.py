@@ -0,0 +1,204 @@
+import os
+from collections import Counter, OrderedDict
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+import requests
+from .models import Notification, NotificationStatus, NotificationType
+from .realtime import RealtimeModule
+
+
+class NotificationModule:
+    """
+    Writes notifications in bulk, keeps each user's unread count in the cache
+    and pushes pending notifications to an external push gateway.
+
+    The cached count is filled from the database on first read and then
+    moved by increments after each committed write; reads that change the
+    count simply drop it.
+    """
+
+    UNREAD_KEY = 'notifications:unread:{}'
+    UNREAD_TTL = int(os.getenv('NOTIFICATION_UNREAD_TTL', '3600'))
+
+    PUSH_URL = os.getenv('NOTIFICATION_PUSH_URL')
+    PUSH_TIMEOUT = int(os.getenv('NOTIFICATION_PUSH_TIMEOUT', '10'))
+    PUSH_BATCH_SIZE = int(os.getenv('NOTIFICATION_PUSH_BATCH_SIZE', '1000'))
+    # This many notifications of one type for one user in a flush become one summary push
+    COALESCE_THRESHOLD = int(os.getenv('NOTIFICATION_COALESCE_THRESHOLD', '3'))
+
+    SUMMARY_LABELS = {
+        NotificationType.RIDE: 'ride updates',
+        NotificationType.BID: 'bid updates',
+        NotificationType.PAYMENT: 'payment updates',
+        NotificationType.TICKET: 'ticket updates',
+    }
+
+    RIDE_MESSAGES = {
+        'ACCEPTED': 'Your ride has been accepted by a driver',
+        'DRIVER_ARRIVED': 'Your driver has arrived at the pickup point',
+        'IN_PROGRESS': 'Your ride has started',
+        'COMPLETED': 'Your ride is complete',
+        'CANCELLED': 'Your ride has been cancelled',
+    }
+
+    # -------------------------------------------------
+    # Writing
+    # -------------------------------------------------
+    @classmethod
+    def notify_many(cls, entries):
+        """
+        Create notifications for ``(user_id, type, message, data)`` entries
+        with one bulk insert. Cached counters and real-time events are
+        updated once the surrounding transaction commits.
+        """
+        rows = [
+            Notification(user_id=user_id, type=kind, message=message[:255], data=data,
+                         status=NotificationStatus.UNREAD)
+            for user_id, kind, message, data in entries
+        ]
+        if not rows:
+            return 0
+        Notification.objects.bulk_create(rows, batch_size=cls.PUSH_BATCH_SIZE)
+
+        counts = Counter(row.user_id for row in rows)
+        events = [(row.user_id, {'type': row.type, 'message': row.message, 'data': row.data}) for row in rows]
+
+        def publish():
+            for user_id, count in counts.items():
+                try:
+                    cache.incr(cls.UNREAD_KEY.format(user_id), count)
+                except ValueError:
+                    pass  # Not cached yet; the next read counts from the database
+            for user_id, payload in events:
+                RealtimeModule.publish(user_id, 'notification', payload)
+
+        transaction.on_commit(publish)
+        return len(rows)
+
+    @classmethod
+    def notify(cls, user_id, kind, message, data=None):
+        return cls.notify_many([(user_id, kind, message, data)])
+
+    @classmethod
+    def ride_status_changed(cls, ride, actor):
+        """Tell the other party of the ride about its new status."""
+        message = cls.RIDE_MESSAGES.get(ride.status)
+        if not message:
+            return 0
+        recipients = {ride.customer_id, ride.driver_id} - {actor.id, None}
+        data = {'ride': ride.id, 'status': ride.status}
+        return cls.notify_many([(user_id, NotificationType.RIDE, message, data) for user_id in recipients])
+
+    @classmethod
+    def bids_awarded(cls, business, winner_bid, rejected):
+        """``rejected`` is a list of ``(bid_id, driver_id)`` pairs."""
+        code = business.new_business_code
+        entries = [(winner_bid.driver_id, NotificationType.BID, f"Your bid on {code} has been awarded",
+                    {'bid': winner_bid.id, 'business': business.id, 'status': 'AWARDED'})]
+        entries += [
+            (driver_id, NotificationType.BID, f"Your bid on {code} was not selected",
+             {'bid': bid_id, 'business': business.id, 'status': 'REJECTED'})
+            for bid_id, driver_id in rejected
+        ]
+        return cls.notify_many(entries)
+
+    @classmethod
+    def payment_result(cls, payment_transaction, succeeded):
+        message = (
+            f"Your payment of {payment_transaction.amount} was received"
+            if succeeded else f"Your payment of {payment_transaction.amount} could not be verified"
+        )
+        data = {'payment': payment_transaction.id, 'status': 'SUCCESS' if succeeded else 'FAILED'}
+        return cls.notify(payment_transaction.user_id, NotificationType.PAYMENT, message, data)
+
+    @classmethod
+    def ticket_updated(cls, ticket):
+        message = f"Your ticket \"{ticket.title}\" is now {ticket.status}"
+        return cls.notify(ticket.raised_by_id, NotificationType.TICKET, message,
+                          {'ticket': ticket.id, 'status': ticket.status})
+
+    # -------------------------------------------------
+    # Reading
+    # -------------------------------------------------
+    @staticmethod
+    def inbox(user):
+        return Notification.objects.filter(user=user)
+
+    @classmethod
+    def unread_count(cls, user_id):
+        key = cls.UNREAD_KEY.format(user_id)
+        count = cache.get(key)
+        if count is None:
+            count = Notification.objects.filter(user_id=user_id, status=NotificationStatus.UNREAD).count()
+            cache.add(key, count, cls.UNREAD_TTL)
+        return count
+
+    @classmethod
+    def mark_read(cls, user, ids=None, up_to=None):
+        """Mark some (by id or up to an id) or all of the user's notifications as read."""
+        notifications = Notification.objects.filter(user=user, status=NotificationStatus.UNREAD)
+        if ids:
+            notifications = notifications.filter(id__in=ids)
+        if up_to:
+            notifications = notifications.filter(id__lte=up_to)
+        marked = notifications.update(status=NotificationStatus.READ, updated_at=timezone.now())
+        if marked:
+            key = cls.UNREAD_KEY.format(user.id)
+            transaction.on_commit(lambda: cache.delete(key))
+        return marked
+
+    # -------------------------------------------------
+    # Push delivery
+    # -------------------------------------------------
+    @classmethod
+    def coalesce(cls, rows):
+        """
+        Group pending rows by (user, type). Groups at or above the threshold
+        become a single summary push; smaller groups are pushed one by one.
+        """
+        groups = OrderedDict()
+        for row in rows:
+            groups.setdefault((row['user_id'], row['type']), []).append(row)
+
+        pushes = []
+        for (user_id, kind), items in groups.items():
+            if len(items) >= cls.COALESCE_THRESHOLD:
+                label = cls.SUMMARY_LABELS.get(kind, 'notifications')
+                pushes.append({
+                    'user': user_id, 'type': kind, 'count': len(items),
+                    'message': f"You have {len(items)} new {label}",
+                })
+            else:
+                pushes.extend(
+                    {'user': user_id, 'type': kind, 'count': 1, 'message': item['message'], 'data': item['data']}
+                    for item in items
+                )
+        return pushes
+
+    @classmethod
+    def send_push(cls, pushes):
+        response = requests.post(cls.PUSH_URL, json={'notifications': pushes}, timeout=cls.PUSH_TIMEOUT)
+        response.raise_for_status()
+
+    @classmethod
+    def flush_push(cls, send=None, limit=None):
+        """
+        Push everything not yet pushed, oldest first, in one gateway request.
+        Rows read in the meantime are marked without being pushed. Returns
+        ``(rows_handled, pushes_sent)``; nothing is marked if sending fails.
+        """
+        send = send or cls.send_push
+        rows = list(
+            Notification.objects.filter(pushed_at__isnull=True)
+            .order_by('id')
+            .values('id', 'user_id', 'type', 'message', 'data', 'status')[:limit or cls.PUSH_BATCH_SIZE]
+        )
+        if not rows:
+            return 0, 0
+
+        pushes = cls.coalesce([row for row in rows if row['status'] == NotificationStatus.UNREAD])
+        if pushes:
+            send(pushes)
+        Notification.objects.filter(id__in=[row['id'] for row in rows]).update(pushed_at=timezone.now())
+        return len(rows), len(pushes)
@@ -0,0 +1,195 @@
+import hashlib
+import hmac
+import os
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import OTP
+from .utils import generate_verification_code
+
+
+class OTPPurpose:
+    REGISTRATION = 'REGISTRATION'
+    PASSWORD_RESET = 'PASSWORD_RESET'
+
+
+class OTPRateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Too many verification codes requested")
+        self.retry_after = retry_after
+
+
+def hash_code(contact, purpose, code):
+    """Codes are stored only as an HMAC bound to the contact and purpose."""
+    message = f'{purpose}:{contact}:{code}'.encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def contact_key(contact, purpose):
+    return hashlib.sha256(f'{purpose}:{contact}'.encode()).hexdigest()[:32]
+
+
+class CacheOTPBackend:
+    """
+    One cache entry per contact and purpose, expiring with the code. Failed
+    attempts are counted in a separate counter so concurrent guesses cannot
+    overwrite each other; the code is dropped once the limit is reached.
+    """
+
+    CODE_KEY = 'otp:code:{}'
+    ATTEMPTS_KEY = 'otp:attempts:{}'
+
+    def store(self, contact, purpose, code, ttl):
+        key = contact_key(contact, purpose)
+        cache.set_many({
+            self.CODE_KEY.format(key): hash_code(contact, purpose, code),
+            self.ATTEMPTS_KEY.format(key): 0,
+        }, ttl)
+
+    def check(self, contact, purpose, code, max_attempts):
+        key = contact_key(contact, purpose)
+        code_key, attempts_key = self.CODE_KEY.format(key), self.ATTEMPTS_KEY.format(key)
+        stored = cache.get(code_key)
+        if stored is None:
+            return False
+        try:
+            attempts = cache.incr(attempts_key)
+        except ValueError:
+            attempts = max_attempts + 1  # Counter gone: treat the code as spent
+        if attempts > max_attempts:
+            cache.delete_many([code_key, attempts_key])
+            return False
+        if not hmac.compare_digest(stored, hash_code(contact, purpose, code)):
+            return False
+        # Only the first caller to remove the code may use it
+        if not cache.delete(code_key):
+            return False
+        cache.delete(attempts_key)
+        return True
+
+
+class DatabaseOTPBackend:
+    """
+    OTP rows hold the hashed code and a failed-attempt count. Issuing replaces
+    the previous code for the contact, so each contact has at most one row per
+    purpose; expired rows are removed by ``purge_expired_otps``.
+    """
+
+    def store(self, contact, purpose, code, ttl):
+        now = timezone.now()
+        with transaction.atomic():
+            OTP.objects.filter(contact_info=contact, purpose=purpose).delete()
+            OTP.objects.create(
+                contact_info=contact, purpose=purpose, otp_code=hash_code(contact, purpose, code),
+                created_at=now, expires_at=now + timedelta(seconds=ttl),
+            )
+
+    def check(self, contact, purpose, code, max_attempts):
+        otp = (
+            OTP.objects.filter(contact_info=contact, purpose=purpose, expires_at__gt=timezone.now())
+            .only('id', 'otp_code', 'attempts')
+            .first()
+        )
+        if otp is None:
+            return False
+        if otp.attempts >= max_attempts:
+            otp.delete()
+            return False
+        if not hmac.compare_digest(otp.otp_code, hash_code(contact, purpose, code)):
+            OTP.objects.filter(pk=otp.pk).update(attempts=F('attempts') + 1)
+            return False
+        # The delete decides between concurrent verifications of the same code
+        deleted, _ = OTP.objects.filter(pk=otp.pk).delete()
+        return bool(deleted)
+
+
+class OTPModule:
+    """
+    Issues and verifies one-time codes sent by email or SMS.
+
+    ``OTP_BACKEND`` selects where codes live: ``cache`` or ``database``. By
+    default the cache is used unless it is the per-process local-memory
+    cache, which other workers cannot see. Send rate limits always use the
+    cache: a short cooldown between codes plus a cap per window. They only
+    hold across workers with a shared cache; under the local-memory cache
+    each process counts separately, so the effective limit grows with the
+    number of workers.
+    """
+
+    TTL_SECONDS = int(os.getenv('OTP_TTL_SECONDS', '300'))
+    MAX_ATTEMPTS = int(os.getenv('OTP_MAX_ATTEMPTS', '5'))
+    RESEND_COOLDOWN = int(os.getenv('OTP_RESEND_COOLDOWN_SECONDS', '60'))
+    SEND_LIMIT = int(os.getenv('OTP_SEND_LIMIT', '5'))
+    SEND_WINDOW = int(os.getenv('OTP_SEND_WINDOW_SECONDS', '3600'))
+    PURGE_CHUNK_SIZE = int(os.getenv('OTP_PURGE_CHUNK_SIZE', '1000'))
+
+    COOLDOWN_KEY = 'otp:cooldown:{}'
+    SENDS_KEY = 'otp:sends:{}:{}'
+
+    BACKENDS = {
+        'cache': CacheOTPBackend,
+        'database': DatabaseOTPBackend,
+    }
+
+    _backend = None
+
+    @classmethod
+    def backend(cls):
+        if cls._backend is None:
+            name = os.getenv('OTP_BACKEND')
+            if not name:
+                local = settings.CACHES['default']['BACKEND'].endswith('LocMemCache')
+                name = 'database' if local else 'cache'
+            cls._backend = cls.BACKENDS[name]()
+        return cls._backend
+
+    @classmethod
+    def throttle(cls, contact):
+        """Count a send for the contact or raise OTPRateLimited."""
+        key = contact_key(contact, 'send')
+        if not cache.add(cls.COOLDOWN_KEY.format(key), 1, cls.RESEND_COOLDOWN):
+            raise OTPRateLimited(cls.RESEND_COOLDOWN)
+
+        window = int(time.time()) // cls.SEND_WINDOW
+        sends_key = cls.SENDS_KEY.format(key, window)
+        cache.add(sends_key, 0, cls.SEND_WINDOW)
+        try:
+            sends = cache.incr(sends_key)
+        except ValueError:
+            cache.set(sends_key, 1, cls.SEND_WINDOW)
+            sends = 1
+        if sends > cls.SEND_LIMIT:
+            raise OTPRateLimited(cls.SEND_WINDOW - int(time.time()) % cls.SEND_WINDOW)
+
+    @classmethod
+    def issue(cls, contact, purpose):
+        """Create and store a new code for the contact and return it for sending."""
+        cls.throttle(contact)
+        code = generate_verification_code()
+        cls.backend().store(contact, purpose, code, cls.TTL_SECONDS)
+        return code
+
+    @classmethod
+    def verify(cls, contact, purpose, code):
+        """Check and consume a code; a code is accepted at most once."""
+        if not code:
+            return False
+        return cls.backend().check(contact, purpose, str(code), cls.MAX_ATTEMPTS)
+
+    @classmethod
+    def purge_expired(cls, now=None, chunk_size=None):
+        """Delete expired OTP rows in primary-key chunks; yields the count per chunk."""
+        now = now or timezone.now()
+        chunk_size = chunk_size or cls.PURGE_CHUNK_SIZE
+        while True:
+            ids = list(
+                OTP.objects.filter(expires_at__lte=now).order_by('id').values_list('id', flat=True)[:chunk_size]
+            )
+            if not ids:
+                return
+            deleted, _ = OTP.objects.filter(id__in=ids).delete()
+            yield deleted
@@ -0,0 +1,19 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """Newest-first cursor pagination on the primary key; stable under inserts."""
+
+    ordering = '-id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class RecentActivityCursorPagination(CursorPagination):
+    """Cursor pagination for rows ordered by their latest activity."""
+
+    ordering = ('-last_message_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
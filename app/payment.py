@@ -100,13 +100,15 @@ class PaymentProcessingModule:
         return response.json()
 
     @classmethod
-    def chargeCustomer(cls, amount, email, authorization_code, currency=None, metadata=None):
+    def chargeCustomer(cls, amount, email, authorization_code, currency=None, metadata=None, reference=None):
         payload = {
             "email": email,
             "amount": cls._to_subunit(amount),
             "authorization_code": authorization_code,
             "currency": (currency or cls.DEFAULT_CURRENCY).upper(),
         }
+        if reference:
+            payload["reference"] = reference
         if metadata:
             payload["metadata"] = metadata
 
@@ -168,9 +170,25 @@ class PaymentProcessingModule:
         )
         response.raise_for_status()
         return response.json()
+    @classmethod
+    def create_recipients_bulk(cls, batch):
+        """
+        Register several recipients in one request. Each item of ``batch``
+        carries type, name, account_number, bank_code and currency; the
+        response lists created recipients under ``data.success``.
+        """
+        response = requests.post(
+            f"{cls.BASE_URL}/transferrecipient/bulk",
+            headers=cls._headers(),
+            json={"batch": batch},
+            timeout=30,
+        )
+        response.raise_for_status()
+        return response.json()
+
     # withdraw from wallet(b to c from paystack to customer bank or mobile money)    
     @classmethod
-    def withdraw_from_wallet(cls, amount, recipient_code, reason=None, currency=None, metadata=None):
+    def withdraw_from_wallet(cls, amount, recipient_code, reason=None, currency=None, metadata=None, reference=None):
         payload = {
             "source": "balance",
             "amount": cls._to_subunit(amount),
@@ -179,6 +197,8 @@ class PaymentProcessingModule:
         }
         if reason:
             payload["reason"] = reason
+        if reference:
+            payload["reference"] = reference
         if metadata:
             payload["metadata"] = metadata
 
@@ -191,4 +211,27 @@ class PaymentProcessingModule:
         response.raise_for_status()
         return response.json()
 
-    
\ No newline at end of file
+    
+
+    @classmethod
+    def bulk_transfer(cls, transfers, currency=None):
+        """
+        Submit several transfers from the balance in one request. Each item
+        of ``transfers`` carries amount, recipient, reference and reason; the
+        response lists accepted transfers with their ``transfer_code``.
+        """
+        payload = {
+            "source": "balance",
+            "currency": (currency or cls.DEFAULT_CURRENCY).upper(),
+            "transfers": [
+                {**transfer, "amount": cls._to_subunit(transfer["amount"])} for transfer in transfers
+            ],
+        }
+        response = requests.post(
+            f"{cls.BASE_URL}/transfer/bulk",
+            headers=cls._headers(),
+            json=payload,
+            timeout=30,
+        )
+        response.raise_for_status()
+        return response.json()
@@ -0,0 +1,364 @@
+import os
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Exists, F, OuterRef, Value, When
+from django.utils import timezone
+import requests
+from .models import (
+    PaymentTransaction, PayoutDestination, RecipientType, User, UserRole, Wallet, WithdrawalStatus
+)
+from .payment import PaymentProcessingModule
+from .statements import StatementModule
+from .wallets import WalletModule
+
+
+class PayoutModule:
+    """
+    Transfer recipients are registered with Paystack once per account and
+    kept as PayoutDestination rows, so a withdrawal only needs the transfer
+    call.
+
+    Withdrawals are queued rather than sent from the request: the amount is
+    taken from the wallet straight away and the row waits as QUEUED until a
+    flush submits queued rows through the bulk transfer endpoint, up to
+    BATCH_SIZE per request. Results are written back with one update per
+    outcome, and failed withdrawals are refunded the same way. Transfers
+    Paystack has accepted but not finished stay PROCESSING until a
+    transfer webhook settles them. Transaction references double as
+    Paystack transfer references, so a batch whose request fails in transit
+    can be submitted again without paying twice; after MAX_SUBMIT_ATTEMPTS
+    such failures, or when Paystack rejects the request outright, the
+    withdrawals are failed and refunded.
+    """
+
+    RECIPIENT_BATCH_SIZE = int(os.getenv('PAYSTACK_RECIPIENT_BATCH_SIZE', '100'))
+
+    WITHDRAWAL = 'WITHDRAWAL'
+    BATCHING = os.getenv('PAYOUT_BATCHING', 'true').lower() == 'true'
+    BATCH_SIZE = int(os.getenv('PAYOUT_BATCH_SIZE', '100'))
+    # Flush as soon as this many withdrawals are queued, otherwise every FLUSH_INTERVAL seconds
+    FLUSH_THRESHOLD = int(os.getenv('PAYOUT_FLUSH_THRESHOLD', '100'))
+    FLUSH_INTERVAL = int(os.getenv('PAYOUT_FLUSH_INTERVAL', '60'))
+    # PROCESSING rows older than this were claimed by a flush that died and are queued again
+    STALE_AFTER = int(os.getenv('PAYOUT_STALE_AFTER_SECONDS', '600'))
+    QUEUED_KEY = 'payouts:queued'
+    MAX_SUBMIT_ATTEMPTS = int(os.getenv('PAYOUT_MAX_SUBMIT_ATTEMPTS', '5'))
+    # Paystack states for a transfer that was accepted but has not finished;
+    # 'success' completes the withdrawal and anything else fails it
+    PENDING_STATES = {'pending', 'received', 'queued', 'otp'}
+    TRANSFER_EVENTS = {'transfer.success', 'transfer.failed', 'transfer.reversed'}
+
+    @staticmethod
+    def _lookup(user, account_number, bank_code, type):
+        return {
+            'user': user,
+            'type': type or RecipientType.NUBAN,
+            'account_number': str(account_number).strip(),
+            'bank_code': str(bank_code).strip(),
+        }
+
+    @classmethod
+    def destination_for(cls, user, account_number, bank_code, type=RecipientType.NUBAN, currency=None):
+        """The stored destination for an account, registering it with Paystack on first use."""
+        lookup = cls._lookup(user, account_number, bank_code, type)
+        destination = PayoutDestination.objects.filter(**lookup).first()
+        if destination:
+            return destination
+
+        currency = (currency or PaymentProcessingModule.DEFAULT_CURRENCY).upper()
+        recipient = PaymentProcessingModule.create_recipient(
+            name=user.name, account=lookup['account_number'], bank_code=lookup['bank_code'],
+            type=lookup['type'], currency=currency,
+        )
+        if recipient.get('status') is not True:
+            return None
+        try:
+            with transaction.atomic():
+                return PayoutDestination.objects.create(
+                    **lookup, currency=currency, name=user.name,
+                    recipient_code=recipient['data']['recipient_code'],
+                )
+        except IntegrityError:
+            # Registered concurrently by another withdrawal
+            return PayoutDestination.objects.get(**lookup)
+
+    @staticmethod
+    def unregistered_drivers(type, bank_code):
+        """Drivers whose phone number is not yet a destination of this type and bank."""
+        registered = PayoutDestination.objects.filter(
+            user=OuterRef('pk'), type=type, bank_code=bank_code, account_number=OuterRef('phone_number')
+        )
+        return (
+            User.objects.filter(role=UserRole.DRIVER, phone_number__isnull=False)
+            .exclude(phone_number='')
+            .filter(~Exists(registered))
+        )
+
+    @classmethod
+    def register_drivers(cls, type=RecipientType.MOBILE_MONEY, bank_code='MPESA', currency=None, batch_size=None):
+        """
+        Register every unregistered driver's phone number with the bulk
+        recipient endpoint, one request per batch. Yields ``(created, failed)``
+        per batch.
+        """
+        batch_size = batch_size or cls.RECIPIENT_BATCH_SIZE
+        currency = (currency or PaymentProcessingModule.DEFAULT_CURRENCY).upper()
+        drivers = cls.unregistered_drivers(type, bank_code).order_by('id').values('id', 'name', 'phone_number')
+        last_id = 0
+        while True:
+            batch = list(drivers.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                return
+            last_id = batch[-1]['id']
+            by_account = {driver['phone_number']: driver for driver in batch}
+            response = PaymentProcessingModule.create_recipients_bulk([
+                {'type': type, 'name': driver['name'] or driver['phone_number'],
+                 'account_number': driver['phone_number'], 'bank_code': bank_code, 'currency': currency}
+                for driver in batch
+            ])
+
+            rows = []
+            for recipient in (response.get('data') or {}).get('success', []):
+                driver = by_account.get((recipient.get('details') or {}).get('account_number'))
+                if driver:
+                    rows.append(PayoutDestination(
+                        user_id=driver['id'], type=type, account_number=driver['phone_number'],
+                        bank_code=bank_code, currency=currency, name=driver['name'],
+                        recipient_code=recipient['recipient_code'],
+                    ))
+            PayoutDestination.objects.bulk_create(rows, ignore_conflicts=True)
+            yield len(rows), len(batch) - len(rows)
+
+    # -------------------------------------------------
+    # Withdrawal queue
+    # -------------------------------------------------
+    @classmethod
+    def enqueue(cls, user, amount, destination):
+        """
+        Take ``amount`` from the user's wallet and queue the withdrawal.
+        Returns None when the balance does not cover it.
+        """
+        with transaction.atomic():
+            if not WalletModule.debit(user.id, amount):
+                return None
+            withdrawal = PaymentTransaction.objects.create(
+                user=user,
+                amount=amount,
+                transaction_type=cls.WITHDRAWAL,
+                status=WithdrawalStatus.QUEUED,
+                transaction_reference=str(uuid.uuid4()),
+                payout_destination=destination,
+            )
+            transaction.on_commit(cls._count_queued)
+        return withdrawal
+
+    @classmethod
+    def _count_queued(cls):
+        cache.add(cls.QUEUED_KEY, 0, None)
+        try:
+            cache.incr(cls.QUEUED_KEY)
+        except ValueError:
+            cache.set(cls.QUEUED_KEY, 1, None)
+
+    @classmethod
+    def flush_due(cls, last_flush_at, now=None):
+        now = now or timezone.now()
+        if now - last_flush_at >= timedelta(seconds=cls.FLUSH_INTERVAL):
+            return True
+        return cache.get(cls.QUEUED_KEY, 0) >= cls.FLUSH_THRESHOLD
+
+    @classmethod
+    def requeue_stale(cls, now=None):
+        """Queue again rows claimed by a flush that died; accepted transfers wait for their webhook."""
+        now = now or timezone.now()
+        return PaymentTransaction.objects.filter(
+            transaction_type=cls.WITHDRAWAL, status=WithdrawalStatus.PROCESSING, transfer_code__isnull=True,
+            updated_at__lt=now - timedelta(seconds=cls.STALE_AFTER),
+        ).update(status=WithdrawalStatus.QUEUED, updated_at=now)
+
+    @classmethod
+    def claim_batch(cls, size=None):
+        """Move up to ``size`` of the oldest queued withdrawals to PROCESSING and return them."""
+        size = size or cls.BATCH_SIZE
+        with transaction.atomic():
+            ids = list(
+                PaymentTransaction.objects.select_for_update(skip_locked=True)
+                .filter(transaction_type=cls.WITHDRAWAL, status=WithdrawalStatus.QUEUED)
+                .order_by('id')
+                .values_list('id', flat=True)[:size]
+            )
+            if not ids:
+                return []
+            PaymentTransaction.objects.filter(id__in=ids).update(
+                status=WithdrawalStatus.PROCESSING, updated_at=timezone.now()
+            )
+        return list(
+            PaymentTransaction.objects.filter(id__in=ids)
+            .order_by('id')
+            .values('id', 'user_id', 'amount', 'transaction_reference', 'payout_attempts',
+                    'payout_destination__recipient_code', 'payout_destination__currency')
+        )
+
+    @classmethod
+    def submit(cls, rows, send=None):
+        """
+        Send claimed rows, one bulk request per currency. Returns
+        ``{transaction_id: (state, transfer_code)}`` with Paystack's state per
+        transfer (``'rejected'`` for every row of a request refused with a
+        4xx), and separately the ids of rows whose request failed in transit
+        or with a server error, for requeueing.
+        """
+        send = send or PaymentProcessingModule.bulk_transfer
+        by_currency = defaultdict(list)
+        for row in rows:
+            by_currency[row['payout_destination__currency']].append(row)
+
+        results, unsent = {}, []
+        for currency, items in by_currency.items():
+            by_reference = {row['transaction_reference']: row['id'] for row in items}
+            transfers = [
+                {'amount': row['amount'], 'recipient': row['payout_destination__recipient_code'],
+                 'reference': row['transaction_reference'], 'reason': 'Withdrawal from wallet'}
+                for row in items
+            ]
+            try:
+                response = send(transfers, currency=currency)
+            except requests.HTTPError as exc:
+                code = exc.response.status_code if exc.response is not None else None
+                if code is not None and 400 <= code < 500 and code != 429:
+                    # Paystack refused the request as a whole, so nothing was sent
+                    results.update((transaction_id, ('rejected', None)) for transaction_id in by_reference.values())
+                else:
+                    unsent.extend(by_reference.values())
+                continue
+            except requests.RequestException:
+                unsent.extend(by_reference.values())
+                continue
+            for item in response.get('data') or []:
+                transaction_id = by_reference.get(item.get('reference'))
+                if transaction_id:
+                    results[transaction_id] = (item.get('status'), item.get('transfer_code'))
+        return results, unsent
+
+    @staticmethod
+    def _transfer_codes(codes):
+        return Case(*[When(id=pk, then=Value(code)) for pk, code in codes.items()], default=F('transfer_code'))
+
+    @classmethod
+    def _refund(cls, refunds, now):
+        """Return ``{user_id: amount}`` to active balances with one update."""
+        Wallet.objects.filter(user_id__in=refunds).update(
+            active_balance=F('active_balance') + Case(
+                *[When(user_id=user_id, then=Value(amount)) for user_id, amount in refunds.items()]
+            ),
+            updated_at=now,
+        )
+        WalletModule.invalidate(*refunds)
+
+    @classmethod
+    def reconcile(cls, rows, results, unsent):
+        """
+        Write results for a submitted batch and refund failed withdrawals.
+        Returns ``(completed, pending, failed, requeued)`` counts.
+        """
+        now = timezone.now()
+        unsent = set(unsent)
+        completed = {pk: code for pk, (state, code) in results.items() if state == 'success'}
+        pending = {pk: code for pk, (state, code) in results.items() if state in cls.PENDING_STATES}
+        requeued = [
+            row['id'] for row in rows
+            if row['id'] in unsent and row['payout_attempts'] + 1 < cls.MAX_SUBMIT_ATTEMPTS
+        ]
+        failed = [
+            row for row in rows
+            if row['id'] not in completed and row['id'] not in pending and row['id'] not in requeued
+        ]
+        refunds = defaultdict(int)
+        for row in failed:
+            refunds[row['user_id']] += row['amount']
+
+        with transaction.atomic():
+            if completed:
+                PaymentTransaction.objects.filter(id__in=completed).update(
+                    status=WithdrawalStatus.COMPLETED, transfer_code=cls._transfer_codes(completed), updated_at=now,
+                )
+                StatementModule.record(
+                    [(row['user_id'], -row['amount']) for row in rows if row['id'] in completed], at=now
+                )
+            if pending:
+                # Still PROCESSING; the transfer code keeps requeue_stale away until the webhook arrives
+                PaymentTransaction.objects.filter(id__in=pending).update(
+                    transfer_code=cls._transfer_codes(pending), updated_at=now,
+                )
+            if unsent:
+                PaymentTransaction.objects.filter(id__in=unsent).update(
+                    payout_attempts=F('payout_attempts') + 1, updated_at=now,
+                )
+            if requeued:
+                PaymentTransaction.objects.filter(id__in=requeued).update(status=WithdrawalStatus.QUEUED)
+            if failed:
+                PaymentTransaction.objects.filter(id__in=[row['id'] for row in failed]).update(
+                    status=WithdrawalStatus.FAILED, updated_at=now
+                )
+                cls._refund(refunds, now)
+        return len(completed), len(pending), len(failed), len(requeued)
+
+    @classmethod
+    def settle_transfer(cls, reference, succeeded, transfer_code=None):
+        """
+        Apply a transfer webhook to its withdrawal. A success completes an
+        open withdrawal; a failure or reversal fails it and refunds the
+        wallet, including one already completed. Returns whether anything
+        changed, so repeated deliveries are harmless.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            withdrawal = (
+                PaymentTransaction.objects.select_for_update()
+                .filter(transaction_reference=reference, transaction_type=cls.WITHDRAWAL)
+                .first()
+            )
+            if withdrawal is None:
+                return False
+            if succeeded:
+                # PENDING is a direct transfer whose request failed in transit
+                if withdrawal.status not in (
+                    WithdrawalStatus.PENDING, WithdrawalStatus.QUEUED, WithdrawalStatus.PROCESSING
+                ):
+                    return False
+                PaymentTransaction.objects.filter(pk=withdrawal.pk).update(
+                    status=WithdrawalStatus.COMPLETED, transfer_code=transfer_code or withdrawal.transfer_code,
+                    updated_at=now,
+                )
+                StatementModule.record([(withdrawal.user_id, -withdrawal.amount)], at=now)
+                return True
+            if withdrawal.status == WithdrawalStatus.FAILED:
+                return False
+            PaymentTransaction.objects.filter(pk=withdrawal.pk).update(status=WithdrawalStatus.FAILED, updated_at=now)
+            cls._refund({withdrawal.user_id: withdrawal.amount}, now)
+            if withdrawal.status == WithdrawalStatus.COMPLETED:
+                # The completion was on the statement; the reversal puts the money back on it
+                StatementModule.record([(withdrawal.user_id, withdrawal.amount)], at=now)
+        return True
+
+    @classmethod
+    def flush(cls, send=None, batch_size=None):
+        """
+        Submit everything queued, a batch at a time. Yields
+        ``(completed, pending, failed, requeued)`` per batch; stops early
+        when a whole batch was requeued so it is retried on the next flush.
+        """
+        cache.set(cls.QUEUED_KEY, 0, None)
+        cls.requeue_stale()
+        while True:
+            rows = cls.claim_batch(batch_size)
+            if not rows:
+                return
+            results, unsent = cls.submit(rows, send)
+            result = cls.reconcile(rows, results, unsent)
+            yield result
+            if result[3] == len(rows):
+                return
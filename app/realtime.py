@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from django.conf import settings
+from django.core.cache import cache
+
+
+class RealtimeHub:
+    """
+    Per-user event stream delivered over long-polling.
+
+    Each user's events carry a sequence number taken from a shared cache
+    counter, so a client cursor stays valid whichever worker serves it.
+    Events are written to the cache for other workers and appended to a
+    bounded in-memory deque in the publishing process; waiters in the same
+    process are woken immediately, others see the event on their next cache
+    check. When a cursor falls behind what is retained, the poll answers
+    with ``reset`` and the client reloads state over the REST endpoints.
+    """
+
+    SEQ_KEY = 'realtime:seq:{}'
+    EVENT_KEY = 'realtime:event:{}:{}'
+
+    def __init__(self, buffer_size=100, max_users=10000, event_ttl=300, check_interval=1.0, backend=None):
+        self.buffer_size = buffer_size
+        self.max_users = max_users
+        self.event_ttl = event_ttl
+        self.check_interval = check_interval
+        self.cache = backend or cache
+        self._buffers = OrderedDict()
+        self._condition = threading.Condition()
+
+    def publish(self, user_id, event_type, payload):
+        seq_key = self.SEQ_KEY.format(user_id)
+        self.cache.add(seq_key, 0, None)
+        try:
+            seq = self.cache.incr(seq_key)
+        except ValueError:
+            self.cache.set(seq_key, 1, None)
+            seq = 1
+        event = {'seq': seq, 'type': event_type, 'data': payload}
+        self.cache.set(self.EVENT_KEY.format(user_id, seq), event, self.event_ttl)
+
+        with self._condition:
+            buffer = self._buffers.get(user_id)
+            if buffer is None:
+                buffer = self._buffers[user_id] = deque(maxlen=self.buffer_size)
+                if len(self._buffers) > self.max_users:
+                    self._buffers.popitem(last=False)
+            else:
+                self._buffers.move_to_end(user_id)
+            buffer.append(event)
+            self._condition.notify_all()
+        return seq
+
+    def latest(self, user_id):
+        return self.cache.get(self.SEQ_KEY.format(user_id), 0)
+
+    def collect(self, user_id, after):
+        """Return ``(events, reset)`` for everything published after ``after``."""
+        latest = self.latest(user_id)
+        if latest <= after:
+            return [], latest < after
+
+        first = max(after + 1, latest - self.buffer_size + 1)
+        reset = first > after + 1
+        with self._condition:
+            buffer = list(self._buffers.get(user_id, ()))
+        if buffer and buffer[0]['seq'] <= first and buffer[-1]['seq'] >= latest:
+            return [event for event in buffer if first <= event['seq'] <= latest], reset
+
+        keys = [self.EVENT_KEY.format(user_id, seq) for seq in range(first, latest + 1)]
+        found = self.cache.get_many(keys)
+        events = [found[key] for key in keys if key in found]
+        if len(events) != len(keys):
+            reset = True
+        return events, reset
+
+    def wait(self, user_id, after, timeout):
+        """Block until events newer than ``after`` exist or ``timeout`` seconds pass."""
+        deadline = time.monotonic() + timeout
+        while True:
+            events, reset = self.collect(user_id, after)
+            remaining = deadline - time.monotonic()
+            if events or reset or remaining <= 0:
+                return events, reset
+            with self._condition:
+                self._condition.wait(min(remaining, self.check_interval))
+
+
+class RealtimeModule:
+    """
+    Polls answer immediately unless the client asks to wait. A waiting poll
+    holds a worker for its whole duration and is only woken across
+    processes through a shared cache, so waits are capped at
+    MAX_WAIT_SECONDS with Redis or Memcached and disabled with the
+    local-memory cache.
+    """
+
+    BUFFER_SIZE = int(os.getenv('REALTIME_BUFFER_SIZE', '100'))
+    MAX_USERS = int(os.getenv('REALTIME_MAX_USERS', '10000'))
+    EVENT_TTL = int(os.getenv('REALTIME_EVENT_TTL', '300'))
+    DEFAULT_WAIT_SECONDS = int(os.getenv('REALTIME_DEFAULT_WAIT_SECONDS', '0'))
+    MAX_WAIT_SECONDS = int(os.getenv('REALTIME_MAX_WAIT_SECONDS', '25'))
+
+    hub = RealtimeHub(BUFFER_SIZE, MAX_USERS, EVENT_TTL)
+
+    @classmethod
+    def max_wait(cls):
+        if settings.CACHES['default']['BACKEND'].endswith('LocMemCache'):
+            return 0
+        return cls.MAX_WAIT_SECONDS
+
+    @classmethod
+    def publish(cls, user_id, event_type, payload):
+        return cls.hub.publish(user_id, event_type, payload)
+
+    @classmethod
+    def poll(cls, user_id, after, timeout=None):
+        if timeout is None:
+            timeout = cls.DEFAULT_WAIT_SECONDS
+        timeout = max(0, min(timeout, cls.max_wait()))
+        events, reset = cls.hub.wait(user_id, after, timeout)
+        return {'events': events, 'reset': reset, 'latest': cls.hub.latest(user_id)}
@@ -0,0 +1,388 @@
+import bz2
+import gzip
+import heapq
+import os
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from math import radians, sin, cos, sqrt, atan2, floor
+import mmap
+import xml.etree.ElementTree as ET
+
+
+EARTH_RADIUS_M = 6371000.0
+
+
+class RoutingError(Exception):
+    """Raised when a route cannot be computed from the local graph."""
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres."""
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    return EARTH_RADIUS_M * 2 * atan2(sqrt(a), sqrt(1 - a))
+
+
+class RoadGraph:
+    """
+    Road network stored as compressed sparse row (CSR) arrays.
+
+    File layout (little-endian), every section laid out back to back:
+
+        header        magic, version, node/edge/cell counts, cell size, max speed
+        latitudes     float64[node_count]
+        longitudes    float64[node_count]
+        cell_keys     int64[cell_count]      sorted grid cells used for snapping
+        offsets       uint32[node_count + 1] first outgoing edge of every node
+        cell_starts   uint32[cell_count + 1] first node of every grid cell
+        targets       uint32[edge_count]
+        lengths       float32[edge_count]    metres
+        times         float32[edge_count]    seconds
+
+    Nodes are numbered in grid-cell order so snapping a coordinate to the
+    closest node is a binary search over ``cell_keys``. Opening a graph maps
+    the file into memory, so startup cost does not depend on graph size.
+    """
+
+    MAGIC = b'SKRG'
+    VERSION = 1
+    HEADER = struct.Struct('<4sIIIIIdd')
+    DEFAULT_CELL_SIZE = 0.005  # degrees, roughly 550m at the equator
+    CELL_COLUMNS = 72000  # 360 / DEFAULT_CELL_SIZE, wide enough for any cell size we use
+
+    def __init__(self, buffer, mapped=None):
+        self._mapped = mapped
+        magic, version, node_count, edge_count, cell_count, _, cell_size, max_speed = self.HEADER.unpack_from(buffer, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise RoutingError("Unsupported routing graph file")
+
+        self.node_count = node_count
+        self.edge_count = edge_count
+        self.cell_count = cell_count
+        self.cell_size = cell_size
+        self.max_speed_mps = max_speed
+
+        view = memoryview(buffer)
+        position = self.HEADER.size
+        sections = []
+        for fmt, count in (
+            ('d', node_count), ('d', node_count), ('q', cell_count),
+            ('I', node_count + 1), ('I', cell_count + 1),
+            ('I', edge_count), ('f', edge_count), ('f', edge_count),
+        ):
+            size = array(fmt).itemsize * count
+            sections.append(self._section(view, position, size, fmt))
+            position += size
+
+        (self.latitudes, self.longitudes, self.cell_keys, self.offsets,
+         self.cell_starts, self.targets, self.lengths, self.times) = sections
+
+    @staticmethod
+    def _section(view, start, size, fmt):
+        chunk = view[start:start + size]
+        if sys.byteorder == 'little':
+            return chunk.cast(fmt)
+        values = array(fmt)
+        values.frombytes(chunk.tobytes())
+        values.byteswap()
+        return values
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a graph file written by :meth:`write`."""
+        with open(path, 'rb') as handle:
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped, mapped=mapped)
+
+    def close(self):
+        for name in ('latitudes', 'longitudes', 'cell_keys', 'offsets',
+                     'cell_starts', 'targets', 'lengths', 'times'):
+            section = getattr(self, name, None)
+            if isinstance(section, memoryview):
+                section.release()
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+
+    # -------------------------------------------------
+    # Building
+    # -------------------------------------------------
+    @classmethod
+    def _cell_key(cls, latitude, longitude, cell_size):
+        row = int(floor((latitude + 90.0) / cell_size))
+        column = int(floor((longitude + 180.0) / cell_size))
+        return row * cls.CELL_COLUMNS + column
+
+    @classmethod
+    def write(cls, path, latitudes, longitudes, edges, cell_size=None):
+        """
+        Serialize a graph to ``path``.
+
+        ``edges`` is an iterable of ``(source, target, length_m, time_s)``
+        tuples using indexes into ``latitudes``/``longitudes``.
+        """
+        cell_size = cell_size or cls.DEFAULT_CELL_SIZE
+        node_count = len(latitudes)
+
+        # Renumber nodes in grid-cell order
+        keys = [cls._cell_key(latitudes[i], longitudes[i], cell_size) for i in range(node_count)]
+        order = sorted(range(node_count), key=keys.__getitem__)
+        new_index = array('I', bytes(4 * node_count))
+        for position, old in enumerate(order):
+            new_index[old] = position
+
+        cell_keys = array('q')
+        cell_starts = array('I')
+        for position, old in enumerate(order):
+            if not cell_keys or cell_keys[-1] != keys[old]:
+                cell_keys.append(keys[old])
+                cell_starts.append(position)
+        cell_starts.append(node_count)
+
+        adjacency = [[] for _ in range(node_count)]
+        max_speed = 0.0
+        for source, target, length_m, time_s in edges:
+            adjacency[new_index[source]].append((new_index[target], length_m, time_s))
+            if time_s > 0:
+                max_speed = max(max_speed, length_m / time_s)
+
+        offsets = array('I', [0])
+        targets = array('I')
+        lengths = array('f')
+        times = array('f')
+        for outgoing in adjacency:
+            for target, length_m, time_s in outgoing:
+                targets.append(target)
+                lengths.append(length_m)
+                times.append(time_s)
+            offsets.append(len(targets))
+
+        sections = (
+            array('d', (latitudes[old] for old in order)),
+            array('d', (longitudes[old] for old in order)),
+            cell_keys, offsets, cell_starts, targets, lengths, times,
+        )
+        with open(path, 'wb') as handle:
+            handle.write(cls.HEADER.pack(
+                cls.MAGIC, cls.VERSION, node_count, len(targets), len(cell_keys), 0,
+                cell_size, max_speed or 1.0,
+            ))
+            for section in sections:
+                if sys.byteorder != 'little':
+                    section = array(section.typecode, section)
+                    section.byteswap()
+                section.tofile(handle)
+        return node_count, len(targets)
+
+    # -------------------------------------------------
+    # Queries
+    # -------------------------------------------------
+    def nearest_node(self, latitude, longitude, max_distance_m=None):
+        """Return ``(node, distance_m)`` for the closest node, searching outward ring by ring."""
+        cell_size = self.cell_size
+        row = int(floor((latitude + 90.0) / cell_size))
+        column = int(floor((longitude + 180.0) / cell_size))
+        ring_limit = 3
+        if max_distance_m:
+            ring_limit = max(1, int(max_distance_m / (cell_size * 111000.0 * cos(radians(latitude)))) + 1)
+
+        best_node, best_distance = None, None
+        for ring in range(ring_limit + 1):
+            for r in range(row - ring, row + ring + 1):
+                for c in range(column - ring, column + ring + 1):
+                    if ring and r not in (row - ring, row + ring) and c not in (column - ring, column + ring):
+                        continue
+                    for node in self._cell_nodes(r * self.CELL_COLUMNS + c):
+                        distance = haversine_m(latitude, longitude, self.latitudes[node], self.longitudes[node])
+                        if best_distance is None or distance < best_distance:
+                            best_node, best_distance = node, distance
+            # Anything in the next ring is at least `ring` cells away
+            if best_node is not None and best_distance <= ring * cell_size * 111000.0 * cos(radians(latitude)):
+                break
+
+        if best_node is None or (max_distance_m and best_distance > max_distance_m):
+            raise RoutingError("No road found near the requested coordinates")
+        return best_node, best_distance
+
+    def _cell_nodes(self, key):
+        index = bisect_left(self.cell_keys, key)
+        if index < self.cell_count and self.cell_keys[index] == key:
+            return range(self.cell_starts[index], self.cell_starts[index + 1])
+        return ()
+
+    def shortest_path(self, source, target):
+        """
+        A* over travel time. Returns ``(length_m, time_s)``.
+
+        The heuristic is the straight-line distance at the fastest speed found
+        in the graph, which never overestimates the remaining time.
+        """
+        if source == target:
+            return 0.0, 0.0
+
+        latitudes, longitudes = self.latitudes, self.longitudes
+        offsets, targets, lengths, times = self.offsets, self.targets, self.lengths, self.times
+        target_lat, target_lon = latitudes[target], longitudes[target]
+        speed = self.max_speed_mps
+
+        best_time = {source: 0.0}
+        best_length = {source: 0.0}
+        settled = set()
+        heap = [(haversine_m(latitudes[source], longitudes[source], target_lat, target_lon) / speed, 0.0, source)]
+
+        while heap:
+            _, elapsed, node = heapq.heappop(heap)
+            if node == target:
+                return best_length[node], elapsed
+            if node in settled:
+                continue
+            settled.add(node)
+
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[edge]
+                if neighbour in settled:
+                    continue
+                candidate = elapsed + times[edge]
+                if candidate < best_time.get(neighbour, float('inf')):
+                    best_time[neighbour] = candidate
+                    best_length[neighbour] = best_length[node] + lengths[edge]
+                    estimate = haversine_m(latitudes[neighbour], longitudes[neighbour], target_lat, target_lon) / speed
+                    heapq.heappush(heap, (candidate + estimate, candidate, neighbour))
+
+        raise RoutingError("No route between the requested coordinates")
+
+    def route(self, pickup_latitude, pickup_longitude, dropoff_latitude, dropoff_longitude, max_snap_distance_m=None):
+        source, _ = self.nearest_node(pickup_latitude, pickup_longitude, max_snap_distance_m)
+        target, _ = self.nearest_node(dropoff_latitude, dropoff_longitude, max_snap_distance_m)
+        return self.shortest_path(source, target)
+
+
+class OSMGraphBuilder:
+    """
+    Build a :class:`RoadGraph` file from an OpenStreetMap XML extract
+    (``.osm``, ``.osm.gz`` or ``.osm.bz2``).
+    """
+
+    # Default speeds (km/h) per highway class when a way has no usable maxspeed tag
+    HIGHWAY_SPEEDS = {
+        'motorway': 100, 'motorway_link': 60,
+        'trunk': 80, 'trunk_link': 50,
+        'primary': 60, 'primary_link': 40,
+        'secondary': 50, 'secondary_link': 35,
+        'tertiary': 40, 'tertiary_link': 30,
+        'unclassified': 30, 'residential': 25,
+        'living_street': 10, 'service': 15, 'road': 30,
+    }
+
+    @staticmethod
+    def _open(path):
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rb')
+        if path.endswith('.bz2'):
+            return bz2.open(path, 'rb')
+        return open(path, 'rb')
+
+    @classmethod
+    def _speed_kph(cls, tags):
+        maxspeed = tags.get('maxspeed', '')
+        digits = ''.join(ch for ch in maxspeed.split(';')[0] if ch.isdigit() or ch == '.')
+        if digits:
+            try:
+                speed = float(digits)
+                return speed * 1.609 if 'mph' in maxspeed else speed
+            except ValueError:
+                pass
+        return cls.HIGHWAY_SPEEDS[tags['highway']]
+
+    @classmethod
+    def build(cls, osm_path, output_path, cell_size=None):
+        """Parse ``osm_path`` and write the routing graph to ``output_path``."""
+        coordinates = {}
+        ways = []
+
+        with cls._open(osm_path) as handle:
+            for _, element in ET.iterparse(handle, events=('end',)):
+                if element.tag == 'node':
+                    coordinates[int(element.get('id'))] = (float(element.get('lat')), float(element.get('lon')))
+                    element.clear()
+                elif element.tag == 'way':
+                    tags = {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+                    if tags.get('highway') in cls.HIGHWAY_SPEEDS:
+                        refs = [int(nd.get('ref')) for nd in element.iter('nd')]
+                        oneway = tags.get('oneway', 'no')
+                        if tags.get('junction') == 'roundabout' and oneway == 'no':
+                            oneway = 'yes'
+                        ways.append((refs, cls._speed_kph(tags) / 3.6, oneway))
+                    element.clear()
+
+        index = {}
+        latitudes, longitudes, edges = [], [], []
+
+        def node_index(osm_id):
+            if osm_id not in index:
+                index[osm_id] = len(latitudes)
+                latitude, longitude = coordinates[osm_id]
+                latitudes.append(latitude)
+                longitudes.append(longitude)
+            return index[osm_id]
+
+        for refs, speed_mps, oneway in ways:
+            refs = [ref for ref in refs if ref in coordinates]
+            for a, b in zip(refs, refs[1:]):
+                u, v = node_index(a), node_index(b)
+                length = haversine_m(latitudes[u], longitudes[u], latitudes[v], longitudes[v])
+                duration = length / speed_mps
+                if oneway == '-1':
+                    edges.append((v, u, length, duration))
+                    continue
+                edges.append((u, v, length, duration))
+                if oneway not in ('yes', 'true', '1'):
+                    edges.append((v, u, length, duration))
+
+        return RoadGraph.write(output_path, latitudes, longitudes, edges, cell_size=cell_size)
+
+
+class RoutingModule:
+    """
+    Process-wide access to the offline routing graph configured through
+    ``ROUTING_GRAPH_PATH``. The graph is mapped lazily on first use.
+    """
+
+    GRAPH_PATH = os.getenv('ROUTING_GRAPH_PATH')
+    MAX_SNAP_DISTANCE_M = float(os.getenv('ROUTING_MAX_SNAP_DISTANCE_M', '500'))
+
+    _graph = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def is_enabled(cls):
+        return bool(cls.GRAPH_PATH)
+
+    @classmethod
+    def get_graph(cls):
+        if cls._graph is None:
+            with cls._lock:
+                if cls._graph is None:
+                    if not cls.GRAPH_PATH or not os.path.exists(cls.GRAPH_PATH):
+                        raise RoutingError("Routing graph is not configured")
+                    cls._graph = RoadGraph.open(cls.GRAPH_PATH)
+        return cls._graph
+
+    @classmethod
+    def route(cls, pickup_latitude, pickup_longitude, dropoff_latitude, dropoff_longitude):
+        """
+        Return ``{'distance_km': float, 'duration_minutes': int}`` along the road network.
+        """
+        length_m, time_s = cls.get_graph().route(
+            pickup_latitude, pickup_longitude, dropoff_latitude, dropoff_longitude,
+            max_snap_distance_m=cls.MAX_SNAP_DISTANCE_M,
+        )
+        return {
+            "distance_km": round(length_m / 1000, 2),
+            "duration_minutes": max(1, int(round(time_s / 60))) if time_s else 0,
+        }
@@ -1,14 +1,19 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
 from django.contrib.auth.hashers import make_password
 from .models import (
     DriverAvailability, DriverRating,Business, Bid, Parcel,
     VehicleColor, VehicleType, VehicleMake, VehicleModel,
     Wallet, TransactionalWallet, PaymentTransaction,Feedback,Geofence,Ride,
-    Ticket, TicketCategory
+    Ticket, TicketCategory, ChatMessage, Conversation, Notification, CardAuthorization, WalletStatement
     )
 from .models import Profile
 from .enums import ContactMethod
+from .geofencing import normalize_rings, geofence_index
+from .costcalculator import CostComputationModule
+from .tracking import PARCEL_STATUSES
+from .catalog import vehicle_catalog
 
 User = get_user_model()
 
@@ -184,109 +189,88 @@ class UserCreateSerializer(serializers.ModelSerializer):
 
 class CompleteProfileSerializer(serializers.ModelSerializer):
     profile = ProfileSerializer(read_only=True)
+
+    PROFILE_TEXT_FIELDS = ('vehicle_plate_number', 'driver_license_number', 'driver_id')
+    USER_UNIQUE_FIELDS = ('name', 'phone_number', 'email')
+
     class Meta:
         model = User
         fields = ['name', 'phone_number', 'email', 'profile']
+        # Uniqueness is left to the database constraints; see update()
+        extra_kwargs = {field: {'validators': []} for field in ['name', 'phone_number', 'email']}
+
+    def validate(self, data):
+        """Resolve vehicle catalog ids from memory; unknown or inactive ids are rejected."""
+        self._catalog_entries = {}
+        profile_data = self.context.get('profile_data', {})
+        if self.instance is not None and self.instance.role == 'DRIVER' and profile_data:
+            self._catalog_entries, errors = vehicle_catalog.resolve(profile_data)
+            if errors:
+                raise serializers.ValidationError(errors)
+        return data
+
+    @staticmethod
+    def is_profile_complete(user, profile):
+        if user.role == 'DRIVER':
+            return profile is not None and all([
+                user.name,
+                user.phone_number,
+                profile.driver_license_number,
+                profile.driver_id,
+                profile.vehicle_color_id,
+                profile.vehicle_plate_number,
+                profile.vehicle_type_id
+            ])
+        return bool(user.name)
+
+    @classmethod
+    def conflicting_field(cls, user, profile):
+        """The first unique field whose new value another user or profile already holds."""
+        lookups = [(User.objects.exclude(pk=user.pk), user, name) for name in cls.USER_UNIQUE_FIELDS]
+        if profile is not None:
+            lookups += [(Profile.objects.exclude(user=user), profile, name) for name in cls.PROFILE_TEXT_FIELDS]
+        for queryset, obj, name in lookups:
+            value = getattr(obj, name)
+            if value not in (None, '') and queryset.filter(**{name: value}).exists():
+                return name
+        return None
 
     def update(self, instance, validated_data):
-        profile_data = self.context.get('profile_data', {}).copy()
+        profile_data = self.context.get('profile_data', {})
         try:
             profile = instance.profile
         except Profile.DoesNotExist:
             profile = None
-        
-        # Update user data
+
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        
-        # Update profile data if user is a driver
+
+        profile_changed = False
         if instance.role == 'DRIVER' and profile_data:
-            # Only extract valid Profile fields
-            valid_profile_fields = {
-                'vehicle_color_id', 'vehicle_color',
-                'vehicle_type_id', 'vehicle_type',
-                'vehicle_make_id','vehicle_make',
-                'vehicle_model_id','vehicle_model',
-                'vehicle_plate_number',
-                'driver_license_number',
-                'driver_id'
-            }
-            
-            # Filter profile_data to only include valid Profile fields
-            filtered_profile_data = {
-                k: v for k, v in profile_data.items() 
-                if k in valid_profile_fields and v is not None and v != ''
+            changes = {
+                field: profile_data[field] for field in self.PROFILE_TEXT_FIELDS
+                if profile_data.get(field) not in (None, '')
             }
-            
-            # Handle foreign key fields - convert IDs to instances
-            if 'vehicle_color_id' in filtered_profile_data:
-                vehicle_color_id = filtered_profile_data.pop('vehicle_color_id')
-                if vehicle_color_id:
-                    try:
-                        filtered_profile_data['vehicle_color'] = VehicleColor.objects.get(id=int(vehicle_color_id))
-                    except (ValueError, VehicleColor.DoesNotExist):
-                        filtered_profile_data['vehicle_color'] = None
-            elif 'vehicle_color' in filtered_profile_data:
-                vehicle_color_id = filtered_profile_data.pop('vehicle_color')
-                if vehicle_color_id:
-                    try:
-                        filtered_profile_data['vehicle_color'] = VehicleColor.objects.get(id=int(vehicle_color_id))
-                    except (ValueError, VehicleColor.DoesNotExist):
-                        filtered_profile_data['vehicle_color'] = None
-            
-            if 'vehicle_type_id' in filtered_profile_data:
-                vehicle_type_id = filtered_profile_data.pop('vehicle_type_id')
-                if vehicle_type_id:
-                    try:
-                        filtered_profile_data['vehicle_type'] = VehicleType.objects.get(id=int(vehicle_type_id))
-                    except (ValueError, VehicleType.DoesNotExist):
-                        filtered_profile_data['vehicle_type'] = None
-            elif 'vehicle_type' in filtered_profile_data:
-                vehicle_type_id = filtered_profile_data.pop('vehicle_type')
-                if vehicle_type_id:
-                    try:
-                        filtered_profile_data['vehicle_type'] = VehicleType.objects.get(id=int(vehicle_type_id))
-                    except (ValueError, VehicleType.DoesNotExist):
-                        filtered_profile_data['vehicle_type'] = None
-            
-            if 'vehicle_make_id' in filtered_profile_data:
-                vehicle_make_id = filtered_profile_data.pop('vehicle_make_id')
-                if vehicle_make_id:
-                    try:
-                        filtered_profile_data['vehicle_make'] = VehicleMake.objects.get(id=int(vehicle_make_id))
-                    except (ValueError, VehicleMake.DoesNotExist):
-                        filtered_profile_data['vehicle_make'] = None
-            elif 'vehicle_make' in filtered_profile_data:
-                vehicle_make_id = filtered_profile_data.pop('vehicle_make')
-                if vehicle_make_id:
-                    try:
-                        filtered_profile_data['vehicle_make'] = VehicleMake.objects.get(id=int(vehicle_make_id))
-                    except (ValueError, VehicleMake.DoesNotExist):
-                        filtered_profile_data['vehicle_make'] = None
-            if 'vehicle_model_id' in filtered_profile_data:
-                vehicle_model_id = filtered_profile_data.pop('vehicle_model_id')
-                if vehicle_model_id:
-                    try:
-                        filtered_profile_data['vehicle_model'] = VehicleModel.objects.get(id=int(vehicle_model_id))
-                    except (ValueError, VehicleModel.DoesNotExist):
-                        filtered_profile_data['vehicle_model'] = None
-            elif 'vehicle_model' in filtered_profile_data:
-                vehicle_model_id = filtered_profile_data.pop('vehicle_model')
-                if vehicle_model_id:
-                    try:
-                        filtered_profile_data['vehicle_model'] = VehicleModel.objects.get(id=int(vehicle_model_id))
-                    except (ValueError, VehicleModel.DoesNotExist):
-                        filtered_profile_data['vehicle_model'] = None
-                        
-            if filtered_profile_data:
-                if not profile:
-                    profile = Profile.objects.create(user=instance, **filtered_profile_data)
-                else:
-                    for attr, value in filtered_profile_data.items():
-                        setattr(profile, attr, value)
+            changes.update(self._catalog_entries)
+            if changes:
+                profile = profile or Profile(user=instance)
+                for attr, value in changes.items():
+                    setattr(profile, attr, value)
+                profile_changed = True
+
+        if self.is_profile_complete(instance, profile):
+            instance.is_completed = True
+
+        try:
+            with transaction.atomic():
+                instance.save(update_fields=[*validated_data, 'is_completed'])
+                if profile_changed:
                     profile.save()
-        
-        instance.save()
+        except IntegrityError:
+            field = self.conflicting_field(instance, profile if profile_changed else None)
+            if field:
+                raise serializers.ValidationError({field: f"This {field.replace('_', ' ')} is already in use"})
+            raise serializers.ValidationError("These profile details are already in use")
         return instance
 
 class UserRoleUpdateSerializer(serializers.ModelSerializer):
@@ -331,6 +315,47 @@ class ParcelSerializer(serializers.ModelSerializer):
         fields = ['id', 'business', 'parcel_details', 'dropoff_point', 'status', 
                  'created_at', 'updated_at']
 
+class DeliveryEventSerializer(serializers.Serializer):
+    parcel = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=PARCEL_STATUSES)
+    location = serializers.CharField(max_length=255, required=False, allow_null=True, allow_blank=True)
+    recorded_at = serializers.DateTimeField(required=False)
+    event_id = serializers.CharField(max_length=64, required=False, allow_null=True)
+
+class ChatMessageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChatMessage
+        fields = ['id', 'conversation', 'sender', 'receiver', 'message', 'status', 'created_at']
+        read_only_fields = fields
+
+class SendChatMessageSerializer(serializers.Serializer):
+    receiver = serializers.IntegerField()
+    message = serializers.CharField(max_length=255)
+
+class MarkChatReadSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    up_to = serializers.IntegerField(required=False)
+
+class ConversationSerializer(serializers.ModelSerializer):
+    other_user = serializers.SerializerMethodField()
+    unread_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Conversation
+        fields = ['id', 'other_user', 'unread_count', 'last_message_preview', 'last_message_at']
+
+    def get_other_user(self, obj):
+        return obj.other_user_id(self.context['request'].user.id)
+
+    def get_unread_count(self, obj):
+        return obj.unread_for(self.context['request'].user.id)
+
+class NotificationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Notification
+        fields = ['id', 'type', 'message', 'data', 'status', 'created_at']
+        read_only_fields = fields
+
 # class BidSerializer(serializers.ModelSerializer):
 #     class Meta:
 #         model = Bid
@@ -368,24 +393,6 @@ class BidSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Bid amount must be greater than zero")
         return value
 
-    def validate(self, data):
-        # Check if a bid already exists for this business and driver
-        request = self.context.get('request')
-        if request and request.method == 'POST':
-            driver = request.user
-            business = data.get('business')
-            
-            existing_bid = Bid.objects.filter(
-                business=business,
-                driver=driver
-            ).exists()
-            
-            if existing_bid:
-                raise serializers.ValidationError(
-                    "You have already placed a bid for this business"
-                )
-        return data
-
     def get_formatted_created_at(self, obj):
         return obj.created_at.strftime("%Y-%m-%d %H:%M:%S") if obj.created_at else ""
 
@@ -408,12 +415,33 @@ class BusinessSerializer(serializers.ModelSerializer):
     class Meta:
         model = Business
         fields = ['id', 'new_business_code', 'status', 'priority', 
-                 'maximum_waiting_time', 'pickup_point', 'delivery_fee', 
+                 'maximum_waiting_time', 'waiting_time_minutes', 'pickup_point', 'delivery_fee', 
                  'owner', 'formatted_created_at', 'has_awarded_bid', 
                  'parcels', 'bids']
+        read_only_fields = ['new_business_code', 'waiting_time_minutes']
 
     def get_has_awarded_bid(self, obj):
-        return obj.bids.filter(status='AWARDED').exists()
+        return obj.has_awarded_bid
+
+    def get_formatted_created_at(self, obj):
+        return obj.created_at.strftime("%Y-%m-%d %H:%M:%S") if obj.created_at else ""
+
+class BusinessSummarySerializer(serializers.ModelSerializer):
+    """Flat business representation; expects MarketplaceModule.summary_queryset annotations."""
+    has_awarded_bid = serializers.BooleanField(source='awarded_bid_exists', read_only=True)
+    bid_count = serializers.IntegerField(read_only=True)
+    min_bid = serializers.IntegerField(read_only=True)
+    max_bid = serializers.IntegerField(read_only=True)
+    parcel_count = serializers.IntegerField(read_only=True)
+    formatted_created_at = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Business
+        fields = ['id', 'new_business_code', 'status', 'priority',
+                 'maximum_waiting_time', 'waiting_time_minutes', 'pickup_point', 'delivery_fee',
+                 'owner', 'formatted_created_at', 'has_awarded_bid',
+                 'bid_count', 'min_bid', 'max_bid', 'parcel_count']
+        read_only_fields = fields
 
     def get_formatted_created_at(self, obj):
         return obj.created_at.strftime("%Y-%m-%d %H:%M:%S") if obj.created_at else ""
@@ -459,6 +487,12 @@ class WalletSerializer(serializers.ModelSerializer):
         fields = ['id', 'user_id', 'active_balance', 'transactional_balance']
         read_only_fields = ['active_balance', 'transactional_balance']
 
+class WalletStatementSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WalletStatement
+        fields = ['month', 'opening_balance', 'credits', 'debits', 'closing_balance', 'transaction_count']
+        read_only_fields = fields
+
 class TransactionalWalletSerializer(serializers.ModelSerializer):
     from_user_name = serializers.SerializerMethodField()
     to_user_name = serializers.SerializerMethodField()
@@ -508,6 +542,13 @@ class PaymentTransactionSerializer(serializers.ModelSerializer):
         if value <= 0:
             raise serializers.ValidationError("Amount must be greater than zero")
         return value
+
+
+class CardAuthorizationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CardAuthorization
+        fields = ['id', 'last4', 'brand', 'bank', 'exp_month', 'exp_year', 'created_at', 'updated_at']
+        read_only_fields = fields
     
 
 # feedback, geofence ans statistics
@@ -566,13 +607,49 @@ class TicketSerializer(serializers.ModelSerializer):
 class GeofenceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Geofence
-        fields = ['id', 'name', 'coordinates', 'radius']
+        fields = ['id', 'name', 'zone_type', 'fare_multiplier', 'coordinates', 'radius', 'vertices',
+                  'min_latitude', 'max_latitude', 'min_longitude', 'max_longitude']
+        read_only_fields = ['min_latitude', 'max_latitude', 'min_longitude', 'max_longitude']
 
     def validate_radius(self, value):
-        if value <= 0:
+        if value is not None and value <= 0:
             raise serializers.ValidationError("Radius must be greater than zero")
         return value
 
+    def validate_fare_multiplier(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Fare multiplier must be greater than zero")
+        return value
+
+    def validate_vertices(self, value):
+        if value in (None, []):
+            return None
+        try:
+            return normalize_rings(value)
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+
+    def validate_coordinates(self, value):
+        if not value:
+            return ''
+        try:
+            latitude, longitude = map(float, value.split(','))
+        except ValueError:
+            raise serializers.ValidationError("Coordinates must be in 'lat,lng' format")
+        return f"{latitude},{longitude}"
+
+    def validate(self, data):
+        def current(field):
+            if field in data:
+                return data[field]
+            return getattr(self.instance, field, None)
+
+        if not current('vertices') and not (current('coordinates') and current('radius')):
+            raise serializers.ValidationError(
+                "Provide polygon vertices or a centre 'coordinates' with a radius"
+            )
+        return data
+
 class StatisticsSerializer(serializers.Serializer):
     total_transactions = serializers.IntegerField()
     total_amount = serializers.DecimalField(max_digits=10, decimal_places=2)
@@ -609,9 +686,11 @@ class RideSerializer(serializers.ModelSerializer):
             'requested_at', 'formatted_requested_at', 'accepted_at', 'formatted_accepted_at',
             'started_at', 'formatted_started_at', 'completed_at', 'formatted_completed_at',
             'cancelled_at', 'cancelled_by', 'cancel_reason', 'notes',
-            'created_at', 'updated_at', 'rating', 'review', 'reviewTags'
+            'created_at', 'updated_at', 'rating', 'review', 'reviewTags',
+            'pickup_zone_ids', 'dropoff_zone_ids'
         ]
-        read_only_fields = ['customer', 'driver', 'accepted_at', 'started_at', 'completed_at', 'cancelled_at']
+        read_only_fields = ['customer', 'driver', 'accepted_at', 'started_at', 'completed_at', 'cancelled_at',
+                            'pickup_zone_ids', 'dropoff_zone_ids']
     def get_driver_id(self, obj):
         return obj.driver.id if obj.driver else None
 
@@ -657,6 +736,15 @@ class RideCreateSerializer(serializers.ModelSerializer):
         # Ensure at least pickup and dropoff locations are provided
         if not data.get('pickup_location') or not data.get('dropoff_location'):
             raise serializers.ValidationError("Both pickup and dropoff locations are required")
+
+        # Tag the ride with the zones it touches from the in-memory geofence index
+        coords = [data.get(key) for key in ('pickup_latitude', 'pickup_longitude', 'dropoff_latitude', 'dropoff_longitude')]
+        if all(value is not None for value in coords):
+            zones = geofence_index.resolve_trip(*coords)
+            if CostComputationModule.ENFORCE_SERVICE_AREA and not zones['in_service_area']:
+                raise serializers.ValidationError("Pickup or dropoff location is outside the service area")
+            data['pickup_zone_ids'] = zones['pickup_zone_ids']
+            data['dropoff_zone_ids'] = zones['dropoff_zone_ids']
         return data
 
 class RideCostSerializer(serializers.Serializer):
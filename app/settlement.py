@@ -0,0 +1,192 @@
+import logging
+import os
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from .models import Ride, RideStatus, Transaction, User, UserRole, Wallet
+from .statements import StatementModule
+from .wallets import WalletModule
+
+logger = logging.getLogger(__name__)
+
+
+class SettlementError(Exception):
+    pass
+
+
+class SettlementModule:
+    """
+    Moves a completed ride's fare between wallets: the customer pays the
+    fare, the driver receives it less the platform commission and the
+    platform wallet receives the commission.
+
+    Rides are settled in batches, each inside one transaction: the rides
+    are claimed by setting ``settled_at``, every touched wallet moves by its
+    net amount in a single CASE update, the ledger rows are inserted in one
+    statement and each ledger row is added to the monthly wallet
+    statements of both sides. A customer whose balance does not cover their rides in a
+    batch keeps those rides unsettled for a later run, as does a ride
+    completed without a fare.
+    """
+
+    COMMISSION_RATE = Decimal(os.getenv('SETTLEMENT_COMMISSION_RATE', '0.15'))
+    CHUNK_SIZE = int(os.getenv('SETTLEMENT_CHUNK_SIZE', '2000'))
+    PLATFORM_USERNAME = os.getenv('PLATFORM_WALLET_USERNAME', 'platform')
+
+    FARE = 'RIDE_FARE'
+    COMMISSION = 'COMMISSION'
+
+    _platform = None  # (user_id, wallet_id)
+
+    @classmethod
+    def commission_for(cls, fare):
+        return int((Decimal(fare) * cls.COMMISSION_RATE).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+    @classmethod
+    def platform_wallet_id(cls):
+        if cls._platform is None:
+            platform, _ = User.objects.get_or_create(
+                username=cls.PLATFORM_USERNAME, defaults={'role': UserRole.ADMIN, 'is_active': False}
+            )
+            cls._platform = (platform.id, WalletModule.for_user(platform.id).id)
+        return cls._platform[1]
+
+    @staticmethod
+    def unsettled():
+        return Ride.objects.filter(status=RideStatus.COMPLETED, settled_at__isnull=True, driver__isnull=False)
+
+    @staticmethod
+    def _wallets(user_ids):
+        """``{user_id: (wallet_id, balance)}``, locked for the batch."""
+        rows = (
+            Wallet.objects.select_for_update()
+            .filter(user_id__in=user_ids)
+            .values_list('user_id', 'id', 'active_balance')
+        )
+        return {user_id: (wallet_id, balance) for user_id, wallet_id, balance in rows}
+
+    @classmethod
+    def settle_batch(cls, rides, now=None):
+        """
+        Settle ``rides`` (dicts with id, customer_id, driver_id and fare)
+        atomically. Returns the ids settled. Call inside a transaction that
+        also locked the ride rows.
+        """
+        now = now or timezone.now()
+        platform_wallet_id = cls.platform_wallet_id()
+
+        drivers = {ride['driver_id'] for ride in rides}
+        wallets = cls._wallets({ride['customer_id'] for ride in rides} | drivers)
+        missing = drivers - set(wallets)
+        if missing:
+            Wallet.objects.bulk_create([Wallet(user_id=user_id) for user_id in missing])
+            wallets.update(cls._wallets(missing))
+
+        unpriced = [ride['id'] for ride in rides if not ride['fare'] or ride['fare'] < 0]
+        if unpriced:
+            logger.warning("Leaving completed rides without a fare unsettled: %s", unpriced)
+
+        # Customers pay for rides in id order while their balance lasts
+        remaining = {user_id: balance for user_id, (wallet_id, balance) in wallets.items()}
+        deltas = defaultdict(int)
+        settled, commissions, entries = [], {}, []
+        for ride in rides:
+            fare, customer = ride['fare'], ride['customer_id']
+            if not fare or fare < 0:
+                continue
+            if customer not in wallets or remaining[customer] < fare:
+                continue
+            remaining[customer] -= fare
+            commission = cls.commission_for(fare)
+            customer_wallet = wallets[customer][0]
+            driver_wallet = wallets[ride['driver_id']][0]
+            deltas[customer_wallet] -= fare
+            deltas[driver_wallet] += fare - commission
+            deltas[platform_wallet_id] += commission
+            settled.append(ride['id'])
+            commissions[ride['id']] = commission
+            if fare - commission > 0:
+                entries.append(Transaction(
+                    from_wallet_id=customer_wallet, to_wallet_id=driver_wallet, amount=fare - commission,
+                    transaction_type=cls.FARE, status='COMPLETED', ride_id=ride['id'],
+                ))
+            if commission > 0:
+                entries.append(Transaction(
+                    from_wallet_id=customer_wallet, to_wallet_id=platform_wallet_id, amount=commission,
+                    transaction_type=cls.COMMISSION, status='COMPLETED', ride_id=ride['id'],
+                ))
+        if not settled:
+            return []
+
+        deltas = {wallet_id: delta for wallet_id, delta in deltas.items() if delta}
+        if deltas:
+            Wallet.objects.filter(id__in=deltas).update(
+                active_balance=F('active_balance') + Case(
+                    *[When(id=wallet_id, then=Value(delta)) for wallet_id, delta in deltas.items()]
+                ),
+                updated_at=now,
+            )
+            debited = [wallet_id for wallet_id, delta in deltas.items() if delta < 0]
+            if Wallet.objects.filter(id__in=debited, active_balance__lt=0).exists():
+                # Balances moved since they were read; undo the whole batch
+                raise SettlementError("A wallet would go negative")
+        WalletModule.invalidate(cls._platform[0], *[user_id for user_id in wallets if wallets[user_id][0] in deltas])
+        Ride.objects.filter(id__in=settled).update(
+            settled_at=now,
+            commission=Case(*[When(id=ride_id, then=Value(amount)) for ride_id, amount in commissions.items()]),
+        )
+        Transaction.objects.bulk_create(entries)
+        owners = {wallet_id: user_id for user_id, (wallet_id, balance) in wallets.items()}
+        owners[platform_wallet_id] = cls._platform[0]
+        StatementModule.record(
+            [(owners[entry.from_wallet_id], -entry.amount) for entry in entries]
+            + [(owners[entry.to_wallet_id], entry.amount) for entry in entries],
+            at=now,
+        )
+        return settled
+
+    @classmethod
+    def settle_ride(cls, ride):
+        """Settle one completed ride; False when already settled or the customer cannot pay yet."""
+        cls.platform_wallet_id()  # Created outside the batch so a rollback cannot orphan the cached id
+        try:
+            with transaction.atomic():
+                rows = list(
+                    cls.unsettled().select_for_update().filter(pk=ride.pk)
+                    .values('id', 'customer_id', 'driver_id', 'fare')
+                )
+                if not rows:
+                    return False
+                return bool(cls.settle_batch(rows))
+        except SettlementError:
+            return False
+
+    @classmethod
+    def resettle(cls, chunk_size=None, limit=None):
+        """
+        Settle historical unsettled rides in id-ordered chunks, one
+        transaction each. Yields ``(settled, skipped)`` per chunk.
+        """
+        chunk_size = chunk_size or cls.CHUNK_SIZE
+        cls.platform_wallet_id()
+        last_id, seen = 0, 0
+        while limit is None or seen < limit:
+            size = chunk_size if limit is None else min(chunk_size, limit - seen)
+            try:
+                with transaction.atomic():
+                    rows = list(
+                        cls.unsettled().select_for_update(skip_locked=True)
+                        .filter(id__gt=last_id)
+                        .order_by('id')
+                        .values('id', 'customer_id', 'driver_id', 'fare')[:size]
+                    )
+                    if not rows:
+                        return
+                    last_id = rows[-1]['id']
+                    settled = cls.settle_batch(rows)
+            except SettlementError:
+                settled = []
+            seen += len(rows)
+            yield len(settled), len(rows) - len(settled)
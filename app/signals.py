@@ -0,0 +1,31 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Geofence, VehicleColor, VehicleMake, VehicleModel, VehicleType, Wallet
+from .geofencing import GeofenceIndex
+from .catalog import VehicleCatalog
+from .wallets import WalletModule
+
+
+@receiver(post_save, sender=Geofence)
+@receiver(post_delete, sender=Geofence)
+def geofence_changed(sender, instance, **kwargs):
+    GeofenceIndex.notify_changed(instance.id)
+
+
+@receiver(post_save, sender=VehicleColor)
+@receiver(post_delete, sender=VehicleColor)
+@receiver(post_save, sender=VehicleType)
+@receiver(post_delete, sender=VehicleType)
+@receiver(post_save, sender=VehicleMake)
+@receiver(post_delete, sender=VehicleMake)
+@receiver(post_save, sender=VehicleModel)
+@receiver(post_delete, sender=VehicleModel)
+def vehicle_catalog_changed(sender, instance, **kwargs):
+    VehicleCatalog.notify_changed()
+
+
+@receiver(post_save, sender=Wallet)
+@receiver(post_delete, sender=Wallet)
+def wallet_changed(sender, instance, **kwargs):
+    # Saves outside WalletModule (admin, scripts) must not leave a stale cached balance
+    WalletModule.invalidate(instance.user_id)
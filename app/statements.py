@@ -0,0 +1,195 @@
+import os
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Case, Count, DateField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from .models import PaymentTransaction, Transaction, Wallet, WalletStatement, WithdrawalStatus
+
+
+class StatementModule:
+    """
+    Monthly wallet statements kept as one WalletStatement row per wallet and
+    month, so the statement screen reads rows instead of aggregating
+    payment history.
+
+    A payment counts once it settles: deposits and card ride charges when
+    they succeed (credits), withdrawals when the transfer completes
+    (debits), and ride fares and commissions when the ride is settled
+    (a debit for the customer, a credit for the driver or platform).
+    Settlement points call ``record`` inside their transaction; it adds to
+    the month's totals with set-based updates and carries the difference
+    into any later months. ``rebuild`` recomputes statements from
+    PaymentTransaction and the ride ledger in chunks of wallets.
+    """
+
+    CHUNK_SIZE = int(os.getenv('STATEMENT_CHUNK_SIZE', '500'))
+    DEFAULT_MONTHS = 12
+    MAX_MONTHS = 60
+
+    CREDITS = Q(transaction_type__in=['DEPOSIT', 'RIDE_CHARGE'], status='SUCCESS')
+    DEBITS = Q(transaction_type='WITHDRAWAL', status=WithdrawalStatus.COMPLETED)
+    LEDGER = Q(transaction_type__in=['RIDE_FARE', 'COMMISSION'], status='COMPLETED')
+
+    @staticmethod
+    def month_of(moment):
+        return timezone.localtime(moment).date().replace(day=1)
+
+    @staticmethod
+    def _case(values, field='wallet_id'):
+        return Case(*[When(**{field: key}, then=Value(value)) for key, value in values.items()], default=Value(0))
+
+    @classmethod
+    def record(cls, entries, at=None):
+        """
+        Add settled amounts to this month's statements. ``entries`` are
+        ``(user_id, amount)`` pairs, positive for credits and negative for
+        debits. Users without a wallet are skipped.
+        """
+        totals = defaultdict(lambda: [0, 0, 0])  # credits, debits, count
+        for user_id, amount in entries:
+            total = totals[user_id]
+            total[0 if amount >= 0 else 1] += abs(amount)
+            total[2] += 1
+        if not totals:
+            return 0
+
+        wallets = dict(Wallet.objects.filter(user_id__in=totals).values_list('user_id', 'id'))
+        credits, debits, counts, net = {}, {}, {}, {}
+        for user_id, wallet_id in wallets.items():
+            credits[wallet_id], debits[wallet_id], counts[wallet_id] = totals[user_id]
+            net[wallet_id] = credits[wallet_id] - debits[wallet_id]
+        if not net:
+            return 0
+        month = cls.month_of(at or timezone.now())
+
+        with transaction.atomic():
+            # Open the month from the latest earlier closing balance
+            existing = set(
+                WalletStatement.objects.filter(wallet_id__in=net, month=month).values_list('wallet_id', flat=True)
+            )
+            missing = set(net) - existing
+            if missing:
+                previous = WalletStatement.objects.filter(wallet=OuterRef('pk'), month__lt=month).order_by('-month')
+                openings = (
+                    Wallet.objects.filter(id__in=missing)
+                    .annotate(opening=Subquery(previous.values('closing_balance')[:1]))
+                    .values_list('id', 'opening')
+                )
+                WalletStatement.objects.bulk_create(
+                    [WalletStatement(wallet_id=wallet_id, month=month, opening_balance=opening or 0,
+                                     closing_balance=opening or 0)
+                     for wallet_id, opening in openings],
+                    ignore_conflicts=True,
+                )
+
+            now = timezone.now()
+            WalletStatement.objects.filter(wallet_id__in=net, month=month).update(
+                credits=F('credits') + cls._case(credits),
+                debits=F('debits') + cls._case(debits),
+                transaction_count=F('transaction_count') + cls._case(counts),
+                closing_balance=F('closing_balance') + cls._case(net),
+                updated_at=now,
+            )
+            # Only rows recorded out of order need this; usually it matches nothing
+            changed = {wallet_id: delta for wallet_id, delta in net.items() if delta}
+            if changed:
+                WalletStatement.objects.filter(wallet_id__in=changed, month__gt=month).update(
+                    opening_balance=F('opening_balance') + cls._case(changed),
+                    closing_balance=F('closing_balance') + cls._case(changed),
+                    updated_at=now,
+                )
+        return len(net)
+
+    @classmethod
+    def record_payment(cls, payment, at=None):
+        """Record one settled PaymentTransaction."""
+        amount = -payment.amount if payment.transaction_type == 'WITHDRAWAL' else payment.amount
+        return cls.record([(payment.user_id, amount)], at=at)
+
+    @classmethod
+    def statements_for(cls, user_id, before=None, months=None):
+        """Newest-first statements of the user's wallet for months before ``before``."""
+        months = min(months or cls.DEFAULT_MONTHS, cls.MAX_MONTHS)
+        statements = WalletStatement.objects.filter(wallet__user_id=user_id)
+        if before:
+            statements = statements.filter(month__lt=before)
+        return list(statements.order_by('-month')[:months])
+
+    @classmethod
+    def monthly_totals(cls, user_ids):
+        """``{user_id: [(month, credits, debits, count), ...]}`` in month order, from payments and the ride ledger."""
+        payments = (
+            PaymentTransaction.objects.filter(user_id__in=user_ids)
+            .filter(cls.CREDITS | cls.DEBITS)
+            .annotate(month=TruncMonth('updated_at', output_field=DateField()))
+            .values('user_id', 'month')
+            .annotate(
+                credits=Sum(Case(When(cls.CREDITS, then=F('amount')), default=Value(0))),
+                debits=Sum(Case(When(cls.DEBITS, then=F('amount')), default=Value(0))),
+                count=Count('id'),
+            )
+            .values_list('user_id', 'month', 'credits', 'debits', 'count')
+        )
+        ledger = Transaction.objects.filter(cls.LEDGER).annotate(
+            month=TruncMonth('created_at', output_field=DateField())
+        )
+        received = (
+            ledger.filter(to_wallet__user_id__in=user_ids)
+            .values('to_wallet__user_id', 'month')
+            .annotate(credits=Sum('amount'), debits=Value(0), count=Count('id'))
+            .values_list('to_wallet__user_id', 'month', 'credits', 'debits', 'count')
+        )
+        paid = (
+            ledger.filter(from_wallet__user_id__in=user_ids)
+            .values('from_wallet__user_id', 'month')
+            .annotate(credits=Value(0), debits=Sum('amount'), count=Count('id'))
+            .values_list('from_wallet__user_id', 'month', 'credits', 'debits', 'count')
+        )
+
+        months = defaultdict(lambda: [0, 0, 0])
+        for rows in (payments, received, paid):
+            for user_id, month, credits, debits, count in rows:
+                total = months[user_id, month]
+                total[0] += credits
+                total[1] += debits
+                total[2] += count
+        totals = defaultdict(list)
+        for (user_id, month), (credits, debits, count) in sorted(months.items()):
+            totals[user_id].append((month, credits, debits, count))
+        return totals
+
+    @classmethod
+    def rebuild(cls, chunk_size=None, wallet_ids=None):
+        """
+        Recompute statements from PaymentTransaction, replacing the rows of
+        each chunk of wallets in one transaction. Yields ``(wallets,
+        statements)`` per chunk.
+        """
+        chunk_size = chunk_size or cls.CHUNK_SIZE
+        wallets = Wallet.objects.all()
+        if wallet_ids:
+            wallets = wallets.filter(id__in=wallet_ids)
+        last_id = 0
+        while True:
+            chunk = list(wallets.filter(id__gt=last_id).order_by('id').values_list('id', 'user_id')[:chunk_size])
+            if not chunk:
+                return
+            last_id = chunk[-1][0]
+            by_user = {user_id: wallet_id for wallet_id, user_id in chunk}
+
+            rows = []
+            for user_id, months in cls.monthly_totals(list(by_user)).items():
+                balance = 0
+                for month, credits, debits, count in months:
+                    closing = balance + credits - debits
+                    rows.append(WalletStatement(
+                        wallet_id=by_user[user_id], month=month, opening_balance=balance,
+                        credits=credits, debits=debits, closing_balance=closing, transaction_count=count,
+                    ))
+                    balance = closing
+
+            with transaction.atomic():
+                WalletStatement.objects.filter(wallet_id__in=by_user.values()).delete()
+                WalletStatement.objects.bulk_create(rows, batch_size=chunk_size)
+            yield len(chunk), len(rows)
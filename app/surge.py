@@ -0,0 +1,249 @@
+import os
+import time
+from collections import defaultdict
+from math import floor
+from django.core.cache import cache
+
+
+class CacheSurgeStore:
+    """
+    Surge counters kept in the Django cache so every worker process sees the
+    same sliding windows. Each (kind, cell, bucket) is one integer key that
+    expires once it falls out of the window.
+    """
+
+    PREFIX = 'surge'
+
+    def __init__(self, backend=None):
+        self.cache = backend or cache
+
+    def _key(self, *parts):
+        return ':'.join([self.PREFIX, *map(str, parts)])
+
+    def add(self, kind, cell, bucket, amount, ttl):
+        key = self._key(kind, cell, bucket)
+        self.cache.add(key, 0, ttl)
+        try:
+            self.cache.incr(key, amount)
+        except ValueError:
+            # Key expired between add() and incr()
+            self.cache.set(key, amount, ttl)
+
+    def window_total(self, kind, cell, first_bucket, last_bucket):
+        keys = [self._key(kind, cell, bucket) for bucket in range(first_bucket, last_bucket + 1)]
+        return sum(self.cache.get_many(keys).values())
+
+    def add_unique(self, key, ttl):
+        return self.cache.add(self._key('seen', key), 1, ttl)
+
+    def get_state(self, cell):
+        return self.cache.get(self._key('multiplier', cell))
+
+    def set_state(self, cell, state, ttl):
+        self.cache.set(self._key('multiplier', cell), state, ttl)
+
+    def try_lock(self, cell, ttl):
+        return self.cache.add(self._key('lock', cell), 1, ttl)
+
+
+class MemorySurgeStore:
+    """Single-process store driven by an explicit clock, used for replays."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self._counts = defaultdict(dict)
+        self._seen = {}
+        self._states = {}
+
+    def add(self, kind, cell, bucket, amount, ttl):
+        buckets = self._counts[(kind, cell)]
+        buckets[bucket] = buckets.get(bucket, 0) + amount
+
+    def window_total(self, kind, cell, first_bucket, last_bucket):
+        buckets = self._counts.get((kind, cell))
+        if not buckets:
+            return 0
+        for stale in [bucket for bucket in buckets if bucket < first_bucket]:
+            del buckets[stale]
+        return sum(count for bucket, count in buckets.items() if bucket <= last_bucket)
+
+    def add_unique(self, key, ttl):
+        now = self.clock()
+        if self._seen.get(key, 0) > now:
+            return False
+        self._seen[key] = now + ttl
+        return True
+
+    def get_state(self, cell):
+        return self._states.get(cell)
+
+    def set_state(self, cell, state, ttl):
+        self._states[cell] = state
+
+    def try_lock(self, cell, ttl):
+        return True
+
+
+class SurgeEngine:
+    """
+    Demand/supply ratio per geo cell turned into a smoothed fare multiplier.
+
+    Demand is the number of ride requests and supply the number of distinct
+    available drivers seen in a cell during the sliding window. Cells with
+    no driver reports in the window carry no supply signal and stay at 1.0,
+    so areas drivers have not reported from yet are not priced up on
+    demand alone. Multipliers are recomputed at most once per ``refresh_seconds`` per cell and memoised
+    in-process, so a lookup is a dictionary hit in the common case.
+    """
+
+    def __init__(self, store, *, cell_size=0.01, window_seconds=300, bucket_seconds=10,
+                 refresh_seconds=5, smoothing=0.3, sensitivity=0.5, max_multiplier=3.0,
+                 clock=time.time):
+        self.store = store
+        self.cell_size = cell_size
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.refresh_seconds = refresh_seconds
+        self.smoothing = smoothing
+        self.sensitivity = sensitivity
+        self.max_multiplier = max_multiplier
+        self.clock = clock
+        self._local = {}
+        self._active = {}
+
+    def cell_for(self, latitude, longitude):
+        return f"{int(floor(latitude / self.cell_size))}:{int(floor(longitude / self.cell_size))}"
+
+    def _bucket(self, at):
+        return int(at // self.bucket_seconds)
+
+    def record_demand(self, latitude, longitude, count=1, at=None):
+        at = self.clock() if at is None else at
+        cell = self.cell_for(latitude, longitude)
+        self.store.add('demand', cell, self._bucket(at), count, self.window_seconds + self.bucket_seconds)
+        self._active[cell] = at
+
+    def record_supply(self, driver_id, latitude, longitude, at=None):
+        """Count a driver once per cell per window, however often their app reports in."""
+        at = self.clock() if at is None else at
+        cell = self.cell_for(latitude, longitude)
+        window = int(at // self.window_seconds)
+        if self.store.add_unique(f"{driver_id}:{cell}:{window}", self.window_seconds):
+            self.store.add('supply', cell, self._bucket(at), 1, self.window_seconds + self.bucket_seconds)
+        self._active[cell] = at
+
+    def mark_active(self, latitude, longitude, at=None):
+        """Include a cell in :meth:`recompute_active` without recording an event."""
+        at = self.clock() if at is None else at
+        cell = self.cell_for(latitude, longitude)
+        self._active[cell] = max(at, self._active.get(cell, at))
+
+    def raw_multiplier(self, demand, supply):
+        ratio = (demand + 1) / (supply + 1)
+        if ratio <= 1:
+            return 1.0
+        return min(self.max_multiplier, 1.0 + self.sensitivity * (ratio - 1))
+
+    def recompute(self, cell, at=None):
+        at = self.clock() if at is None else at
+        last_bucket = self._bucket(at)
+        first_bucket = last_bucket - self.window_seconds // self.bucket_seconds + 1
+        demand = self.store.window_total('demand', cell, first_bucket, last_bucket)
+        supply = self.store.window_total('supply', cell, first_bucket, last_bucket)
+
+        previous = self.store.get_state(cell)
+        target = self.raw_multiplier(demand, supply) if supply else 1.0
+        current = previous['smoothed'] if previous else 1.0
+        smoothed = current + self.smoothing * (target - current)
+        multiplier = round(smoothed, 2)
+
+        state = {'multiplier': multiplier, 'smoothed': smoothed, 'computed_at': at, 'demand': demand, 'supply': supply}
+        self.store.set_state(cell, state, self.window_seconds * 2)
+        self._local[cell] = (multiplier, at)
+        return multiplier
+
+    def recompute_active(self, at=None):
+        """Refresh every cell this process has seen activity in during the window."""
+        at = self.clock() if at is None else at
+        for cell, last_seen in list(self._active.items()):
+            if at - last_seen > self.window_seconds * 2:
+                del self._active[cell]
+                continue
+            self.recompute(cell, at)
+        return len(self._active)
+
+    def multiplier_for(self, latitude, longitude, at=None):
+        at = self.clock() if at is None else at
+        cell = self.cell_for(latitude, longitude)
+
+        local = self._local.get(cell)
+        if local and at - local[1] < self.refresh_seconds:
+            return local[0]
+
+        state = self.store.get_state(cell)
+        if state and at - state['computed_at'] < self.refresh_seconds:
+            self._local[cell] = (state['multiplier'], state['computed_at'])
+            return state['multiplier']
+
+        if self.store.try_lock(cell, self.refresh_seconds):
+            return self.recompute(cell, at)
+        # Another worker is refreshing this cell; serve the last known value
+        return state['multiplier'] if state else 1.0
+
+
+class SurgePricingModule:
+    """
+    Process-wide surge engine backed by the shared cache, configured from
+    the environment. Off unless SURGE_PRICING_ENABLED is set.
+    """
+
+    ENABLED = os.getenv('SURGE_PRICING_ENABLED', 'False').lower() in ('1', 'true', 'yes')
+    CELL_SIZE = float(os.getenv('SURGE_CELL_SIZE', '0.01'))
+    WINDOW_SECONDS = int(os.getenv('SURGE_WINDOW_SECONDS', '300'))
+    BUCKET_SECONDS = int(os.getenv('SURGE_BUCKET_SECONDS', '10'))
+    REFRESH_SECONDS = int(os.getenv('SURGE_REFRESH_SECONDS', '5'))
+    SMOOTHING = float(os.getenv('SURGE_SMOOTHING', '0.3'))
+    SENSITIVITY = float(os.getenv('SURGE_SENSITIVITY', '0.5'))
+    MAX_MULTIPLIER = float(os.getenv('SURGE_MAX_MULTIPLIER', '3.0'))
+
+    _engine = None
+
+    @classmethod
+    def build_engine(cls, store, clock=time.time):
+        return SurgeEngine(
+            store,
+            cell_size=cls.CELL_SIZE,
+            window_seconds=cls.WINDOW_SECONDS,
+            bucket_seconds=cls.BUCKET_SECONDS,
+            refresh_seconds=cls.REFRESH_SECONDS,
+            smoothing=cls.SMOOTHING,
+            sensitivity=cls.SENSITIVITY,
+            max_multiplier=cls.MAX_MULTIPLIER,
+            clock=clock,
+        )
+
+    @classmethod
+    def engine(cls):
+        if cls._engine is None:
+            cls._engine = cls.build_engine(CacheSurgeStore())
+        return cls._engine
+
+    @classmethod
+    def is_enabled(cls):
+        return cls.ENABLED
+
+    @classmethod
+    def record_ride_request(cls, ride):
+        if cls.ENABLED and ride.pickup_latitude is not None and ride.pickup_longitude is not None:
+            cls.engine().record_demand(ride.pickup_latitude, ride.pickup_longitude)
+
+    @classmethod
+    def record_driver_available(cls, driver_id, latitude, longitude):
+        if cls.ENABLED:
+            cls.engine().record_supply(driver_id, latitude, longitude)
+
+    @classmethod
+    def multiplier_for(cls, latitude, longitude):
+        if not cls.ENABLED:
+            return 1.0
+        return cls.engine().multiplier_for(latitude, longitude)
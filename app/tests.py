@@ -1,3 +1,1389 @@
-from django.test import TestCase
+import fcntl
+import io
+import random
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from unittest import mock, skipUnless
+import requests
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from .cards import CardAuthorizationModule, CardChargeError
+from .catalog import vehicle_catalog
+from .chat import ChatModule
+from .fakepaystack import FakePaystackServer
+from .geofencing import PRICING_ZONE, SERVICE_AREA, CompiledFence, GeofenceIndex, STRTree, normalize_rings
+from .idgen import IdGenerationModule, SnowflakeGenerator, decode_base32, encode_base32
+from .marketplace import MarketplaceModule
+from .models import (
+    Bid, BidStatus, Business, BusinessStatus, CardAuthorization, Conversation, DeliveryStatus, Geofence,
+    Notification, NotificationStatus, NotificationType, OTP, Parcel, PaymentTransaction, PayoutDestination, Profile,
+    RecipientType, Ride, RideStatus, Transaction, User, VehicleColor, VehicleMake, VehicleModel, VehicleType,
+    Wallet, WalletStatement, WithdrawalStatus,
+)
+from .notifications import NotificationModule
+from .otp import CacheOTPBackend, DatabaseOTPBackend, OTPModule, OTPPurpose, OTPRateLimited
+from .payment import PaymentProcessingModule
+from .payouts import PayoutModule
+from .routing import OSMGraphBuilder, RoadGraph, RoutingError, RoutingModule, haversine_m
+from .serializers import ChangePasswordSerializer, UpdatePasswordSerializer
+from .settlement import SettlementModule
+from .statements import StatementModule
+from .surge import MemorySurgeStore, SurgePricingModule
+from .tokens import TokenBlacklist, TokenModule
+from .tracking import ParcelTrackingModule
+from .wallets import WalletModule
 
-# Create your tests here.
+
+def make_user(name, balance=None, **fields):
+    user = User.objects.create(username=name, name=name, email=f'{name}@example.com', **fields)
+    if balance is not None:
+        Wallet.objects.create(user=user, active_balance=balance)
+    return user
+
+
+def balance_of(user):
+    return Wallet.objects.get(user=user).active_balance
+
+
+def use_fake_paystack(test):
+    server = FakePaystackServer().start()
+    test.addCleanup(server.stop)
+    for patcher in (
+        mock.patch.object(PaymentProcessingModule, 'BASE_URL', server.base_url),
+        mock.patch.object(PaymentProcessingModule, 'SECRET_KEY', 'sk_test_payouts'),
+    ):
+        patcher.start()
+        test.addCleanup(patcher.stop)
+    return server
+
+
+class BaseTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+
+class RoutingTests(SimpleTestCase):
+    # A square of four nodes about 1.1km a side: A (0, 0), B (0, 0.01), C (0.01, 0.01), D (0.01, 0)
+    LATITUDES = [0.0, 0.0, 0.01, 0.01]
+    LONGITUDES = [0.0, 0.01, 0.01, 0.0]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def graph(self, edges):
+        path = os.path.join(self.directory, 'graph.bin')
+        RoadGraph.write(path, self.LATITUDES, self.LONGITUDES, edges)
+        graph = RoadGraph.open(path)
+        self.addCleanup(graph.close)
+        return graph
+
+    def edge(self, source, target, speed_mps):
+        length = haversine_m(self.LATITUDES[source], self.LONGITUDES[source],
+                             self.LATITUDES[target], self.LONGITUDES[target])
+        return source, target, length, length / speed_mps
+
+    def test_nearest_node_snaps_to_the_closest_road(self):
+        graph = self.graph([self.edge(0, 1, 10)])
+        node, distance = graph.nearest_node(0.0101, 0.0099)
+        self.assertEqual((graph.latitudes[node], graph.longitudes[node]), (0.01, 0.01))
+        self.assertLess(distance, 20)
+        with self.assertRaises(RoutingError):
+            graph.nearest_node(0.5, 0.5, max_distance_m=500)
+
+    def test_shortest_path_prefers_the_faster_detour(self):
+        # Direct A -> B at walking pace, A -> D -> C -> B at 20 m/s
+        graph = self.graph([self.edge(0, 1, 1), self.edge(0, 3, 20), self.edge(3, 2, 20), self.edge(2, 1, 20)])
+        length_m, time_s = graph.route(0.0, 0.0, 0.0, 0.01)
+        self.assertAlmostEqual(length_m, 3 * haversine_m(0, 0, 0, 0.01), delta=5)
+        self.assertAlmostEqual(time_s, length_m / 20, delta=1)
+
+    def test_one_way_edges_are_not_driven_backwards(self):
+        graph = self.graph([self.edge(0, 1, 10)])
+        self.assertGreater(graph.route(0.0, 0.0, 0.0, 0.01)[0], 0)
+        with self.assertRaises(RoutingError):
+            graph.route(0.0, 0.01, 0.0, 0.0)
+
+    def test_osm_extract_is_built_with_speeds_and_directions(self):
+        osm = os.path.join(self.directory, 'extract.osm')
+        with open(osm, 'w') as handle:
+            handle.write('''<osm>
+  <node id="1" lat="0.0" lon="0.0"/><node id="2" lat="0.0" lon="0.01"/><node id="3" lat="0.01" lon="0.01"/>
+  <way id="10"><nd ref="1"/><nd ref="2"/><tag k="highway" v="primary"/><tag k="maxspeed" v="36"/></way>
+  <way id="11"><nd ref="2"/><nd ref="3"/><tag k="highway" v="residential"/><tag k="oneway" v="-1"/></way>
+  <way id="12"><nd ref="1"/><nd ref="3"/><tag k="highway" v="footway"/></way>
+</osm>''')
+        output = os.path.join(self.directory, 'graph.bin')
+        self.assertEqual(OSMGraphBuilder.build(osm, output), (3, 3))
+
+        graph = RoadGraph.open(output)
+        self.addCleanup(graph.close)
+        length_m, time_s = graph.route(0.0, 0.0, 0.0, 0.01)
+        self.assertAlmostEqual(time_s, length_m / 10, delta=1)  # 36 km/h
+        self.assertGreater(graph.route(0.01, 0.01, 0.0, 0.0)[0], 0)
+        with self.assertRaises(RoutingError):
+            graph.route(0.0, 0.0, 0.01, 0.01)  # the residential way only runs from 3 to 2
+
+    def test_module_reports_kilometres_and_minutes(self):
+        path = os.path.join(self.directory, 'graph.bin')
+        RoadGraph.write(path, self.LATITUDES, self.LONGITUDES, [self.edge(0, 1, 10)])
+        with mock.patch.object(RoutingModule, 'GRAPH_PATH', path), mock.patch.object(RoutingModule, '_graph', None):
+            result = RoutingModule.route(0.0, 0.0, 0.0, 0.01)
+            RoutingModule._graph.close()
+        self.assertEqual(result, {'distance_km': 1.11, 'duration_minutes': 2})
+
+
+class SurgeEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1_000_000.0
+        self.store = MemorySurgeStore(lambda: self.now)
+        self.engine = self.build()
+
+    def build(self):
+        return SurgePricingModule.build_engine(self.store, clock=lambda: self.now)
+
+    def test_demand_without_supply_does_not_surge(self):
+        for _ in range(20):
+            self.engine.record_demand(-1.28, 36.82)
+        self.assertEqual(self.engine.recompute(self.engine.cell_for(-1.28, 36.82)), 1.0)
+
+    def test_multiplier_moves_towards_the_demand_ratio(self):
+        self.engine.record_supply(1, -1.28, 36.82)
+        for _ in range(5):
+            self.engine.record_demand(-1.28, 36.82)
+        cell = self.engine.cell_for(-1.28, 36.82)
+        first = self.engine.recompute(cell)
+        self.assertGreater(first, 1.0)
+        self.assertGreater(self.engine.recompute(cell), first)
+        self.assertLessEqual(self.engine.recompute(cell), self.engine.max_multiplier)
+
+    def test_driver_reports_count_once_per_window(self):
+        for _ in range(10):
+            self.engine.record_supply(1, -1.28, 36.82)
+        self.engine.record_demand(-1.28, 36.82)
+        self.engine.recompute(self.engine.cell_for(-1.28, 36.82))
+        self.assertEqual(self.store.get_state(self.engine.cell_for(-1.28, 36.82))['supply'], 1)
+
+    def test_events_leave_the_window(self):
+        self.engine.record_supply(1, -1.28, 36.82)
+        for _ in range(5):
+            self.engine.record_demand(-1.28, 36.82)
+        self.now += self.engine.window_seconds + self.engine.bucket_seconds
+        self.engine.recompute(self.engine.cell_for(-1.28, 36.82))
+        state = self.store.get_state(self.engine.cell_for(-1.28, 36.82))
+        self.assertEqual((state['demand'], state['supply']), (0, 0))
+
+    def test_lookups_are_memoised_between_refreshes(self):
+        self.engine.record_supply(1, -1.28, 36.82)
+        self.engine.record_demand(-1.28, 36.82)
+        first = self.engine.multiplier_for(-1.28, 36.82)
+        for _ in range(5):
+            self.engine.record_demand(-1.28, 36.82)
+        self.assertEqual(self.engine.multiplier_for(-1.28, 36.82), first)
+        self.now += self.engine.refresh_seconds
+        self.assertGreater(self.engine.multiplier_for(-1.28, 36.82), first)
+
+
+class SurgeCommandTests(TestCase):
+    def test_demand_recorded_after_startup_is_refreshed(self):
+        now = timezone.now().timestamp()
+        store = MemorySurgeStore(lambda: now)
+        engine = SurgePricingModule.build_engine(store, clock=lambda: now)
+        customer = make_user('rider')
+
+        def request_rides():
+            # A web worker records the requests in its own process
+            worker = SurgePricingModule.build_engine(store, clock=lambda: now)
+            worker.record_supply(1, -1.28, 36.82)
+            for _ in range(5):
+                Ride.objects.create(customer=customer, pickup_location='A', dropoff_location='B',
+                                    pickup_latitude=-1.28, pickup_longitude=36.82)
+                worker.record_demand(-1.28, 36.82)
+
+        class Stop(Exception):
+            pass
+
+        ticks = iter([request_rides])
+
+        def sleep(seconds):
+            tick = next(ticks, None)
+            if tick is None:
+                raise Stop()
+            tick()
+
+        with mock.patch.object(SurgePricingModule, 'engine', return_value=engine), \
+                mock.patch('app.management.commands.run_surge_engine.time.sleep', side_effect=sleep):
+            with self.assertRaises(Stop):
+                call_command('run_surge_engine', interval=0, stdout=io.StringIO())
+
+        self.assertGreater(store.get_state(engine.cell_for(-1.28, 36.82))['multiplier'], 1.0)
+
+
+class GeofenceTests(BaseTestCase):
+    SQUARE = [[[0.0, 0.0], [0.0, 1.0], [1.0, 1.0], [1.0, 0.0]]]
+
+    def fence(self, name, vertices=None, zone_type=SERVICE_AREA, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Geofence.objects.create(name=name, vertices=vertices, zone_type=zone_type, **fields)
+
+    def test_rings_are_validated(self):
+        self.assertEqual(normalize_rings([[0, 0], [0, 1], [1, 1], [0, 0]]), [[[0.0, 0.0], [0.0, 1.0], [1.0, 1.0]]])
+        for bad in ([], [[0, 0], [0, 1]], [[[0, 0], [0, 1], [1, 'x']]], [[0, 0], [0, 1], [95, 1]]):
+            with self.assertRaises(ValueError):
+                normalize_rings(bad)
+
+    def test_polygon_and_circle_containment(self):
+        square = CompiledFence.from_geofence(Geofence(id=1, name='square', vertices=self.SQUARE))
+        self.assertEqual(square.contains_many([(0.5, 0.5), (1.5, 0.5), (0.5, -0.1)]), [True, False, False])
+        two = CompiledFence.from_geofence(Geofence(
+            id=2, name='two', vertices=self.SQUARE + [[[2.0, 2.0], [2.0, 3.0], [3.0, 3.0], [3.0, 2.0]]],
+        ))
+        self.assertEqual(two.contains_many([(0.5, 0.5), (2.5, 2.5), (1.5, 1.5)]), [True, True, False])
+        circle = CompiledFence.from_geofence(Geofence(id=3, name='circle', coordinates='0,0', radius=10))
+        self.assertEqual(circle.contains_many([(0.05, 0.05), (0.1, 0.1)]), [True, False])
+
+    def test_tree_matches_a_linear_scan(self):
+        rng = random.Random(7)
+        boxes = []
+        for index in range(500):
+            lat, lng = rng.uniform(-1, 1), rng.uniform(36, 38)
+            boxes.append(((lat, lng, lat + rng.uniform(0, 0.2), lng + rng.uniform(0, 0.2)), index))
+        tree = STRTree(boxes)
+        for _ in range(200):
+            lat, lng = rng.uniform(-1, 1.2), rng.uniform(36, 38.2)
+            expected = {value for (a, b, c, d), value in boxes if a <= lat <= c and b <= lng <= d}
+            self.assertEqual(set(tree.query_point(lat, lng)), expected)
+
+    def test_index_follows_saves_and_deletes(self):
+        index = GeofenceIndex()
+        square = self.fence('square', self.SQUARE)
+        self.assertEqual([fence.id for fence in index.containing(0.5, 0.5)], [square.id])
+
+        square.vertices = [[[5.0, 5.0], [5.0, 6.0], [6.0, 6.0], [6.0, 5.0]]]
+        with self.captureOnCommitCallbacks(execute=True):
+            square.save()
+        with mock.patch.object(index, '_load_all', side_effect=AssertionError('full reload')):
+            self.assertEqual(index.containing(0.5, 0.5), [])
+            self.assertEqual([fence.id for fence in index.containing(5.5, 5.5)], [square.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            square.delete()
+        self.assertEqual(index.containing(5.5, 5.5), [])
+
+    def test_unreadable_legacy_fence_is_skipped(self):
+        good = self.fence('good', self.SQUARE)
+        legacy = self.fence('legacy', coordinates='0.5,0.5', radius=1, zone_type=PRICING_ZONE)
+        Geofence.objects.filter(pk=legacy.pk).update(coordinates='not,a-point')
+        with self.assertLogs('app.geofencing', 'ERROR'):
+            fences = GeofenceIndex().fences()
+        self.assertEqual(list(fences), [good.id])
+
+
+class MarketplaceSearchTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_user('owner')
+        self.driver = make_user('courier', role='DRIVER')
+        self.jobs = [
+            self.business('HIGH', 150, 'FIFTEEN_MINUTES'),
+            self.business('HIGH', 700, 'ONE_HOUR'),
+            self.business('LOW', 450, 'THIRTY_MINUTES'),
+            self.business('MEDIUM', 2500, 'TWO_HOURS'),
+            self.business('LOW', 900, 'FIFTEEN_MINUTES', status=BusinessStatus.AWARDED),
+        ]
+
+    def business(self, priority, fee, waiting, **fields):
+        return Business.objects.create(
+            owner=self.owner, priority=priority, delivery_fee=fee, maximum_waiting_time=waiting,
+            pickup_point='Depot', **fields,
+        )
+
+    def search(self, query):
+        params = QueryDict(query)
+        return MarketplaceModule.apply_filters(Business.objects.filter(status=BusinessStatus.AVAILABLE), params)
+
+    def test_filters_combine(self):
+        self.assertEqual(set(self.search('priority=HIGH')), set(self.jobs[:2]))
+        self.assertEqual(set(self.search('priority=HIGH&priority=LOW&delivery_fee_max=500')), {self.jobs[0], self.jobs[2]})
+        self.assertEqual(set(self.search('maximum_waiting_time=THIRTY_MINUTES')), {self.jobs[0], self.jobs[2]})
+        self.assertEqual(set(self.search('delivery_fee_min=x')), set(self.jobs[:4]))
+
+    def test_each_facet_ignores_its_own_filter(self):
+        params = QueryDict('priority=HIGH&delivery_fee_min=500')
+        facets = MarketplaceModule.facets(Business.objects.filter(status=BusinessStatus.AVAILABLE), params)
+        self.assertEqual(facets['priority'], {'LOW': 0, 'MEDIUM': 1, 'HIGH': 1})
+        self.assertEqual(
+            [bucket['count'] for bucket in facets['delivery_fee']], [1, 0, 1, 0, 0]  # HIGH jobs only
+        )
+
+    def test_drivers_page_through_available_jobs(self):
+        client = APIClient()
+        client.force_authenticate(self.driver)
+        seen, url = [], '/api/businesses/marketplace/?page_size=2'
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(sum(response.data['facets']['priority'].values()), 4)
+            seen += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, [job.id for job in reversed(self.jobs[:4])])
+
+    def test_owners_only_see_their_own_jobs(self):
+        other = make_user('other')
+        Business.objects.create(
+            owner=other, priority='HIGH', delivery_fee=100, maximum_waiting_time='ONE_HOUR', pickup_point='Elsewhere',
+        )
+        scoped = MarketplaceModule.scope(Business.objects.all(), self.owner)
+        self.assertEqual(set(scoped), set(self.jobs))
+
+
+def make_business(owner, fee=500, **fields):
+    fields.setdefault('pickup_point', 'Depot')
+    return Business.objects.create(owner=owner, delivery_fee=fee, **fields)
+
+
+class BusinessListingTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_user('owner')
+        self.drivers = [make_user(f'driver{i}', role='DRIVER') for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def add_jobs(self, count):
+        for _ in range(count):
+            business = make_business(self.owner)
+            for driver in self.drivers:
+                Bid.objects.create(business=business, driver=driver, bid_amount=400)
+
+    def listing_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/businesses/marketplace/?expand=full')
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_full_listing_query_count_does_not_grow_with_rows(self):
+        self.add_jobs(2)
+        _, few = self.listing_queries()
+        self.add_jobs(5)
+        response, many = self.listing_queries()
+        self.assertEqual(few, many)
+        self.assertEqual(len(response.data['results']), 7)
+        self.assertEqual(len(response.data['results'][0]['bids']), 3)
+
+    def test_summary_listing_reports_bid_figures(self):
+        business = make_business(self.owner)
+        Bid.objects.create(business=business, driver=self.drivers[0], bid_amount=300)
+        Bid.objects.create(business=business, driver=self.drivers[1], bid_amount=450)
+        row = self.client.get('/api/businesses/marketplace/').data['results'][0]
+        self.assertEqual((row['bid_count'], row['min_bid'], row['max_bid']), (2, 300, 450))
+
+
+class BidAwardTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_user('owner')
+        self.business = make_business(self.owner, published=True)
+        self.bids = [
+            Bid.objects.create(business=self.business, driver=make_user(f'driver{i}', role='DRIVER'), bid_amount=300 + i)
+            for i in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def award(self, bid):
+        return self.client.post(f'/api/bids/{bid.id}/award_bid/')
+
+    def test_award_flips_business_and_rejects_other_bids(self):
+        response = self.award(self.bids[1])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], BidStatus.AWARDED)
+        self.business.refresh_from_db()
+        self.assertEqual(self.business.status, BusinessStatus.AWARDED)
+        statuses = dict(Bid.objects.values_list('id', 'status'))
+        self.assertEqual(
+            statuses,
+            {self.bids[0].id: BidStatus.REJECTED, self.bids[1].id: BidStatus.AWARDED, self.bids[2].id: BidStatus.REJECTED},
+        )
+
+    def test_second_award_loses(self):
+        self.assertTrue(MarketplaceModule.award_bid(self.bids[0], self.owner))
+        self.assertFalse(MarketplaceModule.award_bid(self.bids[2], self.owner))
+        self.assertEqual(self.award(self.bids[2]).status_code, 409)
+        self.assertEqual(Bid.objects.filter(status=BidStatus.AWARDED).count(), 1)
+
+    def test_only_the_owner_can_award(self):
+        self.client.force_authenticate(self.bids[0].driver)
+        self.assertEqual(self.award(self.bids[0]).status_code, 403)
+        self.assertFalse(MarketplaceModule.award_bid(self.bids[0], self.bids[0].driver))
+
+    def test_close_expired_in_chunks(self):
+        fresh = make_business(self.owner, published=True)
+        unpublished = make_business(self.owner)
+        later = timezone.now() + timedelta(minutes=31)
+        chunks = list(MarketplaceModule.close_expired(now=later, chunk_size=1))
+        self.assertEqual(chunks, [(1, 3), (1, 0)])
+        self.assertEqual(
+            set(Business.objects.filter(status=BusinessStatus.EXPIRED)), {self.business, fresh}
+        )
+        unpublished.refresh_from_db()
+        self.assertEqual(unpublished.status, BusinessStatus.AVAILABLE)
+        self.assertFalse(Bid.objects.exclude(status=BidStatus.REJECTED).exists())
+
+
+class DuplicateBidTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.business = make_business(make_user('owner'))
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('courier', role='DRIVER'))
+
+    def test_second_bid_from_the_same_driver_is_rejected(self):
+        payload = {'business': self.business.id, 'bid_amount': 450}
+        self.assertEqual(self.client.post('/api/bids/', payload).status_code, 201)
+        response = self.client.post('/api/bids/', {**payload, 'bid_amount': 400})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(Bid.objects.values_list('bid_amount', flat=True)), [450])
+
+
+class IdGenerationTests(SimpleTestCase):
+    def setUp(self):
+        IdGenerationModule._reset_after_fork()
+        self.addCleanup(IdGenerationModule._reset_after_fork)
+        lock_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(lock_dir.cleanup)
+        patcher = mock.patch.multiple(IdGenerationModule, LOCK_DIR=lock_dir.name, NODE_ID='7')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_base32_round_trip(self):
+        for value in (0, 1, 123456789, (1 << 60) - 1):
+            code = encode_base32(value)
+            self.assertEqual(len(code), 12)
+            self.assertEqual(decode_base32(code), value)
+        self.assertEqual(decode_base32('0000000000O1'), decode_base32('00000000000l'))
+        with self.assertRaises(ValueError):
+            decode_base32('00000000000U')
+
+    def test_threads_sharing_a_generator_never_collide(self):
+        generator = SnowflakeGenerator(1, IdGenerationModule.EPOCH_MS)
+        with ThreadPoolExecutor(4) as pool:
+            batches = list(pool.map(lambda _: [generator.next_int() for _ in range(5000)], range(4)))
+        self.assertEqual(len({value for batch in batches for value in batch}), 20000)
+
+    def test_sequence_overflow_and_clock_rollback_borrow_the_next_millisecond(self):
+        now = [5_000_000_000]
+        generator = SnowflakeGenerator(2, 0, clock=lambda: now[0])
+        values = [generator.next_int() for _ in range(SnowflakeGenerator.MAX_SEQUENCE + 2)]
+        self.assertEqual(SnowflakeGenerator.split(values[-1]), (5001, 2, 0))
+        now[0] -= 10_000_000
+        values.append(generator.next_int())
+        self.assertEqual(values, sorted(set(values)))
+
+    def test_held_node_slot_is_skipped(self):
+        with open(os.path.join(IdGenerationModule.LOCK_DIR, 'idgen-node-7.lock'), 'a') as held:
+            fcntl.flock(held, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self.assertEqual(IdGenerationModule.generator().node_id, 8)
+
+    @skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_forked_child_leases_its_own_node(self):
+        parent_node = IdGenerationModule.generator().node_id
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.write(write_end, str(IdGenerationModule.generator().node_id).encode())
+            finally:
+                os._exit(0)
+        os.close(write_end)
+        os.waitpid(pid, 0)
+        with os.fdopen(read_end) as pipe:
+            child_node = int(pipe.read())
+        self.assertEqual(parent_node, 7)
+        self.assertEqual(child_node, 8)
+
+
+class ParcelTrackingTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_user('owner')
+        self.courier = make_user('courier', role='DRIVER')
+        business = make_business(self.owner)
+        Bid.objects.create(business=business, driver=self.courier, bid_amount=300, status=BidStatus.AWARDED)
+        self.parcels = [
+            Parcel.objects.create(business=business, parcel_details=f'Box {i}', dropoff_point='Market') for i in range(2)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.courier)
+
+    def post_events(self, *events):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/parcel-tracking/events/', {'events': list(events)}, format='json')
+
+    def event(self, parcel, status, minute, event_id, location='Depot'):
+        return {
+            'parcel': parcel.id, 'status': status, 'location': location, 'event_id': event_id,
+            'recorded_at': f'2026-01-05T10:{minute:02d}:00Z',
+        }
+
+    def test_latest_event_wins_and_retries_are_ignored(self):
+        first, second = self.parcels
+        response = self.post_events(
+            self.event(first, 'IN_TRANSIT', 20, 'a2', 'Bridge'),
+            self.event(first, 'PICKED_UP', 10, 'a1'),
+            self.event(second, 'PICKED_UP', 15, 'b1'),
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.post_events(self.event(first, 'PICKED_UP', 10, 'a1')).status_code, 201)
+        self.assertEqual(DeliveryStatus.objects.count(), 3)
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'IN_TRANSIT')
+
+        self.client.force_authenticate(self.owner)
+        overview = self.client.get(f'/api/parcel-tracking/business/?business_id={first.business_id}').data['parcels']
+        self.assertEqual(
+            [(row['id'], row['status'], row['location']) for row in overview],
+            [(first.id, 'IN_TRANSIT', 'Bridge'), (second.id, 'PICKED_UP', 'Depot')],
+        )
+
+    def test_timeline_cache_is_dropped_when_events_commit(self):
+        parcel = self.parcels[0]
+        self.post_events(self.event(parcel, 'PICKED_UP', 10, 'a1'))
+        url = f'/api/parcel-tracking/{parcel.id}/timeline/'
+        self.assertEqual([e['status'] for e in self.client.get(url).data['events']], ['PICKED_UP'])
+        self.assertIsNotNone(cache.get(ParcelTrackingModule.TIMELINE_KEY.format(parcel.id)))
+
+        self.post_events(self.event(parcel, 'DELIVERED', 40, 'a2', 'Market'))
+        events = self.client.get(url).data['events']
+        self.assertEqual([(e['status'], e['location']) for e in events], [('PICKED_UP', 'Depot'), ('DELIVERED', 'Market')])
+        self.assertEqual(events[1]['recorded_at'], '2026-01-05T10:40:00+00:00')
+
+    def test_outsiders_cannot_report_or_read(self):
+        self.client.force_authenticate(make_user('stranger', role='DRIVER'))
+        response = self.post_events(self.event(self.parcels[0], 'DELIVERED', 10, 'x1'))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.data['parcels'], [self.parcels[0].id])
+        self.assertEqual(self.client.get(f'/api/parcel-tracking/{self.parcels[0].id}/timeline/').status_code, 404)
+        self.assertFalse(DeliveryStatus.objects.exists())
+
+
+class ChatTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_user('owner')
+        self.couriers = [make_user(f'courier{i}', role='DRIVER') for i in range(4)]
+        business = make_business(self.owner)
+        for courier in self.couriers:
+            Bid.objects.create(business=business, driver=courier, bid_amount=300)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def send(self, sender, receiver, text):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ChatModule.send_message(sender, receiver, text)
+
+    def test_conversations_page_by_activity_including_ones_without_messages(self):
+        first, second, third, quiet = self.couriers
+        for courier in (first, second, third):
+            self.send(courier, self.owner, f'hello from {courier.username}')
+        Conversation.objects.create(user_low_id=min(self.owner.id, quiet.id), user_high_id=max(self.owner.id, quiet.id))
+        self.send(self.owner, first, 'see you soon')
+
+        seen, url = [], '/api/chat/conversations/?page_size=1'
+        while url:
+            response = self.client.get(url)
+            seen += [row['other_user'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, [first.id, quiet.id, third.id, second.id])
+
+    def test_unread_counters_follow_sends_and_reads(self):
+        courier = self.couriers[0]
+        messages = [self.send(courier, self.owner, f'message {i}') for i in range(3)]
+        self.send(self.couriers[1], self.owner, 'other')
+        self.assertEqual(ChatModule.unread_total(self.owner), 4)
+
+        response = self.client.post('/api/chat/mark_read/', {'user_id': courier.id, 'up_to': messages[1].id})
+        self.assertEqual(response.data['marked'], 2)
+        self.assertEqual(self.client.get('/api/chat/unread/').data['unread'], 2)
+        self.assertEqual(ChatModule.unread_total(courier), 0)
+
+    def test_history_pages_backwards(self):
+        courier = self.couriers[0]
+        messages = [self.send(courier, self.owner, f'message {i}') for i in range(5)]
+        response = self.client.get(f'/api/chat/history/?user_id={courier.id}&limit=3')
+        self.assertEqual([row['id'] for row in response.data['results']], [m.id for m in messages[:1:-1]])
+        older = self.client.get(f'/api/chat/history/?user_id={courier.id}&limit=3&before={response.data["next_before"]}')
+        self.assertEqual([row['id'] for row in older.data['results']], [messages[1].id, messages[0].id])
+        self.assertIsNone(older.data['next_before'])
+
+    def test_strangers_cannot_start_a_conversation(self):
+        stranger = make_user('stranger')
+        response = self.client.post('/api/chat/send/', {'receiver': stranger.id, 'message': 'hi'})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Conversation.objects.exists())
+
+
+class NotificationTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('rider')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def notify(self, count, kind=NotificationType.BID):
+        with self.captureOnCommitCallbacks(execute=True):
+            NotificationModule.notify_many([(self.user.id, kind, f'update {i}', {'n': i}) for i in range(count)])
+
+    def test_cached_unread_count_follows_writes_and_reads(self):
+        self.notify(2)
+        self.assertEqual(NotificationModule.unread_count(self.user.id), 2)
+        self.notify(3)
+        self.assertEqual(cache.get(NotificationModule.UNREAD_KEY.format(self.user.id)), 5)
+
+        first = Notification.objects.filter(user=self.user).order_by('id').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/notifications/mark_read/', {'up_to': first.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/notifications/unread_count/').data['unread'], 4)
+
+    def test_flush_coalesces_and_skips_read_rows(self):
+        self.notify(3)
+        self.notify(1, NotificationType.PAYMENT)
+        Notification.objects.filter(type=NotificationType.PAYMENT).update(status=NotificationStatus.READ)
+        sent = []
+        self.assertEqual(NotificationModule.flush_push(send=sent.extend), (4, 1))
+        self.assertEqual(sent, [{'user': self.user.id, 'type': NotificationType.BID, 'count': 3,
+                                 'message': 'You have 3 new bid updates'}])
+        self.assertFalse(Notification.objects.filter(pushed_at__isnull=True).exists())
+        self.assertEqual(NotificationModule.flush_push(send=sent.extend), (0, 0))
+
+    def test_failed_push_leaves_rows_pending(self):
+        self.notify(1)
+
+        def fail(pushes):
+            raise ConnectionError('gateway down')
+
+        with self.assertRaises(ConnectionError):
+            NotificationModule.flush_push(send=fail)
+        self.assertTrue(Notification.objects.filter(pushed_at__isnull=True).exists())
+
+    def test_verified_payment_notifies_even_if_the_card_is_not_stored(self):
+        payment = PaymentTransaction.objects.create(
+            user=self.user, amount=5000, transaction_type='DEPOSIT', transaction_reference='ref-1', status='PENDING'
+        )
+        verified = {'data': {'status': 'success', 'authorization': {}}}
+        with mock.patch('app.views.PaymentProcessingModule.verifyPayment', return_value=verified), \
+                mock.patch('app.views.CardAuthorizationModule.capture', side_effect=DatabaseError('deadlock')), \
+                self.assertLogs('app.views', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/payments/verify_payment/', {'reference': 'ref-1'})
+        self.assertEqual(response.status_code, 200)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'SUCCESS')
+        self.assertEqual(
+            list(Notification.objects.values_list('type', 'data')),
+            [(NotificationType.PAYMENT, {'payment': payment.id, 'status': 'SUCCESS'})],
+        )
+
+
+class CompleteProfileTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        vehicle_catalog._version = None  # Reload: cache.clear() reset the version counter
+        self.color = VehicleColor.objects.create(name='Red')
+        self.type = VehicleType.objects.create(name='Saloon')
+        self.make = VehicleMake.objects.create(name='Toyota')
+        self.model = VehicleModel.objects.create(name='Corolla', make=self.make)
+        self.driver = make_user('driver', role='DRIVER', phone_number='0800')
+        self.client = APIClient()
+        self.client.force_authenticate(self.driver)
+
+    def payload(self, **overrides):
+        payload = {
+            'name': 'Ada Driver', 'phone_number': '0801', 'driver_license_number': 'LIC-1', 'driver_id': 'DRV-1',
+            'vehicle_plate_number': 'KJA-100', 'vehicle_color_id': self.color.id, 'vehicle_type_id': self.type.id,
+            'vehicle_make': self.make.id, 'vehicle_model_id': self.model.id,
+        }
+        payload.update(overrides)
+        return payload
+
+    def complete(self, **overrides):
+        return self.client.post('/api/users/complete_profile/', self.payload(**overrides))
+
+    def test_driver_profile_is_saved_with_catalog_entries(self):
+        response = self.complete()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_completed'])
+        self.assertEqual(response.data['profile']['vehicle_model'], {'id': self.model.id, 'name': 'Corolla'})
+        profile = Profile.objects.get(user=self.driver)
+        self.assertEqual((profile.vehicle_make_id, profile.vehicle_plate_number), (self.make.id, 'KJA-100'))
+
+    def test_unknown_or_mismatched_catalog_ids_are_rejected(self):
+        other_model = VehicleModel.objects.create(name='Civic', make=VehicleMake.objects.create(name='Honda'))
+        response = self.complete(vehicle_color_id=999, vehicle_model_id=other_model.id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'vehicle_color', 'vehicle_model'})
+        self.assertFalse(Profile.objects.exists())
+
+    def test_conflicts_name_the_taken_field(self):
+        other = make_user('other', role='DRIVER', phone_number='0900')
+        Profile.objects.create(user=other, vehicle_plate_number='KJA-100', driver_id='DRV-9')
+
+        response = self.complete()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.data), ['vehicle_plate_number'])
+
+        response = self.complete(vehicle_plate_number='KJA-200', phone_number='0900')
+        self.assertEqual(list(response.data), ['phone_number'])
+        self.driver.refresh_from_db()
+        self.assertEqual((self.driver.phone_number, self.driver.is_completed), ('0800', False))
+
+
+class OTPTests(BaseTestCase):
+    CONTACT = 'rider@example.com'
+
+    def use_backend(self, backend):
+        patcher = mock.patch.object(OTPModule, '_backend', backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def check_attempt_limit(self):
+        code = OTPModule.issue(self.CONTACT, OTPPurpose.REGISTRATION)
+        for _ in range(OTPModule.MAX_ATTEMPTS):
+            self.assertFalse(OTPModule.verify(self.CONTACT, OTPPurpose.REGISTRATION, 'not-the-code'))
+        self.assertFalse(OTPModule.verify(self.CONTACT, OTPPurpose.REGISTRATION, code))
+
+    def check_single_use(self):
+        cache.clear()  # Lift the resend cooldown
+        code = OTPModule.issue(self.CONTACT, OTPPurpose.REGISTRATION)
+        self.assertFalse(OTPModule.verify(self.CONTACT, OTPPurpose.PASSWORD_RESET, code))
+        self.assertTrue(OTPModule.verify(self.CONTACT, OTPPurpose.REGISTRATION, code))
+        self.assertFalse(OTPModule.verify(self.CONTACT, OTPPurpose.REGISTRATION, code))
+
+    def test_cache_backend(self):
+        self.use_backend(CacheOTPBackend())
+        self.check_attempt_limit()
+        self.check_single_use()
+
+    def test_database_backend_stores_only_hashes(self):
+        self.use_backend(DatabaseOTPBackend())
+        self.check_attempt_limit()
+        self.check_single_use()
+        code = OTPModule.issue('other@example.com', OTPPurpose.REGISTRATION)
+        self.assertNotIn(code, OTP.objects.get().otp_code)
+
+    def test_resends_are_throttled(self):
+        OTPModule.issue(self.CONTACT, OTPPurpose.REGISTRATION)
+        with self.assertRaises(OTPRateLimited) as raised:
+            OTPModule.issue(self.CONTACT, OTPPurpose.REGISTRATION)
+        self.assertEqual(raised.exception.retry_after, OTPModule.RESEND_COOLDOWN)
+
+    def test_reset_for_a_missing_user_does_not_spend_the_code(self):
+        self.use_backend(DatabaseOTPBackend())
+        user = make_user('rider')
+        client = APIClient()
+        with mock.patch('app.views.send_verification_email') as send:
+            client.post('/api/auth/forget_password/', {'email_or_phone_number': self.CONTACT})
+        code = send.call_args[0][1]
+        reset = {
+            'email_or_phone_number': self.CONTACT, 'verification_code': code,
+            'new_password': 'n3w-Secret!', 'confirm_password': 'n3w-Secret!',
+        }
+
+        User.objects.filter(pk=user.pk).update(email='moved@example.com')
+        self.assertEqual(client.post('/api/auth/reset_password/', reset).data['detail'], 'User not found')
+        User.objects.filter(pk=user.pk).update(email=self.CONTACT)
+        self.assertEqual(client.post('/api/auth/reset_password/', reset).status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('n3w-Secret!'))
+
+    def test_purge_removes_expired_rows_in_chunks(self):
+        self.use_backend(DatabaseOTPBackend())
+        for index in range(3):
+            OTPModule.backend().store(f'user{index}@example.com', OTPPurpose.REGISTRATION, '123456', 60)
+        later = timezone.now() + timedelta(minutes=5)
+        self.assertEqual(list(OTPModule.purge_expired(now=later, chunk_size=2)), [2, 1])
+        self.assertFalse(OTP.objects.exists())
+
+
+class PayoutDestinationTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = use_fake_paystack(self)
+
+    def test_destination_is_registered_once(self):
+        user = make_user('payee')
+        first = PayoutModule.destination_for(user, ' 0700000000 ', 'MPESA', type=RecipientType.MOBILE_MONEY)
+        again = PayoutModule.destination_for(user, '0700000000', 'MPESA', type=RecipientType.MOBILE_MONEY)
+        self.assertEqual(again.pk, first.pk)
+        self.assertTrue(first.recipient_code.startswith('RCP_'))
+        self.assertEqual(self.server.requests, 1)
+
+    def test_register_drivers_in_batches_skips_registered_numbers(self):
+        drivers = [make_user(f'driver{i}', role='DRIVER', phone_number=f'07000000{i:02d}') for i in range(5)]
+        make_user('rider', phone_number='0799999999')
+        PayoutModule.destination_for(drivers[0], drivers[0].phone_number, 'MPESA', type=RecipientType.MOBILE_MONEY)
+
+        self.assertEqual(list(PayoutModule.register_drivers(batch_size=3)), [(3, 0), (1, 0)])
+        self.assertEqual(list(PayoutModule.register_drivers(batch_size=3)), [])
+        self.assertEqual(
+            set(PayoutDestination.objects.values_list('user_id', flat=True)), {driver.id for driver in drivers}
+        )
+
+
+class PayoutBatchTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = use_fake_paystack(self)
+        self.user = make_user('payee', balance=1000)
+        self.destination = PayoutModule.destination_for(
+            self.user, '0700000000', 'MPESA', type=RecipientType.MOBILE_MONEY
+        )
+        patcher = mock.patch.object(PaymentProcessingModule, 'verifyPayloadHashmac', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def enqueue(self, count, amount=100):
+        return [PayoutModule.enqueue(self.user, amount, self.destination) for _ in range(count)]
+
+    def statuses(self):
+        return sorted(PaymentTransaction.objects.filter(user=self.user).values_list('status', flat=True))
+
+    def transfer_webhook(self, event, withdrawal):
+        return APIClient().post(
+            '/api/payment-webhook/', {'event': event, 'data': {'reference': withdrawal.transaction_reference}},
+            format='json', HTTP_X_PAYSTACK_SIGNATURE='signature',
+        )
+
+    def test_enqueue_takes_the_money_up_front(self):
+        self.assertIsNotNone(PayoutModule.enqueue(self.user, 700, self.destination))
+        self.assertIsNone(PayoutModule.enqueue(self.user, 700, self.destination))
+        self.assertEqual(balance_of(self.user), 300)
+
+    def test_accepted_transfers_wait_for_the_webhook(self):
+        withdrawals = self.enqueue(5)
+        failing = self.enqueue(1)[0]
+        self.server.transfers[failing.transaction_reference] = {
+            'reference': failing.transaction_reference, 'status': 'failed', 'transfer_code': None,
+        }
+
+        self.assertEqual(list(PayoutModule.flush(batch_size=4)), [(0, 4, 0, 0), (0, 1, 1, 0)])
+        self.assertEqual(self.statuses(), [WithdrawalStatus.FAILED] + [WithdrawalStatus.PROCESSING] * 5)
+        self.assertEqual(balance_of(self.user), 500)
+        later = timezone.now() + timedelta(seconds=PayoutModule.STALE_AFTER + 1)
+        self.assertEqual(PayoutModule.requeue_stale(now=later), 0)
+
+        self.assertEqual(self.transfer_webhook('transfer.success', withdrawals[0]).status_code, 200)
+        self.assertEqual(self.transfer_webhook('transfer.failed', withdrawals[1]).status_code, 200)
+        self.assertEqual(self.transfer_webhook('transfer.failed', withdrawals[1]).status_code, 200)
+        self.assertEqual(balance_of(self.user), 600)
+        withdrawals[0].refresh_from_db()
+        self.assertEqual(withdrawals[0].status, WithdrawalStatus.COMPLETED)
+        self.assertTrue(withdrawals[0].transfer_code.startswith('TRF_'))
+
+        # A reversal after completion puts the money back
+        self.transfer_webhook('transfer.reversed', withdrawals[0])
+        self.assertEqual(balance_of(self.user), 700)
+        self.assertEqual(self.statuses().count(WithdrawalStatus.FAILED), 3)
+
+    def test_successful_items_complete_at_once(self):
+        self.enqueue(2)
+
+        def instant(transfers, currency=None):
+            return {'data': [{'reference': t['reference'], 'status': 'success', 'transfer_code': 'TRF_1'}
+                             for t in transfers]}
+
+        self.assertEqual(list(PayoutModule.flush(send=instant)), [(2, 0, 0, 0)])
+        self.assertEqual(self.statuses(), [WithdrawalStatus.COMPLETED] * 2)
+
+    def test_rejected_request_is_refunded_at_once(self):
+        self.enqueue(3)
+        response = requests.Response()
+        response.status_code = 400
+
+        def rejected(transfers, currency=None):
+            raise requests.HTTPError(response=response)
+
+        self.assertEqual(list(PayoutModule.flush(send=rejected)), [(0, 0, 3, 0)])
+        self.assertEqual(self.statuses(), [WithdrawalStatus.FAILED] * 3)
+        self.assertEqual(balance_of(self.user), 1000)
+
+    def test_unsent_batch_is_retried_then_refunded(self):
+        self.enqueue(3)
+
+        def unreachable(transfers, currency=None):
+            raise requests.ConnectionError()
+
+        with mock.patch.object(PayoutModule, 'MAX_SUBMIT_ATTEMPTS', 2):
+            self.assertEqual(list(PayoutModule.flush(send=unreachable)), [(0, 0, 0, 3)])
+            self.assertEqual(self.statuses(), [WithdrawalStatus.QUEUED] * 3)
+            self.assertEqual(balance_of(self.user), 700)
+            self.assertEqual(list(PayoutModule.flush(send=unreachable)), [(0, 0, 3, 0)])
+        self.assertEqual(balance_of(self.user), 1000)
+        self.assertEqual(len(self.server.transfers), 0)
+
+    def test_requeued_batch_is_not_paid_twice(self):
+        self.enqueue(3)
+
+        def timeout(transfers, currency=None):
+            raise requests.Timeout()
+
+        self.assertEqual(list(PayoutModule.flush(send=timeout)), [(0, 0, 0, 3)])
+        self.assertEqual(list(PayoutModule.flush()), [(0, 3, 0, 0)])
+        self.assertEqual(list(PayoutModule.flush()), [])
+        self.assertEqual(len(self.server.transfers), 3)
+        self.assertEqual(balance_of(self.user), 700)
+
+
+class CardChargeTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = make_user('rider', balance=0)
+        self.driver = make_user('driver', role='DRIVER')
+        CardAuthorization.objects.create(
+            user=self.customer, authorization_code='AUTH_test', signature='SIG_test', email='rider@example.com',
+            last4='4081', exp_month=12, exp_year=timezone.now().year + 1,
+        )
+        self.ride = Ride.objects.create(
+            customer=self.customer, driver=self.driver, pickup_location='A', dropoff_location='B',
+            fare=500, status=RideStatus.COMPLETED,
+        )
+
+    def charge(self, response=None, error=None):
+        with mock.patch.object(PaymentProcessingModule, 'chargeCustomer', return_value=response, side_effect=error):
+            return CardAuthorizationModule.charge_ride(self.ride)
+
+    def test_successful_charge_credits_the_wallet(self):
+        payment = self.charge({'status': True, 'data': {'status': 'success'}})
+        self.assertEqual(payment.status, 'SUCCESS')
+        self.assertEqual(balance_of(self.customer), 500)
+        with self.assertRaises(CardChargeError):
+            self.charge({'status': True, 'data': {'status': 'success'}})
+        self.assertEqual(balance_of(self.customer), 500)
+
+    def test_charge_lost_in_transit_stays_pending(self):
+        payment = self.charge(error=requests.Timeout())
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'PENDING')
+        self.assertEqual(balance_of(self.customer), 0)
+
+        # Paystack did charge the card: the retry settles the first attempt instead of charging again
+        with mock.patch.object(PaymentProcessingModule, 'verifyPayment',
+                               return_value={'data': {'status': 'success'}}):
+            with self.assertRaises(CardChargeError):
+                self.charge({'status': True, 'data': {'status': 'success'}})
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'SUCCESS')
+        self.assertEqual(balance_of(self.customer), 500)
+
+    def test_declined_charge_can_be_retried(self):
+        self.assertEqual(self.charge({'status': True, 'data': {'status': 'failed'}}).status, 'FAILED')
+        self.assertEqual(self.charge({'status': True, 'data': {'status': 'success'}}).status, 'SUCCESS')
+        self.assertEqual(balance_of(self.customer), 500)
+
+
+class PaymentWebhookTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('payer', balance=0)
+        self.payment = PaymentTransaction.objects.create(
+            user=self.user, amount=500, transaction_type='DEPOSIT', status='PENDING', transaction_reference='ref-1',
+        )
+        self.client = APIClient()
+        for patcher in (
+            mock.patch.object(PaymentProcessingModule, 'verifyPayloadHashmac', return_value=True),
+            mock.patch.object(PaymentProcessingModule, 'verifyPayment',
+                              return_value={'status': True, 'data': {'status': 'success', 'reference': 'ref-1'}}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def webhook(self):
+        return self.client.post(
+            '/api/payment-webhook/', {'event': 'charge.success', 'data': {'reference': 'ref-1'}},
+            format='json', HTTP_X_PAYSTACK_SIGNATURE='signature',
+        )
+
+    def test_retried_webhook_credits_once(self):
+        self.assertEqual(self.webhook().status_code, 200)
+        self.assertEqual(self.webhook().status_code, 200)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'SUCCESS')
+        self.assertEqual(balance_of(self.user), 500)
+
+    def test_verify_and_webhook_credit_once(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/payments/verify_payment/', {'reference': 'ref-1'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.webhook()
+        self.assertEqual(balance_of(self.user), 500)
+
+    def test_unsigned_webhook_is_rejected(self):
+        response = self.client.post('/api/payment-webhook/', {'event': 'charge.success'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(balance_of(self.user), 0)
+
+    def test_card_capture_failure_still_credits(self):
+        with mock.patch.object(CardAuthorizationModule, 'capture', side_effect=DatabaseError('deadlock')), \
+                self.assertLogs('app.views', 'ERROR'):
+            self.assertEqual(self.webhook().status_code, 200)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'SUCCESS')
+        self.assertEqual(balance_of(self.user), 500)
+
+
+
+class SettlementTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        SettlementModule._platform = None
+        self.customer = make_user('customer', balance=1000)
+        self.driver = make_user('driver', balance=0, role='DRIVER')
+
+    def ride(self, fare):
+        return Ride.objects.create(
+            customer=self.customer, driver=self.driver, pickup_location='A', dropoff_location='B',
+            fare=fare, status=RideStatus.COMPLETED,
+        )
+
+    def test_fare_is_split_between_driver_and_platform(self):
+        ride = self.ride(400)
+        self.assertTrue(SettlementModule.settle_ride(ride))
+
+        commission = SettlementModule.commission_for(400)
+        platform = Wallet.objects.get(id=SettlementModule.platform_wallet_id())
+        self.assertEqual(balance_of(self.customer), 600)
+        self.assertEqual(balance_of(self.driver), 400 - commission)
+        self.assertEqual(platform.active_balance, commission)
+        ride.refresh_from_db()
+        self.assertIsNotNone(ride.settled_at)
+        self.assertEqual(ride.commission, commission)
+        self.assertEqual(sum(Transaction.objects.filter(ride=ride).values_list('amount', flat=True)), 400)
+
+    def test_ride_is_settled_once(self):
+        ride = self.ride(400)
+        self.assertTrue(SettlementModule.settle_ride(ride))
+        self.assertFalse(SettlementModule.settle_ride(ride))
+        self.assertEqual(balance_of(self.customer), 600)
+
+    def test_unaffordable_ride_waits_for_a_later_run(self):
+        ride = self.ride(1500)
+        self.assertFalse(SettlementModule.settle_ride(ride))
+        ride.refresh_from_db()
+        self.assertIsNone(ride.settled_at)
+        self.assertEqual(balance_of(self.customer), 1000)
+
+        Wallet.objects.filter(user=self.customer).update(active_balance=2000)
+        self.assertEqual(list(SettlementModule.resettle()), [(1, 0)])
+        self.assertEqual(balance_of(self.customer), 500)
+
+    def test_rides_without_a_fare_stay_pending(self):
+        unpriced = [self.ride(0), self.ride(-50)]
+        priced = self.ride(400)
+        with self.assertLogs('app.settlement', 'WARNING') as logs:
+            self.assertEqual(list(SettlementModule.resettle()), [(1, 2)])
+        self.assertIn(str([ride.id for ride in unpriced]), logs.output[0])
+        self.assertEqual(
+            list(Ride.objects.filter(settled_at__isnull=True).values_list('id', flat=True)),
+            [ride.id for ride in unpriced],
+        )
+        self.assertFalse(Transaction.objects.exclude(ride=priced).exists())
+        self.assertEqual(balance_of(self.customer), 600)
+
+
+class WalletTests(BaseTestCase):
+    def test_debit_requires_funds(self):
+        user = make_user('payer', balance=100)
+        self.assertFalse(WalletModule.debit(user.id, 150))
+        self.assertTrue(WalletModule.debit(user.id, 100))
+        self.assertFalse(WalletModule.debit(user.id, 1))
+        self.assertEqual(balance_of(user), 0)
+
+    def test_hold_and_release(self):
+        payer, payee = make_user('payer', balance=100), make_user('payee')
+        self.assertTrue(WalletModule.hold(payer.id, 60))
+        self.assertTrue(WalletModule.release(payer.id, payee.id, 60))
+        self.assertFalse(WalletModule.release(payer.id, payee.id, 1))
+        wallet = Wallet.objects.get(user=payer)
+        self.assertEqual((wallet.active_balance, wallet.transactional_balance), (40, 0))
+        self.assertEqual(balance_of(payee), 60)
+
+
+class WithdrawTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('withdrawer', balance=100)
+        self.destination = PayoutDestination.objects.create(
+            user=self.user, account_number='0700000000', bank_code='MPESA', type=RecipientType.MOBILE_MONEY,
+            currency='KES', recipient_code='RCP_test',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for patcher in (
+            mock.patch.object(PayoutModule, 'BATCHING', False),
+            mock.patch.object(PayoutModule, 'destination_for', return_value=self.destination),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def withdraw(self, amount, result=None, error=None):
+        with mock.patch.object(PaymentProcessingModule, 'withdraw_from_wallet', return_value=result,
+                               side_effect=error):
+            return self.client.post('/api/payments/withdraw/', {
+                'amount': amount, 'account_number': '0700000000', 'bank_code': 'MPESA', 'type': 'mobile_money',
+            }, format='json')
+
+    def test_insufficient_balance_sends_nothing(self):
+        response = self.withdraw(150, {'status': True})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(balance_of(self.user), 100)
+        self.assertFalse(PaymentTransaction.objects.filter(user=self.user).exists())
+
+    def test_successful_transfer_debits_once(self):
+        response = self.withdraw(60, {'status': True})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(balance_of(self.user), 40)
+        self.assertEqual(PaymentTransaction.objects.get(user=self.user).status, WithdrawalStatus.COMPLETED)
+
+    def test_failed_transfer_is_refunded(self):
+        response = self.withdraw(60, {'status': False})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(balance_of(self.user), 100)
+        self.assertEqual(PaymentTransaction.objects.get(user=self.user).status, WithdrawalStatus.FAILED)
+
+    def test_transfer_lost_in_transit_keeps_the_money_held(self):
+        with self.assertLogs('app.views', 'ERROR'):
+            response = self.withdraw(60, error=requests.Timeout())
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(balance_of(self.user), 40)
+        self.assertEqual(PaymentTransaction.objects.get(user=self.user).status, WithdrawalStatus.PENDING)
+
+    def test_transfer_lost_in_transit_is_settled_by_webhook(self):
+        with self.assertLogs('app.views', 'ERROR'):
+            reference = self.withdraw(60, error=requests.Timeout()).data['reference']
+        with mock.patch.object(PaymentProcessingModule, 'verifyPayloadHashmac', return_value=True):
+            response = self.client.post(
+                '/api/payment-webhook/',
+                {'event': 'transfer.success', 'data': {'reference': reference, 'transfer_code': 'TRF_1'}},
+                format='json', HTTP_X_PAYSTACK_SIGNATURE='signature',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(balance_of(self.user), 40)
+        self.assertEqual(PaymentTransaction.objects.get(user=self.user).status, WithdrawalStatus.COMPLETED)
+
+    def test_second_withdrawal_cannot_overdraw(self):
+        self.assertEqual(self.withdraw(60, {'status': True}).status_code, 200)
+        self.assertEqual(self.withdraw(60, {'status': True}).status_code, 400)
+        self.assertEqual(balance_of(self.user), 40)
+
+
+class StatementTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        SettlementModule._platform = None
+        self.user = make_user('saver', balance=0)
+
+    def settle(self, kind, amount, status):
+        payment = PaymentTransaction.objects.create(
+            user=self.user, amount=amount, transaction_type=kind, status=status,
+        )
+        StatementModule.record_payment(payment)
+        return payment
+
+    def test_record_keeps_monthly_totals(self):
+        self.settle('DEPOSIT', 500, 'SUCCESS')
+        self.settle('RIDE_CHARGE', 300, 'SUCCESS')
+        self.settle('WITHDRAWAL', 200, WithdrawalStatus.COMPLETED)
+
+        statement, = StatementModule.statements_for(self.user.id)
+        self.assertEqual(statement.month, StatementModule.month_of(timezone.now()))
+        self.assertEqual((statement.credits, statement.debits, statement.transaction_count), (800, 200, 3))
+        self.assertEqual((statement.opening_balance, statement.closing_balance), (0, 600))
+
+    def test_late_entry_carries_into_later_months(self):
+        this_month = StatementModule.month_of(timezone.now())
+        last_month = StatementModule.month_of(timezone.now().replace(day=1) - timedelta(days=1))
+        self.settle('DEPOSIT', 500, 'SUCCESS')
+        StatementModule.record([(self.user.id, 100)], at=timezone.now().replace(day=1) - timedelta(days=1))
+
+        statements = {statement.month: statement for statement in StatementModule.statements_for(self.user.id)}
+        self.assertEqual(statements[last_month].closing_balance, 100)
+        self.assertEqual(statements[this_month].opening_balance, 100)
+        self.assertEqual(statements[this_month].closing_balance, 600)
+
+    def test_rebuild_matches_recorded_statements(self):
+        self.settle('DEPOSIT', 500, 'SUCCESS')
+        self.settle('WITHDRAWAL', 200, WithdrawalStatus.COMPLETED)
+        PaymentTransaction.objects.create(user=self.user, amount=999, transaction_type='DEPOSIT', status='PENDING')
+        recorded = list(WalletStatement.objects.values_list('month', 'credits', 'debits', 'closing_balance'))
+
+        self.assertEqual(list(StatementModule.rebuild()), [(1, 1)])
+        self.assertEqual(
+            list(WalletStatement.objects.values_list('month', 'credits', 'debits', 'closing_balance')), recorded
+        )
+        self.assertIsInstance(recorded[0][0], date)
+
+    def test_settled_ride_closes_at_the_wallet_balance(self):
+        driver = make_user('driver', balance=0, role='DRIVER')
+        deposit = self.settle('DEPOSIT', 1000, 'SUCCESS')
+        WalletModule.credit(self.user.id, deposit.amount)
+        ride = Ride.objects.create(
+            customer=self.user, driver=driver, pickup_location='A', dropoff_location='B',
+            fare=400, status=RideStatus.COMPLETED,
+        )
+        self.assertTrue(SettlementModule.settle_ride(ride))
+
+        platform = SettlementModule._platform[0]
+        for user_id in (self.user.id, driver.id, platform):
+            statement, = StatementModule.statements_for(user_id)
+            self.assertEqual(statement.closing_balance, WalletModule.balance(user_id)['active_balance'])
+        statement, = StatementModule.statements_for(self.user.id)
+        self.assertEqual((statement.credits, statement.debits), (1000, 400))
+
+    def test_rebuild_includes_settled_rides(self):
+        driver = make_user('driver', balance=0, role='DRIVER')
+        Wallet.objects.filter(user=self.user).update(active_balance=1000)
+        ride = Ride.objects.create(
+            customer=self.user, driver=driver, pickup_location='A', dropoff_location='B',
+            fare=400, status=RideStatus.COMPLETED,
+        )
+        SettlementModule.settle_ride(ride)
+        fields = ('wallet_id', 'month', 'credits', 'debits', 'closing_balance', 'transaction_count')
+        recorded = list(WalletStatement.objects.order_by('wallet_id').values_list(*fields))
+
+        list(StatementModule.rebuild())
+        self.assertEqual(list(WalletStatement.objects.order_by('wallet_id').values_list(*fields)), recorded)
+        self.assertEqual(len(recorded), 3)
+
+
+class TokenClaimsTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        TokenModule._local = None
+        self.user = make_user('claims', role='DRIVER')
+        self.user.set_password('old-secret')
+        self.user.save()
+        self.client = APIClient()
+
+    def post_while_demoted(self, url, data, serializer):
+        """Post with a token carrying the driver role while an administrator demotes the user mid-request."""
+        User.objects.filter(pk=self.user.pk).update(role='DRIVER')
+        token = TokenModule.for_user(User.objects.get(pk=self.user.pk)).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        original = serializer.is_valid
+
+        def is_valid(instance, **kwargs):
+            User.objects.filter(pk=self.user.pk).update(role='USER')
+            TokenModule.bump_version(self.user.pk)
+            return original(instance, **kwargs)
+
+        with mock.patch.object(serializer, 'is_valid', autospec=True, side_effect=is_valid):
+            return self.client.post(url, data, format='json')
+
+    def test_update_password_keeps_a_concurrent_role_change(self):
+        response = self.post_while_demoted(
+            '/api/users/update_password/', {'current_password': 'old-secret', 'password': 'new-secret'},
+            UpdatePasswordSerializer,
+        )
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.role, 'USER')
+        self.assertTrue(user.check_password('new-secret'))
+
+    def test_change_password_keeps_a_concurrent_role_change(self):
+        response = self.post_while_demoted(
+            '/api/auth/change_password/',
+            {'current_password': 'old-secret', 'new_password': 'new-secret', 'confirm_password': 'new-secret'},
+            ChangePasswordSerializer,
+        )
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.role, 'USER')
+        self.assertTrue(user.check_password('new-secret'))
+
+    def test_claims_user_writes_back_changed_claims(self):
+        user = TokenModule.claims_user(self.user.pk, 'DRIVER', True, self.user.token_version)
+        User.objects.filter(pk=self.user.pk).update(role='USER', name='renamed')
+        user.name = 'mine'
+        user.save()
+        self.assertEqual(User.objects.values_list('role', 'name').get(pk=self.user.pk), ('USER', 'mine'))
+
+        user.role = 'ADMIN'
+        user.save()
+        self.assertEqual(User.objects.get(pk=self.user.pk).role, 'ADMIN')
+
+    def test_local_cache_reads_versions_from_the_database(self):
+        key = TokenModule.VERSION_KEY.format(self.user.pk)
+        cache.set(key, self.user.token_version)
+        # A bump made by another worker only clears that worker's cache
+        User.objects.filter(pk=self.user.pk).update(token_version=self.user.token_version + 1)
+        self.assertEqual(TokenModule.current_version(self.user.pk), self.user.token_version + 1)
+
+        with mock.patch.object(TokenModule, '_local', False):
+            self.assertEqual(TokenModule.current_version(self.user.pk), self.user.token_version)
+
+
+class TokenBlacklistTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('session')
+
+    def blacklist(self):
+        """Blacklist a new refresh token as another process would; returns its JTI."""
+        refresh = TokenModule.for_user(self.user)
+        jti = refresh['jti']
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=jti))
+        return jti
+
+    def shared(self):
+        blacklist = TokenBlacklist()
+        blacklist._local = False
+        blacklist.refresh()
+        return blacklist
+
+    def test_filter_picks_up_rows_after_a_sequence_bump(self):
+        blacklist = self.shared()
+        jti = self.blacklist()
+        self.assertFalse(blacklist.is_blacklisted(jti))  # not announced yet
+        TokenBlacklist._bump(TokenBlacklist.SEQUENCE_KEY)
+        self.assertTrue(blacklist.is_blacklisted(jti))
+
+    def test_filter_resyncs_when_a_bump_is_lost(self):
+        blacklist = self.shared()
+        jti = self.blacklist()
+        blacklist._resync_at = 0.0
+        self.assertTrue(blacklist.is_blacklisted(jti))
+
+    def test_filter_rebuilds_after_a_purge(self):
+        jti = self.blacklist()
+        blacklist = self.shared()
+        self.assertTrue(blacklist.is_blacklisted(jti))
+        OutstandingToken.objects.filter(jti=jti).update(expires_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(list(blacklist.purge_expired()), [1])
+        self.assertFalse(BlacklistedToken.objects.filter(token__jti=jti).exists())
+        self.assertFalse(blacklist.is_blacklisted(jti))
+        self.assertNotEqual(blacklist._version, 0)
+
+    def test_local_cache_checks_the_table(self):
+        blacklist = TokenBlacklist()
+        blacklist._local = True
+        jti = self.blacklist()
+        self.assertTrue(blacklist.is_blacklisted(jti))
+
+    def test_refreshed_token_cannot_be_reused(self):
+        client = APIClient()
+        refresh = str(TokenModule.for_user(self.user))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/auth/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = client.post('/api/auth/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,275 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+from django.db.models.base import DEFERRED
+from django.utils import timezone
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+User = get_user_model()
+
+
+class BloomFilter:
+    """Bit array with ``hashes`` positions per value; membership may be a false positive, never a false negative."""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class TokenBlacklist:
+    """
+    In-process bloom filter of blacklisted refresh-token JTIs.
+
+    A JTI missing from the filter is not blacklisted, so the usual refresh
+    costs no query; a hit is confirmed against BlacklistedToken. Every
+    blacklisting bumps a shared sequence counter and each process reads
+    rows added since its last load (re-reading LOOKBACK ids for rows that
+    committed out of order). Purging bumps a version, after which each
+    process rebuilds its filter from the table. Filters also catch up on
+    their own every RESYNC_SECONDS in case a bump is lost with the cache.
+
+    The counters only reach other processes through a shared cache; with
+    the local-memory cache every check goes to BlacklistedToken instead.
+    """
+
+    SEQUENCE_KEY = 'auth:blacklist:sequence'
+    VERSION_KEY = 'auth:blacklist:version'
+
+    CAPACITY = int(os.getenv('TOKEN_BLACKLIST_CAPACITY', '1000000'))
+    ERROR_RATE = float(os.getenv('TOKEN_BLACKLIST_ERROR_RATE', '0.001'))
+    CHUNK_SIZE = int(os.getenv('TOKEN_BLACKLIST_CHUNK_SIZE', '5000'))
+    LOOKBACK = 1000
+    RESYNC_SECONDS = int(os.getenv('TOKEN_BLACKLIST_RESYNC_SECONDS', '30'))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._last_id = 0
+        self._sequence = None
+        self._version = None
+        self._resync_at = 0.0
+        self._local = None
+
+    @property
+    def local(self):
+        if self._local is None:
+            self._local = settings.CACHES['default']['BACKEND'].endswith('LocMemCache')
+        return self._local
+
+    @staticmethod
+    def _bump(key):
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+    def _load(self, bloom, after):
+        """Add the JTIs of blacklist rows with ids above ``after``; returns the last id read."""
+        last_id = after
+        while True:
+            rows = list(
+                BlacklistedToken.objects.filter(id__gt=last_id).order_by('id')
+                .values_list('id', 'token__jti')[:self.CHUNK_SIZE]
+            )
+            for row_id, jti in rows:
+                bloom.add(jti)
+            if rows:
+                last_id = rows[-1][0]
+            if len(rows) < self.CHUNK_SIZE:
+                return last_id
+
+    def refresh(self):
+        state = cache.get_many([self.SEQUENCE_KEY, self.VERSION_KEY])
+        sequence, version = state.get(self.SEQUENCE_KEY, 0), state.get(self.VERSION_KEY, 0)
+        stale = time.monotonic() >= self._resync_at
+        if self._filter is not None and sequence == self._sequence and version == self._version and not stale:
+            return
+        with self._lock:
+            if self._filter is None or version != self._version or self._filter.count > self.CAPACITY:
+                capacity = max(self.CAPACITY, 2 * BlacklistedToken.objects.count())
+                bloom = BloomFilter(capacity, self.ERROR_RATE)
+                self._last_id = self._load(bloom, 0)
+                self._filter = bloom
+            elif sequence != self._sequence or stale:
+                self._last_id = max(self._last_id, self._load(self._filter, max(0, self._last_id - self.LOOKBACK)))
+            self._sequence, self._version = sequence, version
+            self._resync_at = time.monotonic() + self.RESYNC_SECONDS
+
+    def is_blacklisted(self, jti):
+        if self.local:
+            return BlacklistedToken.objects.filter(token__jti=jti).exists()
+        self.refresh()
+        if jti not in self._filter:
+            return False
+        return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+    def add(self, jti):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+        transaction.on_commit(lambda: self._bump(self.SEQUENCE_KEY))
+
+    def purge_expired(self, now=None, chunk_size=None):
+        """
+        Delete expired outstanding tokens (and their blacklist rows) in
+        primary-key chunks, yielding the count per chunk. Expired tokens are
+        the oldest, so each chunk is found near the start of the table.
+        """
+        now = now or timezone.now()
+        chunk_size = chunk_size or self.CHUNK_SIZE
+        purged = False
+        try:
+            while True:
+                ids = list(
+                    OutstandingToken.objects.filter(expires_at__lte=now).order_by('id')
+                    .values_list('id', flat=True)[:chunk_size]
+                )
+                if not ids:
+                    return
+                with transaction.atomic():
+                    BlacklistedToken.objects.filter(token_id__in=ids).delete()
+                    deleted, _ = OutstandingToken.objects.filter(id__in=ids).delete()
+                purged = True
+                yield deleted
+        finally:
+            if purged:
+                # Rebuild filters without the purged JTIs
+                self._bump(self.VERSION_KEY)
+
+
+token_blacklist = TokenBlacklist()
+
+
+class BlacklistRefreshToken(RefreshToken):
+    """Refresh token whose blacklist check goes through the bloom filter."""
+
+    def check_blacklist(self):
+        if token_blacklist.is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError("Token is blacklisted")
+
+    def blacklist(self):
+        result = super().blacklist()
+        token_blacklist.add(self.payload[api_settings.JTI_CLAIM])
+        return result
+
+
+class TokenModule:
+    """
+    Claims carried by issued tokens and the per-user version that says
+    whether they are still current.
+
+    Tokens carry the user's role, active flag and ``token_version``. When
+    the role or active flag changes the version is bumped; tokens issued
+    before that still authenticate but load the user from the database
+    until they are replaced. Current versions are cached for CLAIMS_TTL
+    seconds and dropped when bumped; with a per-process cache a bump
+    cannot reach the other workers, so versions are read from the
+    database instead. Claims are never saved back over the row unless
+    the view changed them.
+    """
+
+    ROLE_CLAIM = 'role'
+    ACTIVE_CLAIM = 'active'
+    VERSION_CLAIM = 'ver'
+
+    VERSION_KEY = 'auth:token_version:{}'
+    CLAIMS_TTL = int(os.getenv('AUTH_CLAIMS_TTL', '300'))
+
+    _local = None
+
+    @classmethod
+    def local(cls):
+        if cls._local is None:
+            cls._local = settings.CACHES['default']['BACKEND'].endswith('LocMemCache')
+        return cls._local
+
+    @classmethod
+    def for_user(cls, user):
+        """Refresh token (and through it the access token) carrying the user's claims."""
+        token = BlacklistRefreshToken.for_user(user)
+        token[cls.ROLE_CLAIM] = user.role
+        token[cls.ACTIVE_CLAIM] = user.is_active
+        token[cls.VERSION_CLAIM] = user.token_version
+        return token
+
+    @classmethod
+    def current_version(cls, user_id):
+        """The user's token version, or None when the user does not exist."""
+        if cls.local():
+            return User.objects.filter(pk=user_id).values_list('token_version', flat=True).first()
+        key = cls.VERSION_KEY.format(user_id)
+        version = cache.get(key)
+        if version is None:
+            version = User.objects.filter(pk=user_id).values_list('token_version', flat=True).first()
+            if version is not None:
+                cache.set(key, version, cls.CLAIMS_TTL)
+        return version
+
+    @classmethod
+    def bump_version(cls, user_id):
+        User.objects.filter(pk=user_id).update(token_version=F('token_version') + 1)
+        key = cls.VERSION_KEY.format(user_id)
+        transaction.on_commit(lambda: cache.delete(key))
+
+    @classmethod
+    def claims_user(cls, user_id, role, is_active, version):
+        """
+        A User built from claims without a query. Its other fields are
+        deferred: reading any of them loads them all in one query.
+        """
+        claims = {'id': user_id, 'role': role, 'is_active': is_active, 'token_version': version}
+        values = [claims.get(field.attname, DEFERRED) for field in User._meta.concrete_fields]
+        user = User.from_db(DEFAULT_DB_ALIAS, None, values)
+        user._from_claims = True
+        user._claims = claims
+        return user
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that builds ``request.user`` from the token's claims
+    when they are current, costing a cache read instead of a user query.
+    Tokens without claims or with an outdated version use the database.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        role = validated_token.get(TokenModule.ROLE_CLAIM)
+        version = validated_token.get(TokenModule.VERSION_CLAIM)
+        if user_id is None or role is None or version is None:
+            return super().get_user(validated_token)
+        if TokenModule.current_version(user_id) != version:
+            return super().get_user(validated_token)
+
+        is_active = validated_token.get(TokenModule.ACTIVE_CLAIM, True)
+        if not is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        return TokenModule.claims_user(user_id, role, is_active, version)
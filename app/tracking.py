@@ -0,0 +1,114 @@
+import os
+from datetime import datetime, timezone as dt_timezone
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.utils import timezone
+from .models import Bid, DeliveryStatus, Parcel
+
+
+# The DeliveryStatus model shadows the status choices of the same name in models.py
+PARCEL_STATUSES = [value for value, label in Parcel._meta.get_field('status').choices]
+STATUS_CODES = {value: code for code, value in enumerate(PARCEL_STATUSES)}
+
+
+class ParcelTrackingModule:
+    """
+    Parcel tracking events: bulk appends from courier apps, cached per-parcel
+    timelines and a latest-status view per business.
+
+    A cached timeline is a list of ``(recorded_at_ms, status_code, location)``
+    tuples, where ``status_code`` indexes PARCEL_STATUSES (statuses outside
+    the choices are kept as strings).
+    """
+
+    TIMELINE_KEY = 'tracking:timeline:{}'
+    TIMELINE_TTL = int(os.getenv('TRACKING_TIMELINE_TTL', '300'))
+    MAX_BATCH_EVENTS = int(os.getenv('TRACKING_MAX_BATCH_EVENTS', '500'))
+
+    @staticmethod
+    def accessible_parcels(user):
+        """Parcels the user may track: their own businesses' or ones whose job they were awarded."""
+        if user.role == 'ADMIN':
+            return Parcel.objects.all()
+        awarded = Bid.objects.filter(business=OuterRef('business'), driver=user, status='AWARDED')
+        return Parcel.objects.filter(Q(business__owner=user) | Exists(awarded))
+
+    @staticmethod
+    def latest_event():
+        """Correlated subquery over a parcel's events, newest first."""
+        return DeliveryStatus.objects.filter(parcel=OuterRef('pk')).order_by('-recorded_at', '-id')
+
+    @classmethod
+    def record_events(cls, user, events):
+        """
+        Append validated events in one multi-row insert and move each touched
+        parcel's status to its latest event. Events whose ``event_id`` was
+        already stored for the parcel are skipped, so uploads can be retried.
+        """
+        now = timezone.now()
+        rows = [
+            DeliveryStatus(
+                parcel_id=event['parcel'],
+                status=event['status'],
+                location=event.get('location'),
+                recorded_at=event.get('recorded_at') or now,
+                recorded_by=user,
+                event_id=event.get('event_id'),
+            )
+            for event in events
+        ]
+        parcel_ids = {row.parcel_id for row in rows}
+
+        with transaction.atomic():
+            DeliveryStatus.objects.bulk_create(rows, batch_size=cls.MAX_BATCH_EVENTS, ignore_conflicts=True)
+            Parcel.objects.filter(id__in=parcel_ids).update(
+                status=Subquery(cls.latest_event().values('status')[:1]),
+                updated_at=now,
+            )
+            keys = [cls.TIMELINE_KEY.format(parcel_id) for parcel_id in parcel_ids]
+            transaction.on_commit(lambda: cache.delete_many(keys))
+        return len(rows)
+
+    @classmethod
+    def timeline(cls, parcel_id):
+        key = cls.TIMELINE_KEY.format(parcel_id)
+        timeline = cache.get(key)
+        if timeline is None:
+            events = (
+                DeliveryStatus.objects.filter(parcel_id=parcel_id)
+                .order_by('recorded_at', 'id')
+                .values_list('recorded_at', 'status', 'location')
+            )
+            timeline = [
+                (int(recorded_at.timestamp() * 1000), STATUS_CODES.get(status, status), location)
+                for recorded_at, status, location in events
+            ]
+            cache.set(key, timeline, cls.TIMELINE_TTL)
+        return timeline
+
+    @staticmethod
+    def expand(timeline):
+        return [
+            {
+                'status': PARCEL_STATUSES[status] if isinstance(status, int) else status,
+                'location': location,
+                'recorded_at': datetime.fromtimestamp(recorded_at / 1000, tz=dt_timezone.utc).isoformat(),
+            }
+            for recorded_at, status, location in timeline
+        ]
+
+    @classmethod
+    def business_overview(cls, user, business_id):
+        """Every parcel of a business with its latest event, as one query."""
+        latest = cls.latest_event()
+        return (
+            cls.accessible_parcels(user)
+            .filter(business_id=business_id)
+            .annotate(
+                location=Subquery(latest.values('location')[:1]),
+                last_event_at=Subquery(latest.values('recorded_at')[:1]),
+            )
+            .order_by('id')
+            .values('id', 'parcel_details', 'dropoff_point', 'status', 'location', 'last_event_at')
+        )
@@ -6,7 +6,8 @@ from .views import (
     VehicleMakeViewSet, VehicleModelViewSet,
     WalletViewSet, TransactionalWalletViewSet, PaymentTransactionViewSet,
     FeedbackViewSet, GeofenceViewSet, StatisticsViewSet,AuthViewSet, RideViewSet,
-    TicketViewSet, TicketCategoryViewSet, payment_webhook
+    TicketViewSet, TicketCategoryViewSet, ParcelTrackingViewSet, ChatViewSet,
+    RealtimeViewSet, NotificationViewSet, payment_webhook
 )
 
 router = DefaultRouter()
@@ -28,6 +29,10 @@ router.register(r'auth', AuthViewSet, basename='auth')
 router.register(r'rides', RideViewSet, basename='ride')
 router.register(r'ticket-categories', TicketCategoryViewSet, basename='ticket-category')
 router.register(r'tickets', TicketViewSet, basename='ticket')
+router.register(r'parcel-tracking', ParcelTrackingViewSet, basename='parcel-tracking')
+router.register(r'chat', ChatViewSet, basename='chat')
+router.register(r'realtime', RealtimeViewSet, basename='realtime')
+router.register(r'notifications', NotificationViewSet, basename='notification')
 
 urlpatterns = [
     path('', include(router.urls)),
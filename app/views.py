@@ -9,32 +9,80 @@ from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
 from django.db.models import Avg, Count,Sum
 from django.db.models import Q
-from rest_framework_simplejwt.tokens import RefreshToken
+from django.db import DatabaseError, IntegrityError, transaction
+from rest_framework_simplejwt.exceptions import TokenError
 from django.contrib.auth import authenticate
 from .serializers import (
     UserCreateSerializer, UserResponseSerializer, UserRoleUpdateSerializer,
     CompleteProfileSerializer, VerifyComChannelSerializer, UpdatePasswordSerializer,
-    DriverAvailabilitySerializer, DriverRatingSerializer,BusinessSerializer, BidSerializer,
+    DriverAvailabilitySerializer, DriverRatingSerializer,BusinessSerializer, BusinessSummarySerializer, BidSerializer,
     VehicleColorSerializer, VehicleTypeSerializer,
     VehicleMakeSerializer, VehicleModelSerializer,WalletSerializer, RefreshTokenSerializer,
     TransactionalWalletSerializer, PaymentTransactionSerializer,ResetPasswordSerializer,
     GeofenceSerializer,FeedbackSerializer,StatisticsSerializer,VerifyPasswordResetCodeSerializer,
     UserRegistrationSerializer, UserLoginSerializer,PasswordResetRequestSerializer,
     TokenResponseSerializer, UserResponseSerializer,ChangePasswordSerializer, UserRegistrationOTPSerializer,
-    RideSerializer, RideCreateSerializer, TicketSerializer, TicketCategorySerializer, RideCostSerializer
+    RideSerializer, RideCreateSerializer, TicketSerializer, TicketCategorySerializer, RideCostSerializer,
+    DeliveryEventSerializer, ChatMessageSerializer, SendChatMessageSerializer, MarkChatReadSerializer,
+    ConversationSerializer, NotificationSerializer, CardAuthorizationSerializer, WalletStatementSerializer
 )
 from .models import (
     DriverAvailability, DriverRating,Business, Bid, VehicleColor, VehicleType,
     VehicleMake, VehicleModel,Wallet, TransactionalWallet, PaymentTransaction,
-    Feedback,Transaction, Geofence, Parcel, OTP, Ride, Ticket, TicketCategory
+    Feedback,Transaction, Geofence, Parcel, Ride, Ticket, TicketCategory, Profile
     )
 from .utils import generate_verification_code, send_verification_email, send_verification_sms
 from .costcalculator import CostComputationModule
+from .surge import SurgePricingModule
+from .geofencing import CompiledFence, geofence_index
+from .authentication import LoginModule
+from .marketplace import MarketplaceModule
+from .otp import OTPModule, OTPPurpose, OTPRateLimited
+from .pagination import IdCursorPagination, RecentActivityCursorPagination
+from .tracking import ParcelTrackingModule
+from .chat import ChatError, ChatModule
+from .realtime import RealtimeModule
+from .notifications import NotificationModule
 from .payment import PaymentProcessingModule
+from .payouts import PayoutModule
+from .cards import CardAuthorizationModule, CardChargeError
+from .settlement import SettlementModule
+from .wallets import WalletModule
+from .exports import ExportModule
+from .statements import StatementModule
+from .tokens import BlacklistRefreshToken, TokenModule
 from drf_yasg.utils import swagger_auto_schema
+import logging
 import uuid
+import requests
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+def export_history(request, source):
+    """
+    Stream the caller's rows of ``source`` as CSV or NDJSON, selected with
+    ``?output=`` (``format`` is taken by DRF). ``from`` and ``to`` bound
+    created_at; admins export everyone's rows unless they pass ``user``.
+    """
+    output = request.query_params.get('output', 'csv')
+    if output not in ExportModule.FORMATS:
+        return Response(
+            {"detail": f"output must be one of: {', '.join(ExportModule.FORMATS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        start = ExportModule.parse_bound(request.query_params.get('from'))
+        end = ExportModule.parse_bound(request.query_params.get('to'), end=True)
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    owner = request.user
+    if request.user.role == 'ADMIN':
+        user_id = request.query_params.get('user')
+        owner = get_object_or_404(User, pk=user_id) if user_id else None
+    return ExportModule.response(source, output, owner, start, end)
 
 # auth routes
 
@@ -63,9 +111,15 @@ class AuthViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         # Send verification code
-        otp_code = generate_verification_code()
-        OTP.objects.create(contact_info=email_or_phone,otp_code=otp_code,expires_at=datetime.now(timezone.utc) + timedelta(seconds=300))
-        
+        try:
+            otp_code = OTPModule.issue(email_or_phone, OTPPurpose.REGISTRATION)
+        except OTPRateLimited as exc:
+            return Response(
+                {"detail": str(exc)},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(exc.retry_after)}
+            )
+
         if "@" in email_or_phone:
             send_verification_email(email_or_phone, otp_code)
         else:
@@ -78,16 +132,14 @@ class AuthViewSet(viewsets.ViewSet):
         serializer = UserRegistrationSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         email_or_phone = serializer.validated_data['email_or_phone_number']
-        now = datetime.now(timezone.utc)
         code = serializer.validated_data['verification_code']
-        if not OTP.objects.filter(contact_info=email_or_phone,otp_code=code, expires_at__gt = now).exists():
+        # Verifying consumes the code
+        if not OTPModule.verify(email_or_phone, OTPPurpose.REGISTRATION, code):
             return Response(
                 {"detail": "Invalid verification code"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Invalidate OTP
-        OTP.objects.filter(contact_info=email_or_phone,otp_code=code).delete()
         # Register user
         user = User.register_user(serializer.validated_data)
         if not user:
@@ -97,7 +149,7 @@ class AuthViewSet(viewsets.ViewSet):
             )
 
         # Generate token
-        refresh = RefreshToken.for_user(user)
+        refresh = TokenModule.for_user(user)
         
 
         return Response({
@@ -115,30 +167,20 @@ class AuthViewSet(viewsets.ViewSet):
         serializer.is_valid(raise_exception=True)
         username=serializer.validated_data['email_or_phone_number']
         password=serializer.validated_data['password']
-        user = None
-        if "@" in username:
-            try:
-                user = User.objects.get(email=username)
-            except User.DoesNotExist:
-                pass
-        else:
-            try:
-                user = User.objects.get(phone_number=username)
-            except User.DoesNotExist:
-                pass
-                    
-        if user is None or not user.check_password(password):
+        user = LoginModule.authenticate(username, password)
+        if user is None:
             return Response(
                 {"detail": "Invalid credentials"},
                 status=status.HTTP_401_UNAUTHORIZED
             )
 
-        refresh = RefreshToken.for_user(user)
+        LoginModule.record_login(user)
+        refresh = TokenModule.for_user(user)
         return Response({
             "access_token": str(refresh.access_token),
             'refresh': str(refresh),
             "token_type": "bearer",
-            "user": UserResponseSerializer(user).data,
+            "user": UserResponseSerializer(LoginModule.prepare_response_user(user)).data,
             "message": "Login successfully",
         })
 
@@ -147,7 +189,7 @@ class AuthViewSet(viewsets.ViewSet):
     def logout(self, request):
         try:
             refresh_token = request.data["refresh"]
-            token = RefreshToken(refresh_token)
+            token = BlacklistRefreshToken(refresh_token)
             token.blacklist()
             return Response({"detail": "Successfully logged out"})
         except Exception:
@@ -156,6 +198,29 @@ class AuthViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    @swagger_auto_schema(request_body=RefreshTokenSerializer, responses={200: "Tokens refreshed", 401: "Invalid refresh token"})
+    @action(detail=False, methods=['post'])
+    def refresh(self, request):
+        serializer = RefreshTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            token = BlacklistRefreshToken(serializer.validated_data['refresh'])
+        except TokenError:
+            return Response({"detail": "Invalid refresh token"}, status=status.HTTP_401_UNAUTHORIZED)
+
+        # Reissue from the stored user so role and version claims are current
+        user = User.objects.filter(pk=token.payload.get('user_id'), is_active=True).first()
+        if user is None:
+            return Response({"detail": "Invalid refresh token"}, status=status.HTTP_401_UNAUTHORIZED)
+        with transaction.atomic():
+            token.blacklist()
+            refresh = TokenModule.for_user(user)
+        return Response({
+            "access_token": str(refresh.access_token),
+            "refresh": str(refresh),
+            "token_type": "bearer",
+        })
+
     @swagger_auto_schema(request_body=ChangePasswordSerializer, responses={200: "OTP sent successfully", 400: "Invalid phone number"})
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
     def change_password(self, request):
@@ -167,7 +232,7 @@ class AuthViewSet(viewsets.ViewSet):
         
         user = request.user
         user.set_password(serializer.validated_data['new_password'])
-        user.save()
+        user.save(update_fields=['password'])
         
         return Response({"message": "Password changed successfully"})
     
@@ -204,12 +269,14 @@ class AuthViewSet(viewsets.ViewSet):
             )
         
         # Generate and send OTP
-        otp_code = generate_verification_code()
-        OTP.objects.create(
-            contact_info=email_or_phone,
-            otp_code=otp_code,
-            expires_at=datetime.now(timezone.utc) + timedelta(seconds=300)
-        )
+        try:
+            otp_code = OTPModule.issue(email_or_phone, OTPPurpose.PASSWORD_RESET)
+        except OTPRateLimited as exc:
+            return Response(
+                {"detail": str(exc)},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(exc.retry_after)}
+            )
         
         if "@" in email_or_phone:
             send_verification_email(email_or_phone, otp_code)
@@ -227,20 +294,8 @@ class AuthViewSet(viewsets.ViewSet):
         email_or_phone = serializer.validated_data['email_or_phone_number']
         verification_code = serializer.validated_data['verification_code']
         new_password = serializer.validated_data['new_password']
-        now = datetime.now(timezone.utc)
-        
-        # Verify OTP
-        if not OTP.objects.filter(
-            contact_info=email_or_phone,
-            otp_code=verification_code,
-            expires_at__gt=now
-        ).exists():
-            return Response(
-                {"detail": "Invalid or expired verification code"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
         
-        # Get user
+        # Get user first so a valid code is not spent on a missing account
         user = None
         if "@" in email_or_phone:
             try:
@@ -259,12 +314,16 @@ class AuthViewSet(viewsets.ViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
         
-        # Invalidate OTP
-        OTP.objects.filter(contact_info=email_or_phone, otp_code=verification_code).delete()
+        # Verify and consume OTP
+        if not OTPModule.verify(email_or_phone, OTPPurpose.PASSWORD_RESET, verification_code):
+            return Response(
+                {"detail": "Invalid or expired verification code"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         # Update password
         user.set_password(new_password)
-        user.save()
+        user.save(update_fields=['password'])
         
         return Response({"message": "Password reset successfully"})
 
@@ -318,13 +377,9 @@ class UserViewSet(viewsets.ModelViewSet):
             context={'profile_data': request.data}
         )
         serializer.is_valid(raise_exception=True)
+        # Saves the user and profile together and sets is_completed
         updated_user = serializer.save()
         
-        # Check if profile is complete
-        if self._is_profile_complete(updated_user):
-            updated_user.is_completed = True
-            updated_user.save()
-        
         response_serializer = UserResponseSerializer(updated_user)
         return Response(response_serializer.data)
 
@@ -349,7 +404,10 @@ class UserViewSet(viewsets.ModelViewSet):
 
         serializer = UserRoleUpdateSerializer(user, data=request.data)
         serializer.is_valid(raise_exception=True)
-        updated_user = serializer.save()
+        with transaction.atomic():
+            updated_user = serializer.save()
+            # Tokens already issued carry the old role
+            TokenModule.bump_version(updated_user.id)
         response_serializer = UserResponseSerializer(updated_user)
         return Response(response_serializer.data)
 
@@ -382,22 +440,15 @@ class UserViewSet(viewsets.ModelViewSet):
             )
             
         user.set_password(serializer.validated_data['password'])
-        user.save()
+        user.save(update_fields=['password'])
         return Response({"message": "Password updated successfully"})
 
     def _is_profile_complete(self, user):
-        if user.role == 'DRIVER':
+        try:
             profile = user.profile
-            return all([
-                user.name,
-                user.phone_number,
-                profile.driver_license_number,
-                profile.driver_id,
-                profile.vehicle_color_id,
-                profile.vehicle_plate_number,
-                profile.vehicle_type_id
-            ])
-        return bool(user.name)
+        except Profile.DoesNotExist:
+            profile = None
+        return CompleteProfileSerializer.is_profile_complete(user, profile)
     
     
 # add for driver 
@@ -429,6 +480,15 @@ class DriverViewSet(viewsets.GenericViewSet):
         if not created:
             availability.status = request.data.get('status', 'UNAVAILABLE')
             availability.save()
+
+        # Drivers reporting their position count towards surge supply
+        latitude = request.data.get('latitude')
+        longitude = request.data.get('longitude')
+        if availability.status == 'AVAILABLE' and latitude is not None and longitude is not None:
+            try:
+                SurgePricingModule.record_driver_available(driver.id, float(latitude), float(longitude))
+            except (TypeError, ValueError):
+                pass
             
         serializer = DriverAvailabilitySerializer(availability)
         return Response(serializer.data)
@@ -538,50 +598,37 @@ class BusinessViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        user = self.request.user
-        queryset = Business.objects.all()
-        
-        # Get query parameters
-        priority = self.request.query_params.getlist('priority')
-        max_waiting_time = self.request.query_params.get('maximum_waiting_time')
-        delivery_fee_min = self.request.query_params.get('delivery_fee_min')
-        delivery_fee_max = self.request.query_params.get('delivery_fee_max')
-        bid_status = self.request.query_params.get('bid_status')
-        
-        # Apply filters based on user role
-        if user.role == 'DRIVER':
-            if bid_status == 'ACCEPTED':
-                queryset = queryset.filter(
-                    status='AVAILABLE',
-                    bids__status='ACCEPTED',
-                    bids__driver=user
-                )
-            elif bid_status == 'AWARDED':
-                queryset = queryset.filter(
-                    Q(status='AVAILABLE') | Q(status='COMPLETED'),
-                    bids__status='AWARDED',
-                    bids__driver=user
-                )
-            else:
-                queryset = queryset.filter(status='AVAILABLE')
-        elif user.role == 'USER':
-            queryset = queryset.filter(owner=user)
-
-        # Apply additional filters
-        if priority:
-            queryset = queryset.filter(priority__in=priority)
-        if max_waiting_time:
-            queryset = queryset.filter(maximum_waiting_time__lte=max_waiting_time)
-        if delivery_fee_min:
-            queryset = queryset.filter(delivery_fee__gte=delivery_fee_min)
-        if delivery_fee_max:
-            queryset = queryset.filter(delivery_fee__lte=delivery_fee_max)
-
+        params = self.request.query_params
+        queryset = MarketplaceModule.scope(Business.objects.all(), self.request.user, params.get('bid_status'))
+        queryset = MarketplaceModule.apply_filters(queryset, params)
+        if self.action in ('list', 'retrieve'):
+            queryset = MarketplaceModule.listing_queryset(queryset)
         return queryset
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    @action(detail=False, methods=['get'])
+    def marketplace(self, request):
+        """
+        Cursor-paginated search with facet counts for the current filters.
+        Rows use the flat summary unless ``expand=full`` asks for nested bids and parcels.
+        """
+        params = request.query_params
+        scoped = MarketplaceModule.scope(Business.objects.all(), request.user, params.get('bid_status'))
+        queryset = MarketplaceModule.apply_filters(scoped, params)
+        if params.get('expand') == 'full':
+            queryset, serializer_class = MarketplaceModule.listing_queryset(queryset), BusinessSerializer
+        else:
+            queryset, serializer_class = MarketplaceModule.summary_queryset(queryset), BusinessSummarySerializer
+
+        paginator = IdCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = serializer_class(page, many=True, context=self.get_serializer_context())
+        response = paginator.get_paginated_response(serializer.data)
+        response.data['facets'] = MarketplaceModule.facets(scoped, params)
+        return response
+
     @action(detail=True, methods=['post'])
     def update_status(self, request, pk=None):
         business = self.get_object()
@@ -601,24 +648,17 @@ class BidViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Bid.objects.all()
+        return Bid.objects.select_related('driver', 'business')
 
     def perform_create(self, serializer):
-        business_id = self.request.data.get('business')
-        business = Business.objects.get(id=business_id)
-        
-        # Check if user already has a bid for this business
-        existing_bid = Bid.objects.filter(
-            business=business,
-            driver=self.request.user
-        ).first()
-        
-        if existing_bid:
+        # One bid per driver per business is enforced by the unique_bid_per_driver constraint
+        try:
+            with transaction.atomic():
+                serializer.save(driver=self.request.user)
+        except IntegrityError:
             raise serializers.ValidationError(
                 "You already have a bid for this business"
             )
-            
-        serializer.save(driver=self.request.user)
 
     @action(detail=True, methods=['post'])
     def award_bid(self, request, pk=None):
@@ -629,15 +669,13 @@ class BidViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
             
-        bid.status = 'AWARDED'
-        bid.awarded_at = datetime.now(timezone.utc)
-        bid.save()
-        
-        # Update other bids for this business
-        Bid.objects.filter(business=bid.business).exclude(id=bid.id).update(
-            status='REJECTED'
-        )
-        
+        if not MarketplaceModule.award_bid(bid, request.user):
+            return Response(
+                {"detail": "This business is no longer open for awarding or the bid has been withdrawn"},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        bid.refresh_from_db()
         serializer = self.get_serializer(bid)
         return Response(serializer.data)
 
@@ -757,11 +795,26 @@ class WalletViewSet(viewsets.GenericViewSet):
     @action(detail=False, methods=['get'])
     def my_wallet(self, request):
         """Get current user's wallet"""
-        wallet = self.get_queryset().first()
-        if not wallet:
-            wallet = Wallet.objects.create(user=request.user)
-        serializer = self.get_serializer(wallet)
-        return Response(serializer.data)
+        # Same fields as WalletSerializer, usually straight from the cache
+        return Response(WalletModule.balance(request.user.id))
+
+    @action(detail=False, methods=['get'])
+    def statements(self, request):
+        """Monthly statements, newest first; ?before=YYYY-MM pages back and ?months= sets the page size"""
+        before = request.query_params.get('before')
+        if before:
+            try:
+                before = datetime.strptime(before, '%Y-%m').date()
+            except ValueError:
+                return Response({"detail": "before must look like YYYY-MM"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            months = int(request.query_params.get('months') or StatementModule.DEFAULT_MONTHS)
+        except ValueError:
+            return Response({"detail": "months must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        statements = StatementModule.statements_for(request.user.id, before, max(months, 1))
+        data = WalletStatementSerializer(statements, many=True).data
+        next_before = statements[-1].month.strftime('%Y-%m') if len(statements) == max(months, 1) else None
+        return Response({'results': data, 'next_before': next_before})
 
 class TransactionalWalletViewSet(viewsets.ModelViewSet):
     serializer_class = TransactionalWalletSerializer
@@ -798,27 +851,25 @@ class TransactionalWalletViewSet(viewsets.ModelViewSet):
             status=status.HTTP_405_METHOD_NOT_ALLOWED
         )
 
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream escrow history as CSV or NDJSON"""
+        return export_history(request, 'escrow')
+
     @action(detail=True, methods=['post'])
     def pay(self, request):
         serializer = TransactionalWalletSerializer(data=request.data)        
+        serializer.is_valid(raise_exception=True)
         from_user = self.request.user
-        from_wallet = Wallet.objects.get(user=from_user)
-        
-        # Validate sufficient balance
         amount = serializer.validated_data['amount']
-        if from_wallet.active_balance < amount:
-            raise serializers.ValidationError(
-                "Insufficient balance for this transaction"
-            )
-        if serializer.is_valid():
-            serializer.save()    
-        # Create transaction and update balances
-        transaction = serializer.save(from_user=from_user)
-        
-        # Update wallet balances
-        from_wallet.active_balance -= amount
-        from_wallet.transactional_balance += amount
-        from_wallet.save()
+
+        with transaction.atomic():
+            # Move the amount into the transactional balance if it is available
+            if not WalletModule.hold(from_user.id, amount):
+                raise serializers.ValidationError(
+                    "Insufficient balance for this transaction"
+                )
+            serializer.save(from_user=from_user)
         return Response(serializer.data)
 
     @action(detail=True, methods=['post'])
@@ -829,33 +880,33 @@ class TransactionalWalletViewSet(viewsets.ModelViewSet):
     # @action(detail=True, methods=['post'])
     def release_funds(self, request, pk=None):
         """Release funds for a transaction"""
-        transaction = self.get_object()
+        escrow = self.get_object()
         
-        if transaction.status != 'PENDING':
+        if escrow.status != 'PENDING':
             return Response(
                 {"detail": "Transaction is not in pending state"},
                 status=status.HTTP_400_BAD_REQUEST
             )
             
-        if transaction.scheduled_release_date and transaction.scheduled_release_date > datetime.now(timezone.utc):
+        if escrow.scheduled_release_date and escrow.scheduled_release_date > datetime.now(timezone.utc):
             return Response(
                 {"detail": "Cannot release funds before scheduled date"},
                 status=status.HTTP_400_BAD_REQUEST
             )
             
-        # Update transaction status
-        transaction.status = 'COMPLETED'
-        transaction.save()
-        
-        # Update wallet balances
-        from_wallet = transaction.from_user.wallet
-        to_wallet = transaction.to_user.wallet
-        
-        from_wallet.transactional_balance -= transaction.amount
-        to_wallet.active_balance += transaction.amount
-        
-        from_wallet.save()
-        to_wallet.save()
+        with transaction.atomic():
+            # Only one request may complete the transaction
+            if not TransactionalWallet.objects.filter(pk=escrow.pk, status='PENDING').update(status='COMPLETED'):
+                return Response(
+                    {"detail": "Transaction is not in pending state"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if not WalletModule.release(escrow.from_user_id, escrow.to_user_id, escrow.amount):
+                transaction.set_rollback(True)
+                return Response(
+                    {"detail": "Insufficient funds held for this transaction"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
         
         return Response({"detail": "Funds released successfully"})
 
@@ -920,6 +971,12 @@ class PaymentTransactionViewSet(viewsets.ModelViewSet):
             
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream payment history as CSV or NDJSON"""
+        return export_history(request, 'payments')
+
     # withdraw from wallet
     @action(detail=False, methods=['post'])
     def withdraw(self,request):
@@ -928,31 +985,78 @@ class PaymentTransactionViewSet(viewsets.ModelViewSet):
         bank_code = request.data.get("bank_code",0)
         channelType = request.data.get("type","nuban")
         currency =  request.data.get("currency","kes")
+        try:
+            amount = int(request.data.get("amount",0))
+        except (TypeError, ValueError):
+            amount = 0
+        if amount <= 0:
+            return Response({'detail': 'amount must be a positive whole number'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Registered with Paystack only the first time this account is used
+        destination = PayoutModule.destination_for(user, account_number, bank_code, type=channelType, currency=currency)
+        if destination is None:
+            return Response({'detail': 'Withdrawal failed'}, status=status.HTTP_400_BAD_REQUEST)
+        if PayoutModule.BATCHING:
+            # Held from the wallet now and sent with the next bulk transfer
+            withdrawal = PayoutModule.enqueue(user, amount, destination)
+            if withdrawal is None:
+                return Response({'detail': 'Insufficient balance'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(
+                {'detail': 'Withdrawal queued', 'reference': withdrawal.transaction_reference},
+                status=status.HTTP_202_ACCEPTED
+            )
 
-        wallet = Wallet.objects.get(user=user)
-        if wallet.active_balance < request.data.get("amount",0):
-            return Response({'detail': 'Insufficient balance'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        transaction = PaymentTransaction.objects.create(
-            user=user,
-            amount=request.data.get("amount",0),
-            transaction_type='WITHDRAWAL',
-            status='PENDING',
-            transaction_reference=str(uuid.uuid4()),
-        )
-        recipient = PaymentProcessingModule.create_recipient(name=user.name, account= account_number, bank_code= bank_code, type=channelType,currency=currency)
-        if recipient.get('status') == True:
-            withdrawal = PaymentProcessingModule.withdraw_from_wallet(amount=request.data.get("amount",0), recipient_code=recipient.get('data').get('recipient_code'), reason='Withdrawal from wallet')
-            if withdrawal.get('status') == True:
-                transaction.status = 'COMPLETED'
-                transaction.save()
-                wallet.active_balance -= request.data.get("amount",0)
-                wallet.save()
+        # Take the money first so concurrent withdrawals cannot overdraw the wallet
+        with transaction.atomic():
+            if not WalletModule.debit(user.id, amount):
+                return Response({'detail': 'Insufficient balance'}, status=status.HTTP_400_BAD_REQUEST)
+            withdrawal = PaymentTransaction.objects.create(
+                user=user,
+                amount=amount,
+                transaction_type='WITHDRAWAL',
+                status='PENDING',
+                transaction_reference=str(uuid.uuid4()),
+                payout_destination=destination,
+            )
+        try:
+            result = PaymentProcessingModule.withdraw_from_wallet(
+                amount=amount, recipient_code=destination.recipient_code, reason='Withdrawal from wallet',
+                currency=destination.currency, reference=withdrawal.transaction_reference,
+            )
+        except requests.RequestException as e:
+            logger.exception("Transfer request for withdrawal %s failed", withdrawal.transaction_reference)
+            response = getattr(e, 'response', None)
+            if response is not None and response.status_code < 500:
+                result = {}
+            else:
+                # Paystack may have accepted the transfer; keep the money held until it is confirmed
+                return Response(
+                    {'detail': 'Withdrawal is being processed', 'reference': withdrawal.transaction_reference},
+                    status=status.HTTP_202_ACCEPTED
+                )
+        with transaction.atomic():
+            if result.get('status') == True:
+                PaymentTransaction.objects.filter(pk=withdrawal.pk).update(status='COMPLETED', updated_at=datetime.now(timezone.utc))
+                StatementModule.record_payment(withdrawal)
                 return Response({'detail': 'Withdrawal successful'}, status=status.HTTP_200_OK)
-        # failed case
-        transaction.status = 'FAILED'
-        transaction.save()
+            # failed case: give the money back
+            PaymentTransaction.objects.filter(pk=withdrawal.pk).update(status='FAILED', updated_at=datetime.now(timezone.utc))
+            WalletModule.credit(user.id, amount)
         return Response({'detail': 'Withdrawal failed'}, status=status.HTTP_400_BAD_REQUEST)
+    # saved cards for one-tap ride charges
+    @action(detail=False, methods=['get'])
+    def cards(self, request):
+        cards = CardAuthorizationModule.cards_for(request.user)
+        return Response(CardAuthorizationSerializer(cards, many=True).data)
+
+    @action(detail=False, methods=['post'])
+    def remove_card(self, request):
+        card_id = request.data.get('card_id')
+        if not card_id:
+            return Response({'detail': 'card_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        CardAuthorizationModule.deactivate(request.user.id, card_id)
+        return Response({'detail': 'Card removed'})
+
     # top up wallet
     @action(detail=False, methods=['post'])
     def top_up(self,request):
@@ -991,18 +1095,22 @@ class PaymentTransactionViewSet(viewsets.ModelViewSet):
             return Response({'detail': 'Reference is required'}, status=status.HTTP_400_BAD_REQUEST)
         try:
             payment = PaymentProcessingModule.verifyPayment(reference)
-            print(payment)
-            if payment.get('data').get('status') == 'success':
-                transaction.status = 'SUCCESS'
-                transaction.save()
-                wallet = Wallet.objects.get(user=transaction.user)
-                wallet.active_balance += transaction.amount
-                wallet.save()
-                return Response({'detail': 'Payment verified'}, status=status.HTTP_200_OK)                
         except Exception as ex:
-            pass
-        transaction.status = 'Failed'
-        transaction.save()
+            payment = {}
+        payment_data = (payment or {}).get('data') or {}
+        if payment_data.get('status') == 'success':
+            # Status, credit and statement commit together, and only if the webhook has not already done so
+            CardAuthorizationModule.complete_charge(transaction)
+            # Keep the card for one-tap ride charges; a failure here leaves the payment verified
+            try:
+                CardAuthorizationModule.capture(transaction.user_id, payment_data)
+            except (DatabaseError, AttributeError):
+                logger.exception("Could not store the card authorization for payment %s", reference)
+            return Response({'detail': 'Payment verified'}, status=status.HTTP_200_OK)
+        # A payment the webhook already completed stays completed
+        if PaymentTransaction.objects.filter(pk=transaction.pk, status='PENDING').update(status='Failed'):
+            transaction.status = 'Failed'
+            NotificationModule.payment_result(transaction, False)
         return Response({'detail': 'Payment not verified'}, status=status.HTTP_400_BAD_REQUEST)
 
 # add feedback, geofence, ticket and statistics
@@ -1040,6 +1148,187 @@ class FeedbackViewSet(viewsets.ModelViewSet):
             'total_feedback': feedback.count()
         })
 
+class ParcelTrackingViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(request_body=DeliveryEventSerializer(many=True))
+    @action(detail=False, methods=['post'])
+    def events(self, request):
+        """Append a batch of tracking events: {"events": [{parcel, status, location, recorded_at, event_id}]}."""
+        events = request.data.get('events')
+        if not isinstance(events, list) or not events:
+            return Response(
+                {"detail": "events must be a non-empty list"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(events) > ParcelTrackingModule.MAX_BATCH_EVENTS:
+            return Response(
+                {"detail": f"At most {ParcelTrackingModule.MAX_BATCH_EVENTS} events per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        serializer = DeliveryEventSerializer(data=events, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        parcel_ids = {event['parcel'] for event in serializer.validated_data}
+        allowed = set(
+            ParcelTrackingModule.accessible_parcels(request.user)
+            .filter(id__in=parcel_ids)
+            .values_list('id', flat=True)
+        )
+        if allowed != parcel_ids:
+            return Response(
+                {"detail": "You cannot report events for these parcels", "parcels": sorted(parcel_ids - allowed)},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        received = ParcelTrackingModule.record_events(request.user, serializer.validated_data)
+        return Response({"received": received}, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'])
+    def timeline(self, request, pk=None):
+        current = ParcelTrackingModule.accessible_parcels(request.user).filter(id=pk).values_list('status', flat=True).first()
+        if current is None:
+            return Response(
+                {"detail": "Parcel not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        events = ParcelTrackingModule.expand(ParcelTrackingModule.timeline(pk))
+        return Response({"parcel": int(pk), "status": current, "events": events})
+
+    @action(detail=False, methods=['get'])
+    def business(self, request):
+        """Latest status and location of every parcel of a business."""
+        business_id = request.query_params.get('business_id')
+        if not business_id:
+            return Response(
+                {"detail": "Business ID is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        parcels = list(ParcelTrackingModule.business_overview(request.user, business_id))
+        return Response({"business": business_id, "parcels": parcels})
+
+class ChatViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+
+    @action(detail=False, methods=['get'])
+    def conversations(self, request):
+        paginator = RecentActivityCursorPagination()
+        page = paginator.paginate_queryset(ChatModule.conversations_for(request.user), request, view=self)
+        serializer = ConversationSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+    @swagger_auto_schema(request_body=SendChatMessageSerializer)
+    @action(detail=False, methods=['post'])
+    def send(self, request):
+        serializer = SendChatMessageSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        receiver = User.objects.filter(id=serializer.validated_data['receiver']).first()
+        if not receiver:
+            return Response(
+                {"detail": "Receiver not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        try:
+            message = ChatModule.send_message(request.user, receiver, serializer.validated_data['message'])
+        except ChatError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_403_FORBIDDEN)
+        return Response(ChatMessageSerializer(message).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        """Messages with another user, newest first; pass next_before back as before for older ones."""
+        user_id = request.query_params.get('user_id')
+        if not user_id:
+            return Response(
+                {"detail": "User ID is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            before = int(request.query_params.get('before') or 0)
+            limit = int(request.query_params.get('limit') or 0)
+            conversation = ChatModule.conversation_between(request.user.id, int(user_id))
+        except ValueError:
+            return Response(
+                {"detail": "user_id, before and limit must be integers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not conversation:
+            return Response({"results": [], "next_before": None})
+        messages, next_before = ChatModule.history(conversation, before, limit)
+        return Response({
+            "results": ChatMessageSerializer(messages, many=True).data,
+            "next_before": next_before,
+        })
+
+    @swagger_auto_schema(request_body=MarkChatReadSerializer)
+    @action(detail=False, methods=['post'])
+    def mark_read(self, request):
+        serializer = MarkChatReadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        conversation = ChatModule.conversation_between(request.user.id, serializer.validated_data['user_id'])
+        if not conversation:
+            return Response(
+                {"detail": "Conversation not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        marked = ChatModule.mark_read(conversation, request.user, serializer.validated_data.get('up_to'))
+        return Response({"marked": marked})
+
+    @action(detail=False, methods=['get'])
+    def unread(self, request):
+        return Response({"unread": ChatModule.unread_total(request.user)})
+
+class RealtimeViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+
+    @action(detail=False, methods=['get'])
+    def poll(self, request):
+        """
+        Poll for events after the ``after`` sequence number, waiting up to
+        ``timeout`` seconds where long waits are enabled. When ``reset`` is
+        true some events were dropped and the client should reload
+        conversations and unread counts.
+        """
+        try:
+            after = int(request.query_params.get('after') or 0)
+            timeout = request.query_params.get('timeout')
+            timeout = float(timeout) if timeout else None
+        except ValueError:
+            return Response(
+                {"detail": "after and timeout must be numbers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(RealtimeModule.poll(request.user.id, after, timeout))
+
+class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = NotificationSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = IdCursorPagination
+
+    def get_queryset(self):
+        queryset = NotificationModule.inbox(self.request.user)
+        if self.request.query_params.get('status'):
+            queryset = queryset.filter(status=self.request.query_params['status'])
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        return Response({"unread": NotificationModule.unread_count(request.user.id)})
+
+    @action(detail=False, methods=['post'])
+    def mark_read(self, request):
+        """Mark notifications read: {"ids": [...]}, {"up_to": id} or an empty body for all."""
+        ids = request.data.get('ids')
+        up_to = request.data.get('up_to')
+        if ids is not None and not isinstance(ids, list):
+            return Response(
+                {"detail": "ids must be a list"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        marked = NotificationModule.mark_read(request.user, ids=ids, up_to=up_to)
+        return Response({"marked": marked})
+
 class TicketCategoryViewSet(viewsets.ModelViewSet):
     queryset = TicketCategory.objects.all()
     serializer_class = TicketCategorySerializer
@@ -1059,11 +1348,19 @@ class TicketViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(raised_by=self.request.user)
 
+    def perform_update(self, serializer):
+        previous_status = serializer.instance.status
+        ticket = serializer.save()
+        if ticket.status != previous_status and ticket.raised_by_id != self.request.user.id:
+            NotificationModule.ticket_updated(ticket)
+
 class GeofenceViewSet(viewsets.ModelViewSet):
     queryset = Geofence.objects.all()
     serializer_class = GeofenceSerializer
     permission_classes = [IsAuthenticated]
 
+    MAX_BATCH_POINTS = 1000
+
     @action(detail=True, methods=['post'])
     def check_point(self, request, pk=None):
         """Check if a point is within the geofence"""
@@ -1077,7 +1374,6 @@ class GeofenceViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
             
-        # Implement point-in-polygon check here
         is_inside = self._check_point_in_geofence(geofence, float(lat), float(lng))
         
         return Response({
@@ -1085,32 +1381,62 @@ class GeofenceViewSet(viewsets.ModelViewSet):
             "geofence_name": geofence.name
         })
 
+    @action(detail=False, methods=['post'])
+    def containing(self, request):
+        """List every geofence that contains a point"""
+        try:
+            lat = float(request.data.get('latitude'))
+            lng = float(request.data.get('longitude'))
+        except (TypeError, ValueError):
+            return Response(
+                {"detail": "Latitude and longitude are required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        fences = geofence_index.containing(lat, lng)
+        return Response({
+            "geofences": [{"id": fence.id, "name": fence.name} for fence in sorted(fences, key=lambda fence: fence.id)]
+        })
+
+    @action(detail=False, methods=['post'])
+    def batch_containing(self, request):
+        """For a batch of points, list the geofences each point falls in"""
+        raw_points = request.data.get('points')
+        if not isinstance(raw_points, list) or not raw_points:
+            return Response(
+                {"detail": "points must be a non-empty list"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(raw_points) > self.MAX_BATCH_POINTS:
+            return Response(
+                {"detail": f"At most {self.MAX_BATCH_POINTS} points per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        points = []
+        try:
+            for point in raw_points:
+                if isinstance(point, dict):
+                    points.append((float(point['latitude']), float(point['longitude'])))
+                else:
+                    points.append((float(point[0]), float(point[1])))
+        except (KeyError, IndexError, TypeError, ValueError):
+            return Response(
+                {"detail": "Each point needs a latitude and longitude"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = geofence_index.containing_many(points)
+        return Response({
+            "results": [
+                {"latitude": lat, "longitude": lng, "geofence_ids": [fence.id for fence in fences]}
+                for (lat, lng), fences in zip(points, results)
+            ]
+        })
+
     def _check_point_in_geofence(self, geofence, lat, lng):
-        # Implement your geofence checking logic here
-        # This is a simplified example
-        from math import radians, sin, cos, sqrt, atan2
-        
-        def haversine_distance(lat1, lon1, lat2, lon2):
-            R = 6371  # Earth's radius in kilometers
-            
-            lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-            dlat = lat2 - lat1
-            dlon = lon2 - lon1
-            
-            a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-            c = 2 * atan2(sqrt(a), sqrt(1-a))
-            distance = R * c
-            
-            return distance
-            
-        # Parse center coordinates from geofence.coordinates
-        center_lat, center_lng = map(float, geofence.coordinates.split(','))
-        
-        # Calculate distance between point and center
-        distance = haversine_distance(lat, lng, center_lat, center_lng)
-        
-        # Check if point is within radius
-        return distance <= geofence.radius
+        fence = CompiledFence.from_geofence(geofence)
+        return bool(fence) and fence.contains(lat, lng)
 
 class StatisticsViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
@@ -1221,7 +1547,25 @@ class RideViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         # Automatically set customer to current user
-        serializer.save(customer=self.request.user)
+        extra_fields = {'customer': self.request.user}
+
+        # Fill in distance/duration/fare the client did not send
+        data = serializer.validated_data
+        coords = [data.get(key) for key in ('pickup_latitude', 'pickup_longitude', 'dropoff_latitude', 'dropoff_longitude')]
+        if data.get('estimated_duration') is None and all(value is not None for value in coords):
+            try:
+                estimate = CostComputationModule.estimate(*coords)
+            except ValueError:
+                estimate = None
+            if estimate:
+                extra_fields['estimated_duration'] = estimate['duration_minutes']
+                if data.get('estimated_distance') is None:
+                    extra_fields['estimated_distance'] = estimate['distance_km']
+                if data.get('estimated_fare') is None:
+                    extra_fields['estimated_fare'] = int(estimate['amount'])
+
+        ride = serializer.save(**extra_fields)
+        SurgePricingModule.record_ride_request(ride)
 
     @action(detail=False, methods=['post'])
     def cost_of_ride(self, request):
@@ -1287,6 +1631,7 @@ class RideViewSet(viewsets.ModelViewSet):
         ride.status = 'ACCEPTED'
         ride.accepted_at = datetime.now(timezone.utc)
         ride.save()
+        NotificationModule.ride_status_changed(ride, request.user)
         
         # Update driver availability to BUSY
         driver_availability.status = 'BUSY'
@@ -1317,6 +1662,7 @@ class RideViewSet(viewsets.ModelViewSet):
         ride.status = 'IN_PROGRESS'
         ride.started_at = datetime.now(timezone.utc)
         ride.save()
+        NotificationModule.ride_status_changed(ride, request.user)
         
         serializer = self.get_serializer(ride)
         return Response(serializer.data)
@@ -1342,6 +1688,7 @@ class RideViewSet(viewsets.ModelViewSet):
         
         ride.status = 'DRIVER_ARRIVED'
         ride.save()
+        NotificationModule.ride_status_changed(ride, request.user)
         
         serializer = self.get_serializer(ride)
         return Response(serializer.data)
@@ -1368,20 +1715,66 @@ class RideViewSet(viewsets.ModelViewSet):
         # Update fare if provided
         fare = request.data.get('fare')
         if fare is not None:
+            try:
+                fare = int(fare)
+            except (TypeError, ValueError):
+                fare = -1
+            if fare < 0:
+                return Response(
+                    {"detail": "fare must be a non-negative whole number"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             ride.fare = fare
         
         ride.status = 'COMPLETED'
         ride.completed_at = datetime.now(timezone.utc)
         ride.save()
+        NotificationModule.ride_status_changed(ride, request.user)
         
         # Update driver availability back to AVAILABLE
         driver_availability = DriverAvailability.objects.filter(driver=ride.driver).first()
         if driver_availability:
             driver_availability.status = 'AVAILABLE'
             driver_availability.save()
+
+        # Charge the customer's saved card, if any; the customer can retry with charge_card
+        payment = None
+        if CardAuthorizationModule.CHARGE_ON_COMPLETE:
+            try:
+                payment = CardAuthorizationModule.charge_ride(ride)
+            except CardChargeError:
+                pass
+        
+        # Move the fare from the customer's wallet to the driver and platform
+        settled = SettlementModule.settle_ride(ride)
         
         serializer = self.get_serializer(ride)
-        return Response(serializer.data)
+        data = dict(serializer.data)
+        data['payment_status'] = payment.status if payment else None
+        data['settled'] = settled
+        return Response(data)
+
+    @action(detail=True, methods=['post'])
+    def charge_card(self, request, pk=None):
+        """Pay a completed ride with the customer's saved card"""
+        ride = self.get_object()
+        if ride.customer != request.user:
+            return Response(
+                {"detail": "Only the customer can pay for the ride"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        if ride.status != 'COMPLETED':
+            return Response(
+                {"detail": "Only completed rides can be charged"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            payment = CardAuthorizationModule.charge_ride(ride)
+        except CardChargeError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
+        if payment is None:
+            return Response({"detail": "No saved card to charge"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(PaymentTransactionSerializer(payment).data)
 
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
@@ -1410,6 +1803,7 @@ class RideViewSet(viewsets.ModelViewSet):
         ride.cancel_reason = cancel_reason
         ride.cancelled_at = datetime.now(timezone.utc)
         ride.save()
+        NotificationModule.ride_status_changed(ride, request.user)
         
         # If driver cancelled, update their availability
         if ride.driver and ride.driver == user:
@@ -1447,6 +1841,11 @@ class RideViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(rides, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream ride history as CSV or NDJSON"""
+        return export_history(request, 'rides')
+
     @action(detail=False, methods=['get'])
     def active_ride(self, request):
         """Get current user's active ride (if any)"""
@@ -1497,17 +1896,27 @@ def payment_webhook(request):
     if event == 'charge.success':        
         reference = data.get('data').get('reference')
         payment = PaymentProcessingModule.verifyPayment(reference)
-        if payment.get('status') == 'success':            
+        if (payment.get('data') or {}).get('status') == 'success':            
             transaction = PaymentTransaction.objects.filter(transaction_reference=reference).first()
             if transaction:
-                transaction.status = 'SUCCESS'
-                transaction.save()
-                wallet = Wallet.objects.get(user=transaction.user)
-                wallet.active_balance += transaction.amount
-                wallet.save()
+                # Top-ups and ride charges Paystack first reported as pending;
+                # retries and payments already verified are not credited again
+                CardAuthorizationModule.complete_charge(transaction)
+                # Keeping the card must not stop the payment from being acknowledged
+                try:
+                    CardAuthorizationModule.capture(transaction.user_id, payment.get('data'))
+                except (DatabaseError, AttributeError):
+                    logger.exception("Could not store the card authorization for payment %s", reference)
                 return Response({'detail': 'Payment received'}, status=status.HTTP_200_OK)
         else:
             return Response({'detail': 'Payment failed'}, status=status.HTTP_400_BAD_REQUEST)
+    elif event in PayoutModule.TRANSFER_EVENTS:
+        transfer = data.get('data') or {}
+        # Acknowledged even when nothing changed so Paystack stops retrying
+        PayoutModule.settle_transfer(
+            transfer.get('reference'), event == 'transfer.success', transfer.get('transfer_code')
+        )
+        return Response({'detail': 'Transfer updated'}, status=status.HTTP_200_OK)
     return Response({'detail': 'Invalid event'}, status=status.HTTP_400_BAD_REQUEST)
 
 
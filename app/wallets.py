@@ -0,0 +1,97 @@
+import os
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Wallet
+
+
+class WalletModule:
+    """
+    One wallet per user. Balances are read through a per-user cache entry
+    holding the serialized wallet; every balance change goes through
+    ``adjust`` (or calls ``invalidate`` for set-based updates), which drops
+    the entry once the change commits.
+    """
+
+    BALANCE_KEY = 'wallet:balance:{}'
+    BALANCE_TTL = int(os.getenv('WALLET_BALANCE_TTL', '300'))
+
+    @staticmethod
+    def for_user(user_id):
+        wallet = Wallet.objects.filter(user_id=user_id).first()
+        if wallet:
+            return wallet
+        try:
+            with transaction.atomic():
+                return Wallet.objects.create(user_id=user_id)
+        except IntegrityError:
+            # Created concurrently by another request
+            return Wallet.objects.get(user_id=user_id)
+
+    @classmethod
+    def balance(cls, user_id):
+        """``{id, user_id, active_balance, transactional_balance}``, from the cache when possible."""
+        key = cls.BALANCE_KEY.format(user_id)
+        cached = cache.get(key)
+        if cached is None:
+            wallet = cls.for_user(user_id)
+            cached = {
+                'id': wallet.id,
+                'user_id': wallet.user_id,
+                'active_balance': wallet.active_balance,
+                'transactional_balance': wallet.transactional_balance,
+            }
+            cache.set(key, cached, cls.BALANCE_TTL)
+        return cached
+
+    @classmethod
+    def invalidate(cls, *user_ids):
+        keys = [cls.BALANCE_KEY.format(user_id) for user_id in user_ids]
+        if keys:
+            transaction.on_commit(lambda: cache.delete_many(keys))
+
+    @classmethod
+    def adjust(cls, user_id, active=0, transactional=0, require_funds=False):
+        """
+        Add the given amounts to the user's balances in one conditional
+        update. With ``require_funds`` the update only applies if neither
+        balance would drop below zero. Returns whether it applied.
+        """
+        wallets = Wallet.objects.filter(user_id=user_id)
+        if require_funds:
+            if active < 0:
+                wallets = wallets.filter(active_balance__gte=-active)
+            if transactional < 0:
+                wallets = wallets.filter(transactional_balance__gte=-transactional)
+        updated = wallets.update(
+            active_balance=F('active_balance') + active,
+            transactional_balance=F('transactional_balance') + transactional,
+            updated_at=timezone.now(),
+        )
+        if updated:
+            cls.invalidate(user_id)
+        return bool(updated)
+
+    @classmethod
+    def credit(cls, user_id, amount):
+        cls.for_user(user_id)
+        return cls.adjust(user_id, active=amount)
+
+    @classmethod
+    def debit(cls, user_id, amount):
+        return cls.adjust(user_id, active=-amount, require_funds=True)
+
+    @classmethod
+    def hold(cls, user_id, amount):
+        """Move ``amount`` from the active to the transactional balance if it is available."""
+        return cls.adjust(user_id, active=-amount, transactional=amount, require_funds=True)
+
+    @classmethod
+    def release(cls, from_user_id, to_user_id, amount):
+        """Pay a held amount out to another user's active balance."""
+        with transaction.atomic():
+            if not cls.adjust(from_user_id, transactional=-amount, require_funds=True):
+                return False
+            cls.credit(to_user_id, amount)
+        return True